@@ -0,0 +1,140 @@
+"""
+Token-budgeted prompt context: history is filled from the newest turn
+backwards until CONTEXT_TOKEN_BUDGET, shared with the system instruction and
+the new message, is used up. Turns longer than CONTEXT_TURN_MAX_TOKENS are
+cut down to their beginning and end.
+
+Tokens are estimated locally, Gemini's tokenizer is not shipped with the SDK
+and a count_tokens call per turn would cost a round trip. The estimate
+follows how SentencePiece splits text (short words are one piece, digits and
+non-Latin characters one each) and errs on the high side.
+"""
+import os
+import re
+from functools import lru_cache
+from itertools import islice
+from string import ascii_letters
+from typing import NamedTuple, Sequence
+
+from dotenv import load_dotenv
+
+from app.core.context_cache import CONTEXT_CACHE_TURNS
+
+load_dotenv(verbose=True)
+
+# Estimated input tokens per request: system instruction, history and message
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 6000))
+# A single history turn never takes more than this
+CONTEXT_TURN_MAX_TOKENS = int(os.getenv("CONTEXT_TURN_MAX_TOKENS", 500))
+# Upper bound on turns considered, above CONTEXT_CACHE_TURNS prompts skip the context cache
+CONTEXT_MAX_TURNS = int(os.getenv("CONTEXT_MAX_TURNS") or CONTEXT_CACHE_TURNS)
+
+# One match per token: Latin letters in runs of up to 6 (short words are one
+# token, longer ones one more per 6 letters), otherwise every character that
+# is not whitespace, so digits, punctuation and non-Latin scripts one each
+_TOKENS = re.compile(r"[A-Za-z]{1,6}|[^A-Za-z_\s]")
+# Typical characters per token, whitespace included
+_CHARS_PER_TOKEN = 6
+TRUNCATION_MARK = " [...] "
+# Role and turn delimiters Gemini adds around every content entry
+TURN_OVERHEAD_TOKENS = 4
+
+
+def count_tokens(text: str) -> int:
+    return len(_TOKENS.findall(text))
+
+
+@lru_cache(maxsize=256)
+def count_tokens_cached(text: str) -> int:
+    # For the system instruction, the same few strings on every request
+    return count_tokens(text)
+
+
+def _mid_word(text: str, index: int) -> bool:
+    return 0 < index < len(text) and text[index - 1] in ascii_letters and text[index] in ascii_letters
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Keeps the first two thirds and the last third of `max_tokens`, the
+    opening usually states the problem and the ending the question. Returns
+    `text` itself when it fits. Only the kept ends are scanned.
+    """
+    head_budget = max_tokens * 2 // 3
+    tail_budget = max_tokens - head_budget
+
+    tokens = _TOKENS.finditer(text)
+    head = list(islice(tokens, head_budget))
+    if next(islice(tokens, tail_budget, None), None) is None:
+        return text
+
+    # Cut between words, not inside one
+    while head and _mid_word(text, head[-1].end()):
+        head.pop()
+    head_end = head[-1].end() if head else 0
+
+    # Scan back from the end in growing windows until the tail budget is covered
+    width, tail = tail_budget * _CHARS_PER_TOKEN, []
+    while tail_budget:
+        window_start = max(len(text) - width, head_end)
+        tail = list(_TOKENS.finditer(text, window_start))
+        if len(tail) > tail_budget or window_start == head_end:
+            tail = tail[-tail_budget:]
+            break
+        width *= 2
+    while tail and _mid_word(text, tail[0].start()):
+        tail.pop(0)
+    tail_start = tail[0].start() if tail else len(text)
+
+    return text[:head_end].rstrip() + TRUNCATION_MARK + text[tail_start:].lstrip()
+
+
+class ContextWindow(NamedTuple):
+    contents: list
+    # History turns included and how many of them were cut
+    turns: int
+    truncated: int
+    system_tokens: int
+    history_tokens: int
+    message_tokens: int
+
+    @property
+    def total_tokens(self) -> int:
+        return self.system_tokens + self.history_tokens + self.message_tokens
+
+
+def build_context(history: Sequence, system_content: str, user_message: str,
+                  budget: int = CONTEXT_TOKEN_BUDGET, turn_max: int = CONTEXT_TURN_MAX_TOKENS) -> ContextWindow:
+    """
+    Gemini `contents` for `history` (objects with `sender` and `content`,
+    oldest first) plus the new message, within `budget` estimated tokens.
+    History gets what the system instruction and the message leave over;
+    the message itself is only cut when it alone would not fit.
+    """
+    system_tokens = count_tokens_cached(system_content)
+
+    user_message = truncate_to_tokens(user_message, max(budget - system_tokens, turn_max) - TURN_OVERHEAD_TOKENS)
+    message_tokens = count_tokens(user_message) + TURN_OVERHEAD_TOKENS
+
+    remaining = budget - system_tokens - message_tokens
+    selected, history_tokens, truncated = [], 0, 0
+    for m in reversed(history):
+        # Scans no further than turn_max pieces, however long the turn
+        text = truncate_to_tokens(m.content, turn_max)
+        cut = text is not m.content
+        tokens = count_tokens(text) + TURN_OVERHEAD_TOKENS
+        # Stop at the first turn that does not fit, skipping it would leave a gap
+        if tokens > remaining:
+            break
+        truncated += cut
+        remaining -= tokens
+        history_tokens += tokens
+        selected.append({
+            "role": "user" if m.sender == "user" else "model",
+            "parts": [{"text": text}]
+        })
+
+    selected.reverse()
+    selected.append({"role": "user", "parts": [{"text": user_message}]})
+
+    return ContextWindow(selected, len(selected) - 1, truncated, system_tokens, history_tokens, message_tokens)
@@ -0,0 +1,99 @@
+import os
+import time
+from collections import OrderedDict, deque
+from typing import NamedTuple
+
+from dotenv import load_dotenv
+
+load_dotenv(verbose=True)
+
+# Turns kept per user, should cover the context window used for prompts
+CONTEXT_CACHE_TURNS = int(os.getenv("CONTEXT_CACHE_TURNS", 20))
+CONTEXT_CACHE_MAX_USERS = int(os.getenv("CONTEXT_CACHE_MAX_USERS", 10000))
+CONTEXT_CACHE_TTL = float(os.getenv("CONTEXT_CACHE_TTL", 1800))
+
+# With several workers another process may have written turns this one has
+# not seen, so hits are checked against the newest id in the DB first
+CONTEXT_CACHE_VERIFY = (
+    os.getenv("CONTEXT_CACHE_VERIFY") or ("1" if int(os.getenv("WEB_CONCURRENCY", 1)) > 1 else "0")
+) == "1"
+
+
+class ContextTurn(NamedTuple):
+    id: int
+    sender: str
+    content: str
+
+
+class _Entry:
+    __slots__ = ("turns", "expires_at")
+
+    def __init__(self, turns: deque, expires_at: float):
+        self.turns = turns
+        self.expires_at = expires_at
+
+    @property
+    def last_id(self) -> int | None:
+        return self.turns[-1].id if self.turns else None
+
+
+class ContextCache:
+    """
+    In-process LRU of per-user ring buffers holding the most recent turns.
+    It is filled from the DB on a miss and appended to whenever a message is
+    written, so building the next prompt needs no DB read. An entry only
+    exists while it mirrors the complete tail of the user's history.
+    """
+
+    def __init__(self, turns: int, max_users: int, ttl: float):
+        self.turns = turns
+        self.max_users = max_users
+        self.ttl = ttl
+        self._users: OrderedDict[int, _Entry] = OrderedDict()
+
+    def get(self, user_id: int) -> _Entry | None:
+        entry = self._users.get(user_id)
+        if entry is None:
+            return None
+
+        if entry.expires_at < time.monotonic():
+            del self._users[user_id]
+            return None
+
+        self._users.move_to_end(user_id)
+        return entry
+
+    def fill(self, user_id: int, messages):
+        """
+        Replaces the user's entry with `messages`, the newest turns in id order.
+        """
+        turns = deque(
+            (ContextTurn(m.id, m.sender, m.content) for m in messages),
+            maxlen=self.turns
+        )
+        self._users[user_id] = _Entry(turns, time.monotonic() + self.ttl)
+        self._users.move_to_end(user_id)
+
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    def append(self, user_id: int, messages):
+        entry = self._users.get(user_id)
+        if entry is None:
+            # Nothing cached, the next read loads the full tail from the DB
+            return
+
+        for m in messages:
+            if entry.last_id is not None and m.id <= entry.last_id:
+                # Out-of-order write (concurrent turns), the buffer can't be trusted
+                self.invalidate(user_id)
+                return
+            entry.turns.append(ContextTurn(m.id, m.sender, m.content))
+
+        entry.expires_at = time.monotonic() + self.ttl
+
+    def invalidate(self, user_id: int):
+        self._users.pop(user_id, None)
+
+
+context_cache = ContextCache(CONTEXT_CACHE_TURNS, CONTEXT_CACHE_MAX_USERS, CONTEXT_CACHE_TTL)
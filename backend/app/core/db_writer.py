@@ -0,0 +1,165 @@
+import os
+import asyncio
+import logging
+import traceback
+from typing import Awaitable, Callable, NamedTuple
+
+from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.metrics import DB_WRITE_BATCH
+from config.database import DATABASE_URL, db_session
+
+load_dotenv(verbose=True)
+
+# SQLite allows one writer at a time, so concurrent commits just queue on the
+# file lock. With the queue on, one task performs every write and commits up
+# to SQLITE_WRITE_BATCH of them together. Other databases write inline.
+SQLITE_WRITE_QUEUE = os.getenv("SQLITE_WRITE_QUEUE", "1") == "1" and "sqlite" in DATABASE_URL
+SQLITE_WRITE_BATCH = int(os.getenv("SQLITE_WRITE_BATCH", 64))
+
+WriteJob = Callable[[AsyncSession], Awaitable]
+# Inserts `rows` and returns one result per row, in order
+RowInsert = Callable[[AsyncSession, list], Awaitable[list]]
+
+
+class _Write(NamedTuple):
+    job: WriteJob | RowInsert
+    # Set for write_rows(), whose rows are merged with other callers' rows
+    rows: list | None
+
+
+class DBWriter:
+    """
+    Single-writer queue with group commit. write() takes an async function
+    doing its writes on the session it is given, without committing, and
+    returns its result once the transaction holding it has committed.
+    write_rows() does the same for a row insert; rows queued for the same
+    insert function are merged into one insert call per batch.
+
+    Writes of a batch share one transaction. If that fails it is rolled back
+    and each write is retried in a transaction of its own, so one bad write
+    does not fail its neighbours.
+    """
+
+    def __init__(self, max_batch: int):
+        self.max_batch = max_batch
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self.writes = 0
+        self.batches = 0
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._worker())
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def write(self, job: WriteJob):
+        return await self._submit(_Write(job, None))
+
+    async def write_rows(self, insert: RowInsert, rows: list) -> list:
+        return await self._submit(_Write(insert, rows))
+
+    async def _submit(self, write: _Write):
+        if not self.running:
+            return (await self._run([write]))[0]
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((write, future))
+        return await future
+
+    @staticmethod
+    async def _run(writes: list[_Write]) -> list:
+        results = [None] * len(writes)
+        merged: dict[RowInsert, list[int]] = {}
+        for i, write in enumerate(writes):
+            if write.rows is not None:
+                merged.setdefault(write.job, []).append(i)
+
+        async with db_session() as db:
+            for insert, indexes in merged.items():
+                stored = await insert(db, [row for i in indexes for row in writes[i].rows])
+                offset = 0
+                for i in indexes:
+                    count = len(writes[i].rows)
+                    results[i] = stored[offset:offset + count]
+                    offset += count
+
+            for i, write in enumerate(writes):
+                if write.rows is None:
+                    results[i] = await write.job(db)
+            await db.commit()
+        return results
+
+    async def _worker(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            DB_WRITE_BATCH.observe(len(batch))
+            self.batches += 1
+            self.writes += len(batch)
+
+            try:
+                try:
+                    results = await self._run([write for write, _ in batch])
+                except Exception:
+                    if len(batch) == 1:
+                        raise
+                    logging.error(traceback.format_exc())
+                    logging.error(f"Write batch of {len(batch)} failed, retrying one by one")
+                    await self._retry_each(batch)
+                else:
+                    for (_, future), result in zip(batch, results):
+                        _resolve(future, result)
+            except Exception as e:
+                _resolve(batch[0][1], exception=e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _retry_each(self, batch: list):
+        for write, future in batch:
+            try:
+                [result] = await self._run([write])
+            except Exception as e:
+                _resolve(future, exception=e)
+            else:
+                _resolve(future, result)
+
+    async def close(self):
+        """
+        Commits the queued writes, then stops the writer.
+        """
+        if not self._task:
+            return
+
+        await self._queue.join()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.running,
+            "writes": self.writes,
+            "batches": self.batches,
+            "avg_batch": round(self.writes / self.batches, 2) if self.batches else 0.0
+        }
+
+
+def _resolve(future: asyncio.Future, result=None, exception: Exception | None = None):
+    # The caller may have been cancelled (client went away) while queued
+    if future.done():
+        return
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+
+
+db_writer = DBWriter(SQLITE_WRITE_BATCH)
@@ -0,0 +1,85 @@
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple
+
+from dotenv import load_dotenv
+
+load_dotenv(verbose=True)
+
+HISTORY_INDEX_MAX_USERS = int(os.getenv("HISTORY_INDEX_MAX_USERS", 100000))
+
+# As with the context cache, other workers write messages this one never
+# sees, so with several workers the newest id is read from the DB instead
+HISTORY_INDEX_VERIFY = (
+    os.getenv("HISTORY_INDEX_VERIFY") or ("1" if int(os.getenv("WEB_CONCURRENCY") or 1) > 1 else "0")
+) == "1"
+
+
+class LatestMessage(NamedTuple):
+    id: int
+    created_at: datetime | None
+
+
+class LatestMessageIndex:
+    """
+    In-process LRU of each user's newest message id and time, updated on
+    every write, so /chat/history can answer a conditional poll with 304
+    without touching the DB. Messages are never edited or deleted (archival
+    keeps them readable), so the newest id identifies a user's history.
+    """
+
+    def __init__(self, max_users: int):
+        self.max_users = max_users
+        self._users: OrderedDict[int, LatestMessage] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, user_id: int) -> LatestMessage | None:
+        latest = self._users.get(user_id)
+        if latest is None:
+            self.misses += 1
+            return None
+
+        self._users.move_to_end(user_id)
+        self.hits += 1
+        return latest
+
+    def peek(self, user_id: int) -> LatestMessage | None:
+        # Internal reads, not counted as poll hits and not refreshing the LRU order
+        return self._users.get(user_id)
+
+    def set(self, user_id: int, latest: LatestMessage | None):
+        if latest is None:
+            self._users.pop(user_id, None)
+            return
+
+        current = self._users.get(user_id)
+        # Concurrent turns may report their writes out of order
+        if current is None or latest.id >= current.id:
+            self._users[user_id] = latest
+        self._users.move_to_end(user_id)
+
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    def note(self, user_id: int, messages):
+        """
+        Records stored messages (anything with id and created_at), once committed.
+        """
+        if messages:
+            newest = max(messages, key=lambda m: m.id)
+            self.set(user_id, LatestMessage(newest.id, newest.created_at))
+
+    def stats(self) -> dict:
+        return {
+            "verify": HISTORY_INDEX_VERIFY,
+            "users": len(self._users),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified
+        }
+
+
+history_index = LatestMessageIndex(HISTORY_INDEX_MAX_USERS)
@@ -0,0 +1,123 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv(verbose=True)
+
+# Seconds a finished turn is still handed to resubmissions with its
+# Idempotency-Key, 0 disables coalescing
+CHAT_COALESCE_WINDOW = float(os.getenv("CHAT_COALESCE_WINDOW", 30))
+CHAT_COALESCE_MAX_KEYS = int(os.getenv("CHAT_COALESCE_MAX_KEYS", 10000))
+
+
+def turn_key(user_message: str, idempotency_key: str | None) -> str:
+    # Without a client key, the same text counts as the same turn only while
+    # the first is still queued or running (a double tap)
+    return f"key:{idempotency_key}" if idempotency_key else f"text:{user_message.strip()}"
+
+
+def _remembered(key: str) -> bool:
+    # A user may well say "ok" twice, only a client key proves a resubmission
+    return key.startswith("key:")
+
+
+class InFlightTurns:
+    """
+    Per-user chat turn tracking within this process. Turns of one user run
+    one at a time in arrival order, so each prompt sees the previous reply
+    and history never interleaves. A resubmission of a turn (same key) that
+    is queued or running, or finished within the window when the key came
+    from the client, is not run again, it waits for and returns the
+    original's result.
+
+    Workers do not share this, duplicates landing on different workers are
+    only serialised by the frontend reusing its key.
+    """
+
+    def __init__(self, window: float, max_keys: int):
+        self.window = window
+        self.max_keys = max_keys
+        self._running: dict[tuple, asyncio.Future] = {}
+        self._finished: OrderedDict[tuple, tuple] = OrderedDict()
+        # user_id -> [lock, turns holding or waiting for it]
+        self._locks: dict[int, list] = {}
+        self.turns = 0
+        self.coalesced = 0
+        self.queued = 0
+
+    def lookup(self, user_id: int, key: str) -> asyncio.Future | None:
+        """
+        The future of an earlier submission of this turn, resolving to its
+        result, or None if the turn has to run.
+        """
+        if self.window <= 0:
+            return None
+
+        future = self._running.get((user_id, key))
+        if future is None:
+            entry = self._finished.get((user_id, key))
+            if entry is not None and entry[1] >= time.monotonic():
+                future = entry[0]
+        if future is not None:
+            self.coalesced += 1
+        return future
+
+    def _remember(self, user_id: int, key: str, future: asyncio.Future):
+        now = time.monotonic()
+        self._finished[(user_id, key)] = (future, now + self.window)
+        self._finished.move_to_end((user_id, key))
+        # Entries expire in insertion order
+        while self._finished and (len(self._finished) > self.max_keys or next(iter(self._finished.values()))[1] < now):
+            self._finished.popitem(last=False)
+
+    @asynccontextmanager
+    async def turn(self, user_id: int, key: str):
+        """
+        Runs the body once the user's earlier turns are done. The body sets
+        the yielded future's result; a turn that ends without one (an error,
+        a dropped stream) resolves it to None for the duplicates already
+        waiting, which report the failure, and is not remembered, so a later
+        resubmission runs it again.
+        """
+        self.turns += 1
+        future = asyncio.get_running_loop().create_future()
+        if self.window > 0:
+            self._running[(user_id, key)] = future
+
+        entry = self._locks.setdefault(user_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        if entry[0].locked():
+            self.queued += 1
+        try:
+            # asyncio.Lock wakes waiters in FIFO order
+            async with entry[0]:
+                yield future
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[user_id]
+
+            if self._running.get((user_id, key)) is future:
+                del self._running[(user_id, key)]
+            if not future.done():
+                future.set_result(None)
+            elif future.result() is not None and self.window > 0 and _remembered(key):
+                self._remember(user_id, key, future)
+
+    def stats(self) -> dict:
+        return {
+            "window": self.window,
+            "turns": self.turns,
+            "coalesced": self.coalesced,
+            "queued": self.queued,
+            "in_flight": len(self._running),
+            "users_active": len(self._locks),
+            "remembered": len(self._finished)
+        }
+
+
+inflight_turns = InFlightTurns(CHAT_COALESCE_WINDOW, CHAT_COALESCE_MAX_KEYS)
@@ -0,0 +1,384 @@
+"""
+Every Gemini call goes through the gateway, which classifies failures into
+typed errors, retries the transient ones with jittered exponential backoff,
+paces calls to the quota with a token bucket, optionally hedges slow calls
+and stops calling Gemini for a while once it keeps failing (circuit breaker),
+so requests fail fast instead of each waiting for its own failed call.
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+import contextlib
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable
+
+import httpx
+from dotenv import load_dotenv
+from google.genai import errors as genai_errors
+
+load_dotenv(verbose=True)
+
+# Attempts after the first for rate-limited, overloaded or timed-out calls
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", 2))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 0.5))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", 8))
+# Seconds per attempt (a stream's attempt ends at its first chunk)
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))
+# Longest a stream may go quiet between two chunks before it is abandoned
+LLM_STREAM_IDLE_TIMEOUT = float(os.getenv("LLM_STREAM_IDLE_TIMEOUT") or LLM_TIMEOUT)
+
+# Project quota in requests per minute, shared evenly by the worker processes, 0 disables
+LLM_QUOTA_RPM = float(os.getenv("LLM_QUOTA_RPM", 0))
+LLM_RATE_BURST = int(os.getenv("LLM_RATE_BURST", 10))
+# Longest a call queues for the quota before it is shed as rate limited
+LLM_RATE_MAX_WAIT = float(os.getenv("LLM_RATE_MAX_WAIT", 5))
+
+# A second identical call is sent when the first has not answered after
+# this many seconds (about the p95 latency), the first answer wins. 0 disables
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", 0))
+
+# The circuit opens when at least LLM_BREAKER_FAILURE_RATE of the attempts
+# in the last LLM_BREAKER_WINDOW seconds failed, counting once there were
+# LLM_BREAKER_MIN_CALLS of them, and stays open LLM_BREAKER_COOLDOWN seconds
+LLM_BREAKER_WINDOW = float(os.getenv("LLM_BREAKER_WINDOW", 10))
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", 10))
+LLM_BREAKER_FAILURE_RATE = float(os.getenv("LLM_BREAKER_FAILURE_RATE", 0.5))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", 30))
+
+
+class LLMError(Exception):
+    """
+    A failed LLM call. `user_message` is what the chat shows instead of a reply.
+    """
+    retryable = False
+    user_message = "I apologize, but I'm having trouble processing your request right now. Please try again in a moment."
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMRateLimited(LLMError):
+    # 429 / RESOURCE_EXHAUSTED
+    retryable = True
+    user_message = "Too many requests. Please try again in a moment."
+
+
+class LLMShed(LLMRateLimited):
+    # Refused by the local rate limiter, Gemini never saw the call
+    retryable = False
+
+
+class LLMUnavailable(LLMError):
+    # 5xx, timeouts and connection failures
+    retryable = True
+
+
+class LLMTimeout(LLMUnavailable):
+    # No answer, or a stream silent between chunks, for too long
+    pass
+
+
+class LLMRejected(LLMError):
+    # Other 4xx: bad request, API key or model, retrying cannot help
+    user_message = "Technical error. Please try again in a moment."
+
+
+class LLMBlocked(LLMError):
+    # The prompt or reply tripped Gemini's safety filters
+    user_message = "I cannot answer that as it flagged my safety guidelines. Let's try asking something else."
+
+
+class LLMCircuitOpen(LLMError):
+    pass
+
+
+def _retry_after(e: genai_errors.APIError) -> float | None:
+    response = getattr(e, "response", None)
+    header = response.headers.get("retry-after") if isinstance(response, httpx.Response) else None
+    if header:
+        try:
+            return float(header)
+        except ValueError:
+            pass
+
+    # Gemini's 429s carry a google.rpc.RetryInfo detail such as {"retryDelay": "23s"}
+    details = e.details.get("error", {}).get("details", []) if isinstance(e.details, dict) else []
+    for detail in details:
+        delay = detail.get("retryDelay") if isinstance(detail, dict) else None
+        if isinstance(delay, str) and delay.endswith("s"):
+            try:
+                return float(delay[:-1])
+            except ValueError:
+                pass
+    return None
+
+
+def classify(e: BaseException) -> LLMError:
+    """
+    The typed error for an exception raised by a Gemini call.
+    """
+    if isinstance(e, LLMError):
+        return e
+    if isinstance(e, genai_errors.APIError):
+        if e.code == 429:
+            return LLMRateLimited(str(e), _retry_after(e))
+        if e.code in (408, 409) or (e.code or 0) >= 500:
+            return LLMUnavailable(str(e), _retry_after(e))
+        return LLMRejected(str(e))
+    if isinstance(e, (asyncio.TimeoutError, httpx.TimeoutException)):
+        return LLMTimeout(f"{type(e).__name__}: {e}")
+    if isinstance(e, httpx.TransportError):
+        return LLMUnavailable(f"{type(e).__name__}: {e}")
+    if "safety" in str(e).lower() or "blocked" in str(e).lower():
+        return LLMBlocked(f"{type(e).__name__}: {e}")
+    return LLMError(f"{type(e).__name__}: {e}")
+
+
+class TokenBucket:
+    """
+    Paces calls to `rate` per second with bursts of up to `burst`. Callers
+    reserve a token and sleep until it is due, so they are served in order;
+    one whose token is further away than `max_wait` is refused right away.
+    """
+
+    def __init__(self, rate: float, burst: int, max_wait: float):
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self) -> bool:
+        self._refill()
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    async def take(self):
+        self._refill()
+        wait = max(0.0, (1 - self._tokens) / self.rate)
+        if wait > self.max_wait:
+            raise LLMShed(f"Over the local rate limit, next slot in {wait:.1f}s", retry_after=wait)
+        self._tokens -= 1
+        if wait:
+            await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Closed while most calls succeed. Once the share of failed attempts over
+    a sliding window reaches `failure_rate` it opens and every call fails
+    fast for `cooldown` seconds (or as long as Gemini asked to back off).
+    Then one probe call is let through: its success closes the circuit, its
+    failure opens it again. A rate rather than a run of failures, since
+    concurrent calls return their failures together.
+    """
+
+    def __init__(self, window: float, min_calls: int, failure_rate: float, cooldown: float):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.cooldown = cooldown
+        self.state = "closed"
+        # (time, failed) per finished attempt within the window
+        self._outcomes: deque[tuple[float, bool]] = deque()
+        self._failures = 0
+        self._open_until = 0.0
+        self._probing = False
+        self.opened = 0
+
+    def is_open(self) -> bool:
+        return self.state == "open" and time.monotonic() < self._open_until
+
+    def admit(self):
+        if self.state == "closed":
+            return
+        if self.state == "open" and time.monotonic() >= self._open_until:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return
+        raise LLMCircuitOpen("Gemini is failing, not calling it for now")
+
+    def _record(self, failed: bool):
+        now = time.monotonic()
+        self._outcomes.append((now, failed))
+        self._failures += failed
+        while self._outcomes[0][0] < now - self.window:
+            self._failures -= self._outcomes.popleft()[1]
+
+    def record_success(self):
+        self._record(False)
+        self._probing = False
+        if self.state != "closed":
+            logging.warning("LLM circuit closed")
+            self._outcomes.clear()
+            self._failures = 0
+        self.state = "closed"
+
+    def record_failure(self, error: LLMError):
+        self._record(True)
+        tripped = len(self._outcomes) >= self.min_calls and self._failures >= self.failure_rate * len(self._outcomes)
+        if self.state == "half_open" or (self.state == "closed" and tripped):
+            if self.state == "closed":
+                self.opened += 1
+                logging.warning(f"LLM circuit open, {self._failures}/{len(self._outcomes)} recent calls failed: {error}")
+            self.state = "open"
+            self._probing = False
+            self._open_until = time.monotonic() + max(self.cooldown, error.retry_after or 0)
+
+    def release_probe(self):
+        # A probe that ended without an answer either way (cancelled, rejected)
+        self._probing = False
+
+
+class LLMGateway:
+    def __init__(self, retries: int = LLM_RETRIES, backoff_base: float = LLM_BACKOFF_BASE,
+                 backoff_max: float = LLM_BACKOFF_MAX, timeout: float = LLM_TIMEOUT,
+                 stream_idle_timeout: float = LLM_STREAM_IDLE_TIMEOUT,
+                 quota_rpm: float = LLM_QUOTA_RPM, workers: int = 1, burst: int = LLM_RATE_BURST,
+                 max_wait: float = LLM_RATE_MAX_WAIT, hedge_after: float = LLM_HEDGE_AFTER,
+                 breaker_window: float = LLM_BREAKER_WINDOW, breaker_min_calls: int = LLM_BREAKER_MIN_CALLS,
+                 breaker_failure_rate: float = LLM_BREAKER_FAILURE_RATE, breaker_cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.stream_idle_timeout = stream_idle_timeout
+        self.hedge_after = hedge_after
+        self.bucket = TokenBucket(quota_rpm / 60 / workers, burst, max_wait) if quota_rpm > 0 else None
+        self.breaker = CircuitBreaker(breaker_window, breaker_min_calls, breaker_failure_rate, breaker_cooldown)
+        self.calls = 0
+        self.attempts = 0
+        self.retried = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failed = 0
+        self.fast_failed = 0
+        self.shed = 0
+        self.stalled = 0
+
+    def admit(self):
+        """
+        Raises LLMCircuitOpen while the circuit is open, before any work is
+        done for a call that would fail anyway.
+        """
+        if self.breaker.is_open():
+            self.fast_failed += 1
+            raise LLMCircuitOpen("Gemini is failing, not calling it for now")
+
+    def backoff(self, attempt: int, error: LLMError) -> float:
+        # Full jitter: concurrent callers spread out instead of retrying in lockstep
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return max(delay, min(error.retry_after or 0, self.backoff_max))
+
+    async def call(self, attempt: Callable[[], Awaitable], hedge: bool = False):
+        """
+        Runs `attempt` (one Gemini call) until it succeeds, retrying transient
+        failures. Raises an LLMError when it gives up. With `hedge` the
+        attempt may run twice at once, so it must be safe to repeat.
+        """
+        self.calls += 1
+        for n in range(self.retries + 1):
+            try:
+                self.breaker.admit()
+            except LLMCircuitOpen:
+                self.fast_failed += 1
+                raise
+            try:
+                if self.bucket:
+                    await self.bucket.take()
+                self.attempts += 1
+                if hedge and self.hedge_after > 0:
+                    result = await self._hedged(attempt)
+                else:
+                    result = await asyncio.wait_for(attempt(), self.timeout)
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                error = classify(e)
+                if isinstance(error, LLMShed):
+                    self.shed += 1
+                if error.retryable:
+                    self.breaker.record_failure(error)
+                else:
+                    self.breaker.release_probe()
+                if not error.retryable or n == self.retries or self.breaker.state == "open":
+                    self.failed += 1
+                    raise error from e
+                self.retried += 1
+                await asyncio.sleep(self.backoff(n, error))
+                continue
+
+            self.breaker.record_success()
+            return result
+
+    async def next_chunk(self, stream: AsyncIterator):
+        """
+        The stream's next chunk, or None at its end. A stream that stays
+        silent for `stream_idle_timeout` is closed, counts as a failed call on
+        the circuit breaker and raises LLMTimeout; the text already received
+        stands.
+        """
+        try:
+            return await asyncio.wait_for(anext(stream, None), self.stream_idle_timeout)
+        except asyncio.TimeoutError as e:
+            with contextlib.suppress(Exception):
+                await stream.aclose()
+            error = LLMTimeout(f"Stream silent for {self.stream_idle_timeout}s, abandoned")
+            self.stalled += 1
+            self.failed += 1
+            self.breaker.record_failure(error)
+            raise error from e
+
+    async def _hedged(self, attempt: Callable[[], Awaitable]):
+        first = asyncio.ensure_future(asyncio.wait_for(attempt(), self.timeout))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_after)
+        # The hedge spends quota too, skip it when none is left right now
+        if done or (self.bucket and not self.bucket.try_take()):
+            return await first
+
+        self.hedged += 1
+        second = asyncio.ensure_future(asyncio.wait_for(attempt(), self.timeout))
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.hedge_wins += task is second
+                        return task.result()
+            # Both failed, the first one's error decides what happens next
+            return first.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.breaker.state,
+            "open": int(self.breaker.state != "closed"),
+            "opened": self.breaker.opened,
+            "calls": self.calls,
+            "attempts": self.attempts,
+            "retried": self.retried,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "failed": self.failed,
+            "fast_failed": self.fast_failed,
+            "shed": self.shed,
+            "stalled": self.stalled
+        }
+
+
+llm_gateway = LLMGateway(workers=int(os.getenv("WEB_CONCURRENCY") or 1))
@@ -1,16 +1,55 @@
+"""
+Memori setup and the adapter over its internals.
+
+The request path splits Memori's invoke wrapper into recall, the unwrapped
+Gemini call and a deferred write, and swaps per-user session state on pooled
+instances. Memori has no public API for any of that, so every private name
+it takes is used in this module only, and check_memori_internals() fails
+the boot if an upgrade moved one. pyproject pins the version they match.
+"""
 import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from importlib.metadata import version
+from uuid import uuid4
+
 from dotenv import load_dotenv
+from google.genai import Client as GoogleClient
 from memori import Memori
+from memori._config import Cache as MemoriCache
+from memori.llm._base import BaseInvoke, BaseIterator
+from memori.llm._embeddings import embed_texts
+from memori.memory.augmentation._runtime import get_runtime as get_augmentation_runtime
+from memori.memory._manager import Manager as MemoryManager
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
+from app.core.metrics import MEMORI_SECONDS
+from config.database import tune_sqlite
+
 load_dotenv(verbose=True)
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 SYNC_DATABASE_URL = DATABASE_URL.replace("+aiosqlite", "")
 
-engine_kwargs = {"pool_pre_ping": True}
+# Memori's storage is synchronous, so all of its I/O runs on this many threads.
+# Its connection pool is sized to match, the async engine keeps its own pool.
+MEMORI_MAX_WORKERS = int(os.getenv("MEMORI_MAX_WORKERS", 8))
+
+# Memori's background augmentation holds a session while it calls its API, with
+# 50 in flight by default. The first start fixes the limit for the process, so
+# it is capped here before any Memori instance is built.
+get_augmentation_runtime().ensure_started(MEMORI_MAX_WORKERS)
+
+engine_kwargs = {
+    "pool_pre_ping": True,
+    "pool_size": MEMORI_MAX_WORKERS,
+    # One more connection per augmentation task
+    "max_overflow": MEMORI_MAX_WORKERS,
+}
 if "sqlite" in SYNC_DATABASE_URL:
     engine_kwargs["connect_args"] = {"check_same_thread": False}
 
@@ -18,8 +57,225 @@ engine = create_engine(
     SYNC_DATABASE_URL,
     **engine_kwargs
 )
+tune_sqlite(engine)
 
 SessionLocal = sessionmaker(bind=engine)
 
+memori_executor = ThreadPoolExecutor(max_workers=MEMORI_MAX_WORKERS, thread_name_prefix="memori")
+
+# Seconds spent in Memori by the current request, set up by the timing middleware
+memori_request_time: ContextVar[list | None] = ContextVar("memori_request_time", default=None)
+
+
+class MemoriTimings:
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": MEMORI_MAX_WORKERS,
+            "calls": self.calls,
+            "total_ms": round(self.seconds * 1000, 1),
+            "avg_ms": round(self.seconds * 1000 / self.calls, 2) if self.calls else 0.0
+        }
+
+
+memori_timings = MemoriTimings()
+
+
+def _releasing(storage, fn, *args):
+    # Memori keeps one Session per instance and leaves read transactions open,
+    # which would pin a pooled connection to every instance between calls
+    session = storage.adapter.conn
+    try:
+        result = fn(*args)
+        session.commit()
+        return result
+    except Exception:
+        session.rollback()
+        raise
+
+
+async def run_memori(fn, *args, storage=None):
+    """
+    Runs a blocking Memori call on the Memori executor and accounts its wall
+    time (queueing included) to the current request. With `storage`, that
+    instance's session is committed or rolled back afterwards so its
+    connection goes back to the pool.
+    """
+    if storage is not None:
+        fn, args = _releasing, (storage, fn, *args)
+
+    start = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(memori_executor, fn, *args)
+    finally:
+        elapsed = time.perf_counter() - start
+        MEMORI_SECONDS.observe(elapsed)
+        memori_timings.calls += 1
+        memori_timings.seconds += elapsed
+
+        request_time = memori_request_time.get()
+        if request_time is not None:
+            request_time[0] += elapsed
+
+
+def storage_of(mem_or_invoke):
+    # A Memori instance and its wrapped client methods share one storage
+    return mem_or_invoke.config.storage
+
+
+def memori_invoke(client: GoogleClient, stream: bool) -> BaseInvoke:
+    """
+    The Memori wrapper registered in place of the client's async
+    generate_content (or generate_content_stream).
+    """
+    models = client.aio.models
+    return (models.generate_content_stream if stream else models.generate_content).__self__
+
+
+def unwrapped_call(client: GoogleClient, stream: bool):
+    # The client's own method, Memori keeps it next to its wrapper
+    models = client.aio.models
+    return models.actual_generate_content_stream if stream else models.actual_generate_content
+
+
+def user_session(mem: Memori) -> tuple:
+    """
+    The session id and resolved-id cache Memori keeps on its config, saved
+    per user while a pooled instance serves someone else.
+    """
+    return mem.config.session_id, mem.config.cache
+
+
+def restore_user_session(mem: Memori, session: tuple | None):
+    # None starts a fresh session
+    session_id, cache = session or (uuid4(), MemoriCache())
+    mem.config.session_id = session_id
+    mem.config.cache = cache
+
+
+def injected_count(invoke: BaseInvoke) -> int:
+    return invoke._injected_message_count
+
+
+def prepare_request(invoke, kwargs: dict) -> dict:
+    """
+    The pre-call half of Memori's invoke wrapper: recalled facts and stored
+    conversation messages are injected into the request kwargs.
+    """
+    # Memori only sets the count when it injects something, so on a pooled
+    # slot it would leak from the previous user and hide this turn's messages
+    invoke._injected_message_count = 0
+    return invoke.inject_conversation_messages(
+        invoke.inject_recalled_facts(invoke.configure_for_streaming_usage(kwargs))
+    )
+
+
+class StreamRecorder(BaseIterator):
+    """
+    Collects streamed chunks the way Memori's async iterator does, so the
+    finished reply can be written once the stream ends.
+    """
+
+    def __init__(self, invoke, kwargs: dict, start: float):
+        super().__init__(invoke.config, None)
+        self.configure_invoke(invoke).configure_request(kwargs, start)
+        self.set_raw_response()
+
+    @property
+    def response(self):
+        # The chunks collected so far, what write() stores
+        return self.raw_response
+
+    def write(self):
+        MemoryManager(self.config).execute(
+            self.invoke._format_payload(
+                self.config.framework.provider,
+                self.config.llm.provider,
+                self.config.llm.version,
+                self._time_start,
+                time.time(),
+                self.invoke._format_kwargs(self._kwargs),
+                self.invoke._format_response(self.raw_response),
+            )
+        )
+
+
+def record_turn(invoke: BaseInvoke, stream: bool, kwargs: dict, start: float, response, count: int):
+    """
+    The post-call half of the wrapper, for a turn prepared with
+    prepare_request on `invoke` (possibly another instance's): stores it as
+    conversation messages and queues augmentation. Blocking.
+    """
+    invoke._injected_message_count = count
+    if stream:
+        recorder = StreamRecorder(invoke, kwargs, start)
+        recorder.raw_response = response
+        recorder.write()
+    else:
+        invoke.handle_post_response(kwargs, start, response)
+
+
+def warm_embeddings():
+    # Loads the sentence-transformer recall embeds with
+    embed_texts("warm up")
+
+
+def create_memori() -> Memori:
+    return Memori(conn=SessionLocal)
+
+
+def register_client(client: GoogleClient) -> Memori:
+    mem = create_memori()
+    mem.llm.register(client)
+    return mem
+
+
+# Private names used above, by the class they must be found on
+_INTERNALS = {
+    BaseInvoke: (
+        "configure_for_streaming_usage", "inject_recalled_facts", "inject_conversation_messages",
+        "handle_post_response", "_format_payload", "_format_kwargs", "_format_response"
+    ),
+    BaseIterator: ("configure_invoke", "configure_request", "process_chunk", "set_raw_response"),
+    MemoryManager: ("execute",),
+}
+
+
+def check_memori_internals():
+    """
+    Registers a throwaway client and checks every private name this module
+    relies on, raising with the missing ones. Run at startup, so a Memori
+    upgrade that moved them fails the boot instead of every chat turn.
+    """
+    missing = [f"{cls.__name__}.{name}" for cls, names in _INTERNALS.items() for name in names if not hasattr(cls, name)]
+
+    client = GoogleClient(api_key="memori-check")
+    mem = register_client(client)
+    instance_checks = {
+        "config.session_id": lambda: mem.config.session_id,
+        "config.cache": lambda: mem.config.cache,
+        "config.storage.adapter.conn": lambda: mem.config.storage.adapter.conn,
+        "aio.models.actual_generate_content": lambda: unwrapped_call(client, False),
+        "aio.models.actual_generate_content_stream": lambda: unwrapped_call(client, True),
+        "generate_content wrapper": lambda: injected_count(memori_invoke(client, False)),
+        "generate_content_stream wrapper": lambda: injected_count(memori_invoke(client, True)),
+    }
+    for name, check in instance_checks.items():
+        try:
+            check()
+        except AttributeError:
+            missing.append(name)
+    storage_of(mem).adapter.conn.close()
+
+    if missing:
+        raise RuntimeError(
+            f"memori {version('memori')} lacks internals app/core/memori.py relies on: {', '.join(missing)}. "
+            f"Install the version pinned in pyproject.toml or update the adapter"
+        )
+
+
 # Global Memori instance
-memori = Memori(conn=SessionLocal)
+memori = create_memori()
@@ -0,0 +1,196 @@
+import os
+import asyncio
+import logging
+import traceback
+from collections import Counter
+from typing import NamedTuple
+
+from dotenv import load_dotenv
+
+from app.core.memori import memori_invoke, record_turn, run_memori, storage_of
+
+load_dotenv(verbose=True)
+
+# Finished turns waiting for Memori ingestion, submitters wait when it is full
+MEMORI_WRITE_QUEUE_SIZE = int(os.getenv("MEMORI_WRITE_QUEUE_SIZE", 1000))
+MEMORI_WRITE_WORKERS = int(os.getenv("MEMORI_WRITE_WORKERS", 4))
+MEMORI_WRITE_RETRIES = int(os.getenv("MEMORI_WRITE_RETRIES", 3))
+MEMORI_WRITE_FLUSH_TIMEOUT = float(os.getenv("MEMORI_WRITE_FLUSH_TIMEOUT", 30))
+# Longest a turn waits for the user's earlier writes before recalling without them
+MEMORI_WRITE_WAIT_TIMEOUT = float(os.getenv("MEMORI_WRITE_WAIT_TIMEOUT", 10))
+
+
+class MemoryJob(NamedTuple):
+    user_id: int
+    stream: bool
+    kwargs: dict
+    start: float
+    # The Gemini response, or the chunks collected by a StreamRecorder
+    response: object
+    injected_count: int
+
+
+class MemoryWriter:
+    """
+    Write-behind queue for Memori ingestion. A finished turn is queued and
+    written by a background worker after the reply has gone out.
+
+    Each worker owns a Gemini/Memori slot from the client pool, so writes
+    never share a storage session with a request in flight. A user's next
+    turn waits for that user's pending writes, so recall sees the previous
+    turn, but only up to MEMORI_WRITE_WAIT_TIMEOUT so a stuck write cannot
+    hang the chat.
+
+    A worker that cannot build its slot retries with backoff, and one that
+    dies anyway is replaced, so queued jobs are always being worked on.
+    """
+
+    def __init__(self, max_queue: int, workers: int, retries: int):
+        self.workers = workers
+        self.retries = retries
+        self._queue: asyncio.Queue | None = None
+        self._max_queue = max_queue
+        self._tasks: list[asyncio.Task] = []
+        self._closing = False
+        self._pending: Counter = Counter()
+        self._drained: dict[int, asyncio.Event] = {}
+        self.submitted = 0
+        self.written = 0
+        self.retried = 0
+        self.dropped = 0
+        self.restarted = 0
+        self.wait_timeouts = 0
+
+    def start(self, pool):
+        self._queue = asyncio.Queue(maxsize=self._max_queue)
+        self._closing = False
+        for _ in range(self.workers):
+            self._spawn(pool)
+
+    def _spawn(self, pool):
+        task = asyncio.create_task(self._worker(pool))
+        task.add_done_callback(lambda task: self._worker_exited(task, pool))
+        self._tasks.append(task)
+
+    def _worker_exited(self, task: asyncio.Task, pool):
+        if task in self._tasks:
+            self._tasks.remove(task)
+        if self._closing or task.cancelled():
+            return
+        logging.error(f"Memori writer died ({task.exception()!r}), starting a new one")
+        self.restarted += 1
+        self._spawn(pool)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks) and not self._closing
+
+    async def submit(self, job: MemoryJob):
+        self.submitted += 1
+        self._pending[job.user_id] += 1
+        self._drained.setdefault(job.user_id, asyncio.Event()).clear()
+        # Blocks while the queue is full, which throttles new turns instead of growing memory
+        await self._queue.put(job)
+
+    async def wait_for_user(self, user_id: int, timeout: float = MEMORI_WRITE_WAIT_TIMEOUT):
+        event = self._drained.get(user_id)
+        if event is None:
+            return
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            self.wait_timeouts += 1
+            logging.warning(f"Memori writes for user {user_id} still pending after {timeout}s, recalling without them")
+
+    def _done(self, user_id: int):
+        self._pending[user_id] -= 1
+        if self._pending[user_id] <= 0:
+            del self._pending[user_id]
+            self._drained.pop(user_id).set()
+
+    async def _slot(self, pool):
+        # Storage may be down at startup, the other workers keep draining meanwhile
+        attempt = 0
+        while True:
+            try:
+                return await run_memori(pool.new_slot)
+            except Exception:
+                logging.error(traceback.format_exc())
+                logging.error(f"Memori writer could not build its slot, retrying (attempt {attempt + 1})")
+                await asyncio.sleep(min(0.5 * 2 ** attempt, 30))
+                attempt += 1
+
+    async def _worker(self, pool):
+        client, mem = await self._slot(pool)
+
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._write(pool, client, mem, job)
+            except Exception:
+                # _write handles write failures, this is anything else
+                self.dropped += 1
+                logging.error(traceback.format_exc())
+                logging.error(f"Memori write for user {job.user_id} dropped")
+            finally:
+                self._done(job.user_id)
+                self._queue.task_done()
+
+    async def _write(self, pool, client, mem, job: MemoryJob):
+        invoke = memori_invoke(client, job.stream)
+
+        for attempt in range(self.retries + 1):
+            try:
+                pool.restore_user(mem, job.user_id)
+                try:
+                    await run_memori(
+                        record_turn, invoke, job.stream, job.kwargs, job.start, job.response, job.injected_count,
+                        storage=storage_of(mem)
+                    )
+                finally:
+                    pool.save_user(mem, job.user_id)
+                self.written += 1
+                return
+            except Exception:
+                if attempt == self.retries:
+                    self.dropped += 1
+                    logging.error(traceback.format_exc())
+                    logging.error(f"Memori write for user {job.user_id} dropped after {attempt + 1} attempts")
+                    return
+
+                self.retried += 1
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+    async def close(self, timeout: float = MEMORI_WRITE_FLUSH_TIMEOUT):
+        """
+        Flushes queued writes, waiting up to `timeout` seconds, then stops the workers.
+        """
+        if not self._tasks:
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logging.error(f"Memori write-behind flush timed out, {self._queue.qsize()} turns not written")
+
+        self._closing = True
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._tasks),
+            "pending": sum(self._pending.values()),
+            "submitted": self.submitted,
+            "written": self.written,
+            "retried": self.retried,
+            "dropped": self.dropped,
+            "restarted": self.restarted,
+            "wait_timeouts": self.wait_timeouts
+        }
+
+
+memory_writer = MemoryWriter(MEMORI_WRITE_QUEUE_SIZE, MEMORI_WRITE_WORKERS, MEMORI_WRITE_RETRIES)
@@ -0,0 +1,223 @@
+"""
+Minimal Prometheus instrumentation: labelled histograms plus gauges read at
+scrape time, rendered in the text exposition format by /metrics.
+
+Observing is a bisect and a dict update under a lock, cheap enough to leave
+on for every request.
+"""
+import time
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Seconds, from sub-millisecond cache hits to multi-second LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *labelvalues: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), sum, count
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, *labelvalues: str) -> "_Timer":
+        return _Timer(self, labelvalues)
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(k, list(v[0]), v[1], v[2]) for k, v in self._series.items()]
+
+        for labelvalues, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                le = _labels(self.labelnames, labelvalues, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class _Timer:
+    # A plain class is several times cheaper per span than @contextmanager
+    __slots__ = ("histogram", "labelvalues", "start")
+
+    def __init__(self, histogram: Histogram, labelvalues: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+        return False
+
+
+class GaugeCallback:
+    """
+    Gauge whose samples are read from `fn` at scrape time, as
+    {labelvalues: value}.
+    """
+
+    def __init__(self, name: str, documentation: str, fn: Callable[[], dict], labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.labelnames = labelnames
+        REGISTRY.append(self)
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for labelvalues, value in self.fn().items():
+            lines.append(f"{self.name}{_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+
+REGISTRY: list = []
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.collect()) + "\n"
+
+
+REQUEST_SECONDS = Histogram(
+    "disha_http_request_seconds", "Time until the response starts, by route",
+    ("method", "route", "status")
+)
+CHAT_STAGE_SECONDS = Histogram(
+    "disha_chat_stage_seconds", "Time spent per stage of a chat turn",
+    ("stage",)
+)
+HISTORY_SECONDS = Histogram(
+    "disha_history_seconds", "HistoryService call time",
+    ("operation",)
+)
+LLM_SECONDS = Histogram(
+    "disha_llm_seconds", "Gemini call time, until the last chunk for streams",
+    ("kind",)
+)
+MEMORI_SECONDS = Histogram(
+    "disha_memori_seconds", "Memori executor call time, queueing included"
+)
+DB_CHECKOUT_SECONDS = Histogram(
+    "disha_db_pool_checkout_seconds", "Wait for a pooled connection when a session begins",
+    ("pool",)
+)
+DB_QUERY_SECONDS = Histogram(
+    "disha_db_query_seconds", "Statement execution time",
+    ("pool",)
+)
+
+PROMPT_TOKENS = Histogram(
+    "disha_prompt_tokens", "Input tokens per LLM request: estimated per prompt part, reported as counted by Gemini",
+    ("part",), buckets=(50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+)
+CONTEXT_TURNS = Histogram(
+    "disha_context_turns", "History turns per LLM request, sent and cut to CONTEXT_TURN_MAX_TOKENS",
+    ("kind",), buckets=(0, 1, 2, 5, 10, 20, 50, 100)
+)
+
+DB_WRITE_BATCH = Histogram(
+    "disha_db_write_batch_size", "Writes committed together by the SQLite write queue",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+
+
+_engine_pools: dict = {}
+# Connections a pool may open beyond its size, as configured
+_pool_overflow: dict = {}
+
+
+def _transaction_created(session, transaction):
+    if transaction.parent is None:
+        session.info["checkout_start"] = time.perf_counter()
+
+
+def _transaction_began(session, transaction, connection):
+    start = session.info.pop("checkout_start", None)
+    pool = _engine_pools.get(connection.engine)
+    if start is not None and pool is not None:
+        DB_CHECKOUT_SECONDS.observe(time.perf_counter() - start, pool)
+
+
+def instrument_engine(sync_engine, pool: str, max_overflow: int = 0):
+    """
+    Records statement time for `sync_engine` and, for sessions bound to it,
+    the wait between a transaction starting and its connection being handed
+    out by the pool. `max_overflow` is the engine's setting, which the pool
+    only keeps privately.
+    """
+    if not _engine_pools:
+        event.listen(Session, "after_transaction_create", _transaction_created)
+        event.listen(Session, "after_begin", _transaction_began)
+    _engine_pools[sync_engine] = pool
+    _pool_overflow[sync_engine] = max_overflow
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_start"] = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info.pop("query_start", None)
+        if start is not None:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - start, pool)
+
+
+def _queue_pools():
+    for sync_engine, pool in _engine_pools.items():
+        # Static and null pools have no size to saturate
+        if hasattr(sync_engine.pool, "checkedout"):
+            p = sync_engine.pool
+            yield pool, p, p.size() + max(_pool_overflow[sync_engine], 0)
+
+
+def _pool_state() -> dict:
+    samples = {}
+    for pool, p, capacity in _queue_pools():
+        samples[(pool, "checked_out")] = p.checkedout()
+        samples[(pool, "size")] = p.size()
+        samples[(pool, "overflow")] = max(p.overflow(), 0)
+        samples[(pool, "capacity")] = capacity
+    return samples
+
+
+def _pool_saturation() -> dict:
+    # 1.0 means every allowed connection is checked out and the next session waits
+    return {
+        (pool,): round(p.checkedout() / max(capacity, 1), 3)
+        for pool, p, capacity in _queue_pools()
+    }
+
+
+GaugeCallback("disha_db_pool_connections", "Pool connections by state", _pool_state, ("pool", "state"))
+GaugeCallback("disha_db_pool_saturation", "Checked out connections over pool capacity", _pool_saturation, ("pool",))
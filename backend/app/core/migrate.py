@@ -0,0 +1,53 @@
+"""
+One-time schema step, run once per deploy before any worker boots: app
+tables and indexes, Memori's tables and the protocol TF-IDF index. Workers
+running it concurrently would race on the DDL.
+
+    python -m app.core.migrate
+"""
+import json
+import time
+import asyncio
+
+# Registers the models on Base.metadata
+import app.models.user  # noqa: F401
+import app.models.message  # noqa: F401
+import app.models.archive  # noqa: F401
+import app.models.batch  # noqa: F401
+from app.core.memori import memori
+from app.core.protocol_index import INDEX_DIR, load_or_build_index
+from config.database import Base, engine
+
+
+async def create_app_tables():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        # create_all skips indexes added to tables that already exist
+        await conn.run_sync(lambda sync_conn: [
+            index.create(sync_conn, checkfirst=True)
+            for table in Base.metadata.sorted_tables
+            for index in table.indexes
+        ])
+
+
+def create_memori_tables():
+    memori.config.storage.build()
+
+
+def build_protocol_index():
+    source = INDEX_DIR.parent / "protocols.json"
+    load_or_build_index(json.loads(source.read_text(encoding="utf-8")), source)
+
+
+async def migrate():
+    await create_app_tables()
+    # The engine's connections belong to this loop, the caller may run another
+    await engine.dispose()
+    create_memori_tables()
+    build_protocol_index()
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    asyncio.run(migrate())
+    print(f"Migrations applied in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,159 @@
+"""
+Offline TF-IDF retrieval over the protocol library.
+
+The index is built ahead of time (python -m app.core.protocol_index, or the
+migrate step) into a directory of .npy files laid out as an inverted index:
+for every term, the ids of the protocols containing it and their
+L2-normalised TF-IDF weights. At startup the arrays are memory-mapped
+read-only, so loading costs no copies, and a query is a sparse dot product
+over the postings of its own terms only.
+"""
+import re
+import json
+import math
+import logging
+from collections import Counter
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+INDEX_DIR = Path(__file__).resolve().parent.parent / "prompts" / "protocol_index"
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a about after all also am an and any are as at be been but by can do does for from had has have
+how i if in into is it its just me my no not of on or our so some than that the their them then
+there these they this to up was we were what when where which while who will with you your
+since today yesterday morning feel feeling bit very really please hi hello
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS and len(t) > 1]
+
+
+def _document(protocol: dict) -> str:
+    # Keywords are repeated so they outweigh the boilerplate in the protocol text
+    return " ".join([protocol["name"]] + protocol["keywords"] * 3 + [protocol["text"]])
+
+
+def build_index(protocols: List[dict], out_dir: Path = INDEX_DIR, max_df: float = 0.5):
+    n_docs = len(protocols)
+    doc_terms = [Counter(tokenize(_document(p))) for p in protocols]
+
+    df = Counter()
+    for terms in doc_terms:
+        df.update(terms.keys())
+
+    # Terms found in most protocols carry almost no signal but have the longest postings
+    if n_docs >= 100:
+        df = Counter({t: n for t, n in df.items() if n <= max_df * n_docs})
+        doc_terms = [Counter({t: c for t, c in terms.items() if t in df}) for terms in doc_terms]
+
+    vocab = {term: i for i, term in enumerate(sorted(df))}
+    idf = np.array([math.log((1 + n_docs) / (1 + df[t])) + 1 for t in sorted(df)], dtype=np.float32)
+
+    postings: List[List[Tuple[int, float]]] = [[] for _ in vocab]
+    for doc_id, terms in enumerate(doc_terms):
+        weights = {t: (1 + math.log(c)) * idf[vocab[t]] for t, c in terms.items()}
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        for t, w in weights.items():
+            postings[vocab[t]].append((doc_id, w / norm))
+
+    indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(p) for p in postings])
+    doc_ids = np.fromiter((d for p in postings for d, _ in p), dtype=np.int32, count=int(indptr[-1]))
+    weights = np.fromiter((w for p in postings for _, w in p), dtype=np.float32, count=int(indptr[-1]))
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    np.save(out_dir / "indptr.npy", indptr)
+    np.save(out_dir / "doc_ids.npy", doc_ids)
+    np.save(out_dir / "weights.npy", weights)
+    np.save(out_dir / "idf.npy", idf)
+    (out_dir / "vocab.json").write_text(json.dumps(vocab), encoding="utf-8")
+    (out_dir / "names.json").write_text(json.dumps([p["name"] for p in protocols]), encoding="utf-8")
+
+
+def _mmap(path: Path) -> np.ndarray:
+    # Plain ndarray view over the mapping, np.memmap indexing is several times slower
+    return np.asarray(np.load(path, mmap_mode="r"))
+
+
+class ProtocolIndex:
+    def __init__(self, directory: Path):
+        self.indptr = _mmap(directory / "indptr.npy")
+        self.doc_ids = _mmap(directory / "doc_ids.npy")
+        self.weights = _mmap(directory / "weights.npy")
+        self.idf = _mmap(directory / "idf.npy")
+        self.vocab = json.loads((directory / "vocab.json").read_text(encoding="utf-8"))
+        self.names = json.loads((directory / "names.json").read_text(encoding="utf-8"))
+
+    def search(self, text: str, k: int = 3, min_score: float = 0.0) -> List[Tuple[str, float]]:
+        """
+        Top-k protocols by cosine similarity to `text`, best first.
+        """
+        counts = Counter(t for t in tokenize(text) if t in self.vocab)
+        if not counts:
+            return []
+
+        term_ids = np.fromiter((self.vocab[t] for t in counts), dtype=np.int64, count=len(counts))
+        q = np.fromiter((1 + math.log(c) for c in counts.values()), dtype=np.float32, count=len(counts))
+        q *= self.idf[term_ids]
+        q /= np.linalg.norm(q)
+
+        starts, ends = self.indptr[term_ids], self.indptr[term_ids + 1]
+        lengths = ends - starts
+        positions = np.repeat(ends - lengths.cumsum(), lengths) + np.arange(lengths.sum())
+        scores = np.bincount(
+            self.doc_ids[positions],
+            weights=self.weights[positions] * np.repeat(q, lengths),
+            minlength=len(self.names)
+        )
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        return [(self.names[i], float(scores[i])) for i in top if scores[i] > min_score]
+
+
+def _is_current(source: Path, directory: Path) -> bool:
+    marker = directory / "names.json"
+    return marker.exists() and marker.stat().st_mtime >= source.stat().st_mtime
+
+
+def load_index(source: Path, directory: Path = INDEX_DIR) -> ProtocolIndex | None:
+    """
+    Loads the prebuilt index read-only, or returns None if it is missing or
+    older than the protocol file. Building is left to the migrate step, so
+    workers importing this never write the files another one is reading.
+    """
+    if not _is_current(source, directory):
+        logging.warning(
+            f"Protocol index at {directory} is missing or stale, using keyword matching only. "
+            f"Build it with `python -m app.core.protocol_index`"
+        )
+        return None
+
+    return ProtocolIndex(directory)
+
+
+def load_or_build_index(protocols: List[dict], source: Path, directory: Path = INDEX_DIR) -> ProtocolIndex:
+    """
+    Loads the prebuilt index, rebuilding it first if it is missing or older
+    than the protocol file it was built from.
+    """
+    if not _is_current(source, directory):
+        logging.warning(f"Protocol index at {directory} is missing or stale, rebuilding")
+        build_index(protocols, directory)
+
+    return ProtocolIndex(directory)
+
+
+if __name__ == "__main__":
+    # Read the file directly, importing ProtocolService would load the old index
+    source = INDEX_DIR.parent / "protocols.json"
+    build_index(json.loads(source.read_text(encoding="utf-8")), INDEX_DIR)
+    print(f"Protocol index written to {INDEX_DIR}")
@@ -0,0 +1,251 @@
+"""
+Fan-out of newly stored messages to the WebSocket connections of their user.
+
+LocalBroker delivers what this process stores. With several workers a
+user's socket and their chat requests can land on different workers, so
+DBTailBroker also tails the messages table once per PUSH_POLL_INTERVAL for
+the users connected here: one indexed range query per worker per tick,
+whatever the number of connections. Ids are not committed in order on
+Postgres, so each tick re-reads PUSH_TAIL_LAG seconds' worth of ids and
+the broker drops what it already sent. Another transport (Redis, Postgres
+NOTIFY) plugs in the same way, by calling `publish` for what it receives.
+"""
+import os
+import time
+import asyncio
+import contextlib
+import logging
+import traceback
+from collections import deque
+from typing import Callable
+
+from dotenv import load_dotenv
+from sqlalchemy import func, select
+
+from app.models.message import HISTORY_COLUMNS, Message
+from app.utils.json_response import message_json
+from config.database import db_session
+
+load_dotenv(verbose=True)
+
+# local or db_tail, the default follows the worker count
+PUSH_BROKER = os.getenv("PUSH_BROKER") or ("db_tail" if int(os.getenv("WEB_CONCURRENCY") or 1) > 1 else "local")
+PUSH_POLL_INTERVAL = float(os.getenv("PUSH_POLL_INTERVAL", 1.0))
+# Undelivered messages per connection before a slow client is dropped
+PUSH_QUEUE_SIZE = int(os.getenv("PUSH_QUEUE_SIZE", 100))
+# How long a row may take from getting its id to committing, the db_tail broker re-reads that far back
+PUSH_TAIL_LAG = float(os.getenv("PUSH_TAIL_LAG", 5.0))
+# Ids remembered per connected user so each message is pushed once, must cover a lag's worth
+PUSH_RECENT_IDS = int(os.getenv("PUSH_RECENT_IDS", 256))
+
+
+class Subscription:
+    """
+    One connection's view of its user's new messages. Idle subscriptions own
+    no task: `send` runs in a short-lived drain task only while messages
+    are pending, so thousands of idle sockets cost little more than the
+    socket itself.
+    """
+    __slots__ = ("user_id", "send", "on_overflow", "pending", "drain", "paused", "floor", "replayed")
+
+    def __init__(self, user_id: int, send: Callable, on_overflow: Callable, floor: int = 0):
+        self.user_id = user_id
+        self.send = send
+        self.on_overflow = on_overflow
+        self.pending: deque | None = None
+        self.drain: asyncio.Task | None = None
+        # Holds live messages back until the connection's catch-up is queued
+        self.paused = True
+        # Ids up to `floor` predate the connection and ids in `replayed` came
+        # with its catch-up, the tail re-reading them must not send them again
+        self.floor = floor
+        self.replayed: frozenset | None = None
+
+    def wants(self, message_id: int) -> bool:
+        return message_id > self.floor and (self.replayed is None or message_id not in self.replayed)
+
+    def deliver(self, payload) -> bool:
+        if self.pending is None:
+            self.pending = deque()
+        if len(self.pending) >= PUSH_QUEUE_SIZE:
+            # The client reconnects with after_id and catches up from the DB
+            self.pending = None
+            self.on_overflow()
+            return False
+
+        self.pending.append(payload)
+        if self.drain is None and not self.paused:
+            self.drain = asyncio.create_task(self._drain())
+        return True
+
+    def resume(self, backlog: list[dict]):
+        """
+        Queues the messages read from the DB on connect ahead of anything
+        published meanwhile, dropping the overlap, and starts delivering.
+        """
+        read = frozenset(payload["id"] for payload in backlog)
+        self.replayed = read or None
+        live = [payload for payload in self.pending or () if payload["id"] not in read]
+        self.pending = deque(backlog + live) if backlog or live else None
+        self.paused = False
+        if self.pending and self.drain is None:
+            self.drain = asyncio.create_task(self._drain())
+
+    async def _drain(self):
+        try:
+            while self.pending:
+                await self.send(self.pending.popleft())
+        except Exception:
+            # The socket went away, its handler unsubscribes
+            self.pending = None
+        finally:
+            self.drain = None
+            if not self.pending:
+                self.pending = None
+
+
+class LocalBroker:
+    def __init__(self):
+        self._subscribers: dict[int, set[Subscription]] = {}
+        # Ids last pushed per connected user, oldest first, so no source delivers a
+        # message twice. A set rather than the newest id: lower ids can arrive later
+        self._sent: dict[int, dict[int, None]] = {}
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, user_id: int, send: Callable, on_overflow: Callable, after_id: int = 0) -> Subscription:
+        """
+        Registers a paused subscription: it collects what is published from
+        now on and starts sending once `resume` hands it the catch-up.
+        Nothing up to `after_id`, or without one what was already stored, is
+        pushed to it.
+        """
+        subscription = Subscription(user_id, send, on_overflow, after_id or self.newest_seen())
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        self._sent.setdefault(user_id, {})
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.user_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.user_id]
+            del self._sent[subscription.user_id]
+        if subscription.drain is not None:
+            subscription.drain.cancel()
+
+    def publish(self, user_id: int, messages):
+        """
+        Pushes stored messages (id, sender, content, created_at) to every
+        connection of `user_id`, skipping ids already pushed. Costs a dict
+        lookup when the user has none.
+        """
+        subscribers = self._subscribers.get(user_id)
+        if not subscribers:
+            return
+
+        sent = self._sent[user_id]
+        for m in messages:
+            if m.id in sent:
+                continue
+            sent[m.id] = None
+            if len(sent) > PUSH_RECENT_IDS:
+                del sent[next(iter(sent))]
+            payload = message_json(m)
+            for subscription in subscribers:
+                if not subscription.wants(m.id):
+                    continue
+                if subscription.deliver(payload):
+                    self.delivered += 1
+                else:
+                    self.dropped += 1
+
+    def newest_seen(self) -> int:
+        # Published messages are new to every subscriber
+        return 0
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "broker": PUSH_BROKER,
+            "users": len(self._subscribers),
+            "connections": sum(len(s) for s in self._subscribers.values()),
+            "delivered": self.delivered,
+            "dropped": self.dropped
+        }
+
+
+class DBTailBroker(LocalBroker):
+    def __init__(self, interval: float, lag: float):
+        super().__init__()
+        self.interval = interval
+        self.lag = lag
+        self._task: asyncio.Task | None = None
+        # (monotonic time, newest id) per tick, back to the first one older than the lag
+        self._ends: deque[tuple[float, int]] | None = None
+
+    def newest_seen(self) -> int:
+        # The tail re-reads rows stored before a connection, it starts after them
+        return self._ends[-1][1] if self._ends else 0
+
+    async def start(self):
+        self._task = asyncio.create_task(self._tail())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+
+    async def _tail(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self._subscribers:
+                # Nobody to deliver to, restart from the table's end on the next connection
+                self._ends = None
+                continue
+            try:
+                await self._poll()
+            except Exception:
+                logging.error(traceback.format_exc())
+
+    async def _poll(self):
+        async with db_session() as db:
+            # Read the end first, rows committed meanwhile are left for the next tick.
+            # Ids are global, the window also moves past users not connected here
+            end = (await db.execute(select(func.max(Message.id)))).scalar() or 0
+            now = time.monotonic()
+            if self._ends is None:
+                self._ends = deque([(now, end)])
+                return
+
+            # Start from the end seen a lag ago: a row that had its id by then but
+            # committed after a higher one is still picked up
+            while len(self._ends) > 1 and self._ends[1][0] <= now - self.lag:
+                self._ends.popleft()
+            rows = (await db.execute(
+                select(Message.user_id, *HISTORY_COLUMNS)
+                .where(
+                    Message.id > self._ends[0][1],
+                    Message.id <= end,
+                    Message.user_id.in_(list(self._subscribers))
+                )
+                .order_by(Message.id)
+            )).all()
+            self._ends.append((now, max(end, self._ends[-1][1])))
+
+        by_user: dict[int, list] = {}
+        for row in rows:
+            by_user.setdefault(row.user_id, []).append(row)
+        for user_id, messages in by_user.items():
+            self.publish(user_id, messages)
+
+
+broker = DBTailBroker(PUSH_POLL_INTERVAL, PUSH_TAIL_LAG) if PUSH_BROKER == "db_tail" else LocalBroker()
@@ -0,0 +1,88 @@
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Hashable, List
+
+from dotenv import load_dotenv
+
+load_dotenv(verbose=True)
+
+# Off by default, a cached reply is not personalised
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "0") == "1"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 5000))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 3600))
+
+# Only users with at most this many earlier turns (the greeting) get cached replies
+RESPONSE_CACHE_MAX_CONTEXT_TURNS = int(os.getenv("RESPONSE_CACHE_MAX_CONTEXT_TURNS", 1))
+
+WORD_RE = re.compile(r"[a-z0-9']+")
+
+# Greetings and articles that never change what a reply should say. Negations
+# and time words are deliberately kept ("no fever", "since morning").
+FILLER_WORDS = frozenset("""
+hi hey hello hii heya disha please pls plz thanks thank ok okay so um uh a an the
+""".split())
+
+
+def normalize_message(text: str) -> str:
+    """
+    "Hi Disha!! I have a FEVER." and "i have fever" normalise to the same text.
+    """
+    words = WORD_RE.findall(text.lower().replace("’", "'"))
+    return " ".join(w for w in words if w not in FILLER_WORDS)
+
+
+def response_cache_key(user_message: str, protocol_names: List[str], system_prompt: str) -> tuple:
+    # The prompt text itself is part of the key (its hash is cached on the str),
+    # so a prompt version switch or reload never serves replies from the old one
+    return normalize_message(user_message), tuple(protocol_names), hash(system_prompt)
+
+
+class ResponseCache:
+    """
+    LRU with TTL of assistant replies for generic, context-free questions, with
+    hit/miss counters for /health.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: Hashable, reply: str):
+        self._entries[key] = (reply, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": RESPONSE_CACHE_ENABLED,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL)
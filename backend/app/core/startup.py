@@ -0,0 +1,41 @@
+import os
+import time
+import logging
+
+from dotenv import load_dotenv
+
+load_dotenv(verbose=True)
+
+# Workers started by serve.py skip the schema step, it runs once before they
+# boot (`python -m app.core.migrate`). `python main.py` keeps doing it itself.
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "1") == "1"
+
+# Opened before the worker reports ready, so the first requests do not connect
+WARMUP_DB_CONNECTIONS = int(os.getenv("WARMUP_DB_CONNECTIONS", 4))
+WARMUP_LLM_SLOTS = int(os.getenv("WARMUP_LLM_SLOTS", 4))
+
+
+class Readiness:
+    """
+    Startup phases of this worker, in seconds, and whether it is ready: warmed
+    up and not shutting down. /health/ready answers 503 otherwise.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.phases: dict[str, float] = {}
+
+    def record(self, phase: str, seconds: float):
+        self.phases[phase] = round(seconds, 3)
+
+    def mark_ready(self, boot_started: float):
+        self.record("total", time.perf_counter() - boot_started)
+        self.ready = True
+        phases = ", ".join(f"{k} {v:.2f}s" for k, v in self.phases.items())
+        logging.info(f"Worker {os.getpid()} ready: {phases}")
+
+    def stats(self) -> dict:
+        return {"ready": self.ready, "pid": os.getpid(), "startup_seconds": self.phases}
+
+
+readiness = Readiness()
@@ -0,0 +1,10 @@
+from pydantic import BaseModel, Field
+
+class BatchTurnRequest(BaseModel):
+    user_id: int
+    message: str
+
+class BatchJobRequest(BaseModel):
+    # Submitting the same id and items again resumes the job
+    job_id: str = Field(..., min_length=1, max_length=64)
+    items: list[BatchTurnRequest]
@@ -22,3 +22,4 @@ class ChatInitData(BaseModel):
 class ChatHistoryDTO(BaseModel):
     messages: list[MessageDTO]
     has_more: bool
+    next_cursor: Optional[str] = None
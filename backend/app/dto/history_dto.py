@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 
 class HistoryMessageDTO(BaseModel):
@@ -10,4 +10,5 @@ class HistoryMessageDTO(BaseModel):
 
 class HistoryData(BaseModel):
     messages: List[HistoryMessageDTO]
-    has_more: bool
\ No newline at end of file
+    has_more: bool
+    next_cursor: Optional[str] = None
\ No newline at end of file
@@ -1,18 +1,229 @@
 import os
+import time
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from app.core.memori import memori
+from app.core.llm_gateway import llm_gateway
+from app.core.memori import (
+    StreamRecorder, injected_count, memori_invoke, prepare_request, record_turn, register_client,
+    restore_user_session, run_memori, storage_of, unwrapped_call, user_session
+)
+from app.core.memory_writer import MemoryJob, memory_writer
+from app.core.metrics import LLM_SECONDS
 from google.genai import Client as GoogleClient
+from google.genai import types
 
 load_dotenv(verbose=True)
 
-def gemini_llm_with_memory(user_id: int):
-    client = GoogleClient(api_key=os.getenv("GOOGLE_API_KEY"))
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
 
-    # Register with Memori
-    mem = memori.llm.register(client)
-    mem.attribution(
-        entity_id=f"user_{user_id}",
-        process_id=f"disha_chat_{user_id}"
-    )
+# Upper bound on Gemini calls in flight per process (= number of pooled clients)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 32))
 
-    return client
\ No newline at end of file
+# Optional override, e.g. to point at a local fake Gemini server for load tests
+GOOGLE_API_BASE_URL = os.getenv("GOOGLE_API_BASE_URL")
+
+
+def new_gemini_client() -> GoogleClient:
+    http_options = types.HttpOptions(base_url=GOOGLE_API_BASE_URL) if GOOGLE_API_BASE_URL else None
+    return GoogleClient(api_key=os.getenv("GOOGLE_API_KEY"), http_options=http_options)
+
+
+class GeminiClientPool:
+    """
+    Long-lived Gemini clients, each registered with its own Memori instance
+    exactly once. A slot is held exclusively for the duration of one call, so
+    the per-user attribution set on checkout cannot leak into other requests,
+    while the client keeps its HTTP connections and TLS sessions warm.
+
+    Memori caches the resolved entity/session ids on its config, so each
+    user's session id and cache are swapped in on checkout and kept here
+    between calls.
+    """
+
+    def __init__(self, size: int, max_users: int = 10000):
+        self.size = size
+        self.max_users = max_users
+        self._idle = asyncio.Queue()
+        self._created = 0
+        self._user_state: OrderedDict[int, tuple] = OrderedDict()
+
+    # restore_user, save_user and new_slot are also used by the Memori
+    # writers, which keep a slot of their own outside the idle queue
+    def restore_user(self, mem, user_id: int):
+        restore_user_session(mem, self._user_state.pop(user_id, None))
+        mem.attribution(
+            entity_id=f"user_{user_id}",
+            process_id=f"disha_chat_{user_id}"
+        )
+
+    def save_user(self, mem, user_id: int):
+        self._user_state[user_id] = user_session(mem)
+        if len(self._user_state) > self.max_users:
+            self._user_state.popitem(last=False)
+
+    def new_slot(self):
+        client = new_gemini_client()
+        return client, register_client(client)
+
+    async def _build_slot(self):
+        self._created += 1
+        # Memori opens its storage session on construction
+        building = asyncio.ensure_future(run_memori(self.new_slot))
+        try:
+            return await asyncio.shield(building)
+        except asyncio.CancelledError:
+            # The executor thread finishes the slot regardless, it goes to the next caller
+            building.add_done_callback(self._built_late)
+            raise
+        except BaseException:
+            self._created -= 1
+            raise
+
+    def _built_late(self, building: asyncio.Future):
+        if building.cancelled() or building.exception() is not None:
+            self._created -= 1
+        else:
+            self._idle.put_nowait(building.result())
+
+    async def warm(self, slots: int):
+        """
+        Builds up to `slots` idle slots ahead of the first requests.
+        """
+        missing = max(min(slots, self.size) - self._created, 0)
+        for slot in await asyncio.gather(*[self._build_slot() for _ in range(missing)]):
+            self._idle.put_nowait(slot)
+
+    @asynccontextmanager
+    async def acquire(self, user_id: int):
+        # Slots are built lazily, so an idle process does not open `size` clients
+        if self._idle.empty() and self._created < self.size:
+            slot = await self._build_slot()
+        else:
+            slot = await self._idle.get()
+
+        client, mem = slot
+        try:
+            self.restore_user(mem, user_id)
+            try:
+                yield client
+            finally:
+                # Only a restored session belongs to this user
+                self.save_user(mem, user_id)
+        finally:
+            self._idle.put_nowait(slot)
+
+
+gemini_pool = GeminiClientPool(LLM_MAX_CONCURRENCY)
+
+
+async def generate_content(user_id: int, contents: list, system_instruction: str):
+    """
+    Runs the Gemini call on the async client so the event loop stays free
+    while the model is generating. Concurrency is capped by LLM_MAX_CONCURRENCY.
+
+    Memori's wrapper does its recall and writes synchronously, so recall runs
+    on the Memori executor before the unwrapped async call and the write is
+    deferred to the write-behind queue. The call itself goes through the
+    LLM gateway (retries, rate limit, hedging, circuit breaker).
+    """
+    # While the circuit is open fail before any recall work
+    llm_gateway.admit()
+    # Recall must see this user's previous turn
+    await memory_writer.wait_for_user(user_id)
+
+    async with gemini_pool.acquire(user_id) as llm:
+        invoke = memori_invoke(llm, stream=False)
+        start = time.time()
+
+        kwargs = await run_memori(prepare_request, invoke, {
+            "model": GEMINI_MODEL,
+            "contents": contents,
+            "config": types.GenerateContentConfig(
+                system_instruction=system_instruction
+            )
+        }, storage=storage_of(invoke))
+        generate = unwrapped_call(llm, stream=False)
+        with LLM_SECONDS.time("generate"):
+            response = await llm_gateway.call(lambda: generate(**kwargs), hedge=True)
+
+        job = MemoryJob(user_id, False, kwargs, start, response, injected_count(invoke))
+        # Read once, a close() starting in between must not lose the turn
+        queued = memory_writer.running
+        if not queued:
+            await run_memori(
+                record_turn, invoke, False, kwargs, start, response, job.injected_count, storage=storage_of(invoke)
+            )
+
+    if queued:
+        await memory_writer.submit(job)
+    return response
+
+
+async def stream_content(user_id: int, contents: list, system_instruction: str):
+    """
+    Same as generate_content, but yields the reply text chunk by chunk as
+    Gemini produces it. Only opening the stream is retried, text already
+    yielded cannot be taken back. A stream that stalls after that raises
+    LLMTimeout rather than holding the client and the user's turn.
+    """
+    llm_gateway.admit()
+    await memory_writer.wait_for_user(user_id)
+
+    async with gemini_pool.acquire(user_id) as llm:
+        invoke = memori_invoke(llm, stream=True)
+        start = time.time()
+
+        kwargs = await run_memori(prepare_request, invoke, {
+            "model": GEMINI_MODEL,
+            "contents": contents,
+            "config": types.GenerateContentConfig(
+                system_instruction=system_instruction
+            )
+        }, storage=storage_of(invoke))
+        generate_stream = unwrapped_call(llm, stream=True)
+
+        async def open_stream():
+            stream = await generate_stream(**kwargs)
+            return stream, await anext(stream, None)
+
+        call_start = time.perf_counter()
+        stream, chunk = await llm_gateway.call(open_stream)
+        LLM_SECONDS.observe(time.perf_counter() - call_start, "stream_first_chunk")
+
+        recorder = StreamRecorder(invoke, kwargs, start)
+        while chunk is not None:
+            recorder.process_chunk(chunk)
+            if chunk.text:
+                yield chunk.text
+            chunk = await llm_gateway.next_chunk(stream)
+        LLM_SECONDS.observe(time.perf_counter() - call_start, "stream")
+
+        job = MemoryJob(user_id, True, kwargs, start, recorder.response, injected_count(invoke))
+        queued = memory_writer.running
+        if not queued:
+            await run_memori(recorder.write, storage=storage_of(invoke))
+
+    if queued:
+        await memory_writer.submit(job)
+
+
+_plain_client: GoogleClient | None = None
+
+
+async def generate_plain(contents: list, system_instruction: str):
+    """
+    A Gemini call without Memori, for internal work such as summarising
+    archived history, which must not be recalled or stored as a user turn.
+    """
+    global _plain_client
+    if _plain_client is None:
+        _plain_client = new_gemini_client()
+
+    with LLM_SECONDS.time("plain"):
+        return await llm_gateway.call(lambda: _plain_client.aio.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=contents,
+            config=types.GenerateContentConfig(system_instruction=system_instruction)
+        ))
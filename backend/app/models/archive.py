@@ -0,0 +1,32 @@
+from sqlalchemy import Column, Integer, LargeBinary, Text, DateTime, ForeignKey, Index, func
+from config.database import Base
+
+class ArchiveSegment(Base):
+    """
+    A run of a user's oldest messages moved out of `messages`, stored as
+    gzip-compressed JSON lines in id order.
+    """
+    __tablename__ = "message_archive_segments"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    first_id = Column(Integer, nullable=False)
+    last_id = Column(Integer, nullable=False)
+    message_count = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # History paging walks a user's segments newest first
+        Index("idx_archive_user_last_id", "user_id", "last_id"),
+    )
+
+
+class ConversationSummary(Base):
+    __tablename__ = "conversation_summaries"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    summary = Column(Text, nullable=False)
+    # Newest archived message id the summary covers
+    through_id = Column(Integer, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, String, DateTime, func
+from config.database import Base
+
+class BatchItem(Base):
+    """
+    One finished item of a batch job, written in the same transaction as its
+    messages, so a rerun of the job skips exactly the items already stored.
+    """
+    __tablename__ = "batch_items"
+
+    job_id = Column(String(64), primary_key=True)
+    item = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    # The stored assistant reply
+    message_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
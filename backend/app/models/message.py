@@ -1,3 +1,6 @@
+from datetime import datetime
+from typing import NamedTuple
+
 from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index, func
 from config.database import Base
 
@@ -12,4 +15,19 @@ class Message(Base):
 
     __table_args__ = (
         Index("idx_user_created_at", "user_id", "created_at"),
-    )
\ No newline at end of file
+        # Serves history paging and context lookups (WHERE user_id = ? ORDER BY id)
+        Index("idx_user_id_id", "user_id", "id"),
+    )
+
+
+class MessageRow(NamedTuple):
+    """
+    The columns history pages return, read as plain tuples instead of ORM objects.
+    """
+    id: int
+    sender: str
+    content: str
+    created_at: datetime | None
+
+
+HISTORY_COLUMNS = (Message.id, Message.sender, Message.content, Message.created_at)
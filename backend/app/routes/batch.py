@@ -0,0 +1,43 @@
+from fastapi import APIRouter
+
+from app.dto.base_response import APIResponse, APIError
+from app.dto.batch_dto import BatchJobRequest
+from app.services.batch_service import BatchService, BatchTurn
+
+router = APIRouter(prefix="/chat/batch", tags=["Batch"])
+
+
+@router.post("", response_model=APIResponse[dict])
+async def start_batch(payload: BatchJobRequest):
+    """
+    Starts answering every item like /chat/message, in the background of this
+    worker, and returns the job's report. Poll GET /chat/batch/{job_id} for
+    progress; posting the same job again resumes it after a restart.
+    """
+    if any(not item.message.strip() for item in payload.items):
+        return APIResponse(
+            status=False,
+            message="Validation error",
+            error=APIError(
+                code="EMPTY_MESSAGE",
+                detail="Messages cannot be empty"
+            )
+        )
+
+    turns = [BatchTurn(i, item.user_id, item.message) for i, item in enumerate(payload.items)]
+    return APIResponse(status=True, message="Batch job started", data=BatchService.start(payload.job_id, turns))
+
+
+@router.get("/{job_id}", response_model=APIResponse[dict])
+async def batch_status(job_id: str):
+    report = await BatchService.status(job_id)
+    if report is None:
+        return APIResponse(
+            status=False,
+            message="Not found",
+            error=APIError(
+                code="UNKNOWN_JOB",
+                detail="No batch job with this id"
+            )
+        )
+    return APIResponse(status=True, message="Batch job status", data=report)
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends
+import json
+from fastapi import APIRouter, Depends, Header, Request
+from fastapi.responses import StreamingResponse
 from typing import Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from config.database import get_db
+from config.database import db_session, get_db
 from app.services.chat_service import ChatService
 from app.services.history_service import HistoryService
 from app.dto.chat_dto import (
@@ -13,6 +15,10 @@ from app.dto.chat_dto import (
     ChatHistoryDTO
 )
 from app.dto.base_response import APIResponse, APIError
+from app.core.history_index import HISTORY_INDEX_VERIFY, history_index
+from app.utils.cursor import encode_cursor, decode_cursor
+from app.utils.http_cache import history_validators, not_modified
+from app.utils.json_response import api_json, dumps, history_json, message_json
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
@@ -37,7 +43,7 @@ async def init_chat(payload: ChatInitRequest, db: AsyncSession = Depends(get_db)
 
 
 @router.post("/message", response_model=APIResponse[MessageDTO])
-async def send_message(payload: ChatMessageRequest, db: AsyncSession = Depends(get_db)):
+async def send_message(payload: ChatMessageRequest, idempotency_key: Optional[str] = Header(None)):
     if not payload.message.strip():
         return APIResponse(
             status=False,
@@ -48,38 +54,107 @@ async def send_message(payload: ChatMessageRequest, db: AsyncSession = Depends(g
             )
         )
 
-    msg = await ChatService.send_message(db=db, user_id=payload.user_id, user_message=payload.message)
+    # ChatService opens its own short sessions, none is held across the LLM call.
+    # A retry with the same Idempotency-Key gets the first attempt's reply
+    msg = await ChatService.send_message(
+        user_id=payload.user_id, user_message=payload.message, idempotency_key=idempotency_key
+    )
+    if msg is None:
+        # The turn failed before storing a reply, and so did the attempt this one waited on
+        return APIResponse(
+            status=False,
+            message="Processing error",
+            error=APIError(
+                code="MESSAGE_FAILED",
+                detail="Message could not be processed"
+            )
+        )
 
-    return APIResponse(
-        status=True,
-        message="Message processed successfully",
-        data=MessageDTO(
-            id=msg.id,
-            sender=msg.sender,
-            content=msg.content,
-            created_at=msg.created_at
+    return api_json("Message processed successfully", message_json(msg))
+
+
+def _sse(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+@router.post("/message/stream")
+async def stream_message(payload: ChatMessageRequest, idempotency_key: Optional[str] = Header(None)):
+    """
+    Server-Sent Events variant of /chat/message: `token` events carry text
+    chunks as they arrive, a final `done` event carries the stored message.
+    """
+    if not payload.message.strip():
+        return APIResponse(
+            status=False,
+            message="Validation error",
+            error=APIError(
+                code="EMPTY_MESSAGE",
+                detail="Message cannot be empty"
+            )
         )
+
+    async def event_stream():
+        done = False
+        async for event, data in ChatService.stream_message(
+            user_id=payload.user_id, user_message=payload.message, idempotency_key=idempotency_key
+        ):
+            if event == "token":
+                yield _sse("token", json.dumps({"text": data}))
+            else:
+                done = True
+                yield _sse("done", dumps(message_json(data)).decode())
+
+        if not done:
+            yield _sse("error", APIError(
+                code="STREAM_FAILED",
+                detail="Message could not be processed"
+            ).model_dump_json())
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
 
 @router.get("/history", response_model=APIResponse[ChatHistoryDTO])
-async def get_history(user_id: int, before_id: Optional[int] = None, limit: int = 20, db: AsyncSession = Depends(get_db)):
-    messages, has_more = await HistoryService.get_history(db, user_id, before_id, limit)
-
-    msg_dtos = [
-        MessageDTO(
-            id=m.id,
-            sender=m.sender,
-            content=m.content,
-            created_at=m.created_at
-        ) for m in messages
-    ]
+async def get_history(request: Request, user_id: int, cursor: Optional[str] = None, limit: int = 20):
+    before_id = None
+    if cursor:
+        try:
+            before_id = decode_cursor(cursor)
+        except ValueError:
+            return APIResponse(
+                status=False,
+                message="Validation error",
+                error=APIError(
+                    code="INVALID_CURSOR",
+                    detail="Cursor is malformed"
+                )
+            )
 
-    return APIResponse(
-        status=True,
-        message="History fetched successfully",
-        data=ChatHistoryDTO(
-            messages=msg_dtos,
-            has_more=has_more
-        )
-    )
+    # An unchanged poll is answered from the in-memory index, no DB session
+    latest = None if HISTORY_INDEX_VERIFY else history_index.get(user_id)
+    if latest is not None:
+        validators = history_validators(latest, before_id, limit)
+        if (response := not_modified(request, validators)) is not None:
+            return response
+
+    async with db_session() as db:
+        if latest is None:
+            latest = await HistoryService.get_latest_message(db, user_id)
+            history_index.set(user_id, latest)
+            validators = history_validators(latest, before_id, limit)
+            if (response := not_modified(request, validators)) is not None:
+                return response
+
+        messages, has_more = await HistoryService.get_history(db, user_id, before_id, limit)
+
+    # Rows go straight to JSON bytes, no DTO per message and no second validation pass
+    response = api_json("History fetched successfully", {
+        "messages": history_json(messages),
+        "has_more": has_more,
+        "next_cursor": encode_cursor(messages[0].id) if has_more else None
+    })
+    response.headers.update(validators)
+    return response
@@ -1,5 +1,15 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
 from app.dto.base_response import APIResponse
+from app.core.db_writer import db_writer
+from app.core.history_index import history_index
+from app.core.inflight import inflight_turns
+from app.core.llm_gateway import llm_gateway
+from app.core.memori import memori_timings
+from app.core.memory_writer import memory_writer
+from app.core.pubsub import broker
+from app.core.response_cache import response_cache
+from app.core.startup import readiness
 from datetime import datetime
 
 router = APIRouter(prefix="/health", tags=["Health"])
@@ -12,6 +22,25 @@ async def health_check():
         message="Service is healthy",
         data={
             "service": "disha-api",
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": datetime.utcnow().isoformat(),
+            "response_cache": response_cache.stats(),
+            "memori": memori_timings.stats(),
+            "memory_writer": memory_writer.stats(),
+            "db_writer": db_writer.stats(),
+            "chat_turns": inflight_turns.stats(),
+            "history_index": history_index.stats(),
+            "push": broker.stats(),
+            "llm_gateway": llm_gateway.stats()
         }
     )
+
+
+@router.get("/ready", response_model=APIResponse[dict])
+async def readiness_check():
+    # Load balancers route to this worker only once its pools are warm
+    if not readiness.ready:
+        return JSONResponse(
+            status_code=503,
+            content={"status": False, "message": "Service is starting", "data": readiness.stats()}
+        )
+    return APIResponse(status=True, message="Service is ready", data=readiness.stats())
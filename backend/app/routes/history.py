@@ -1,31 +1,55 @@
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, Query, Request
 
-from config.database import get_db
+from config.database import db_session
 from app.services.history_service import HistoryService
-from app.dto.history_dto import HistoryData, HistoryMessageDTO
-from app.dto.base_response import APIResponse
+from app.dto.history_dto import HistoryData
+from app.dto.base_response import APIResponse, APIError
+from app.core.history_index import HISTORY_INDEX_VERIFY, history_index
+from app.utils.cursor import encode_cursor, decode_cursor
+from app.utils.http_cache import history_validators, not_modified
+from app.utils.json_response import api_json, history_json
 
 router = APIRouter(prefix="/chat", tags=["History"])
 
 
 @router.get("/history", response_model=APIResponse[HistoryData])
-async def get_chat_history(user_id: int, before_id: int | None = Query(None), limit: int = Query(20, le=50), db: AsyncSession = Depends(get_db)):
-    messages, has_more = await HistoryService.get_history(db, user_id, before_id, limit)
-
-    return APIResponse(
-        status=True,
-        message="Chat history fetched successfully",
-        data=HistoryData(
-            messages=[
-                HistoryMessageDTO(
-                    id=m.id,
-                    sender=m.sender,
-                    content=m.content,
-                    created_at=m.created_at
+async def get_chat_history(request: Request, user_id: int, cursor: str | None = Query(None), limit: int = Query(20, le=50)):
+    before_id = None
+    if cursor:
+        try:
+            before_id = decode_cursor(cursor)
+        except ValueError:
+            return APIResponse(
+                status=False,
+                message="Validation error",
+                error=APIError(
+                    code="INVALID_CURSOR",
+                    detail="Cursor is malformed"
                 )
-                for m in messages
-            ],
-            has_more=has_more
-        )
-    )
+            )
+
+    # An unchanged poll is answered from the in-memory index, no DB session
+    latest = None if HISTORY_INDEX_VERIFY else history_index.get(user_id)
+    if latest is not None:
+        validators = history_validators(latest, before_id, limit)
+        if (response := not_modified(request, validators)) is not None:
+            return response
+
+    async with db_session() as db:
+        if latest is None:
+            latest = await HistoryService.get_latest_message(db, user_id)
+            history_index.set(user_id, latest)
+            validators = history_validators(latest, before_id, limit)
+            if (response := not_modified(request, validators)) is not None:
+                return response
+
+        messages, has_more = await HistoryService.get_history(db, user_id, before_id, limit)
+
+    # Rows go straight to JSON bytes, no DTO per message and no second validation pass
+    response = api_json("Chat history fetched successfully", {
+        "messages": history_json(messages),
+        "has_more": has_more,
+        "next_cursor": encode_cursor(messages[0].id) if has_more else None
+    })
+    response.headers.update(validators)
+    return response
@@ -0,0 +1,44 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core.db_writer import db_writer
+from app.core.llm_gateway import llm_gateway
+from app.core.memory_writer import memory_writer
+from app.core.metrics import GaugeCallback, render_metrics
+from app.core.pubsub import broker
+from app.core.response_cache import response_cache
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+GaugeCallback(
+    "disha_response_cache", "Response cache counters",
+    lambda: {(k,): v for k, v in response_cache.stats().items() if k != "enabled"},
+    ("stat",)
+)
+GaugeCallback(
+    "disha_memory_writer", "Memori write-behind queue counters",
+    lambda: {(k,): v for k, v in memory_writer.stats().items()},
+    ("stat",)
+)
+
+GaugeCallback(
+    "disha_db_writer", "SQLite write queue counters",
+    lambda: {(k,): v for k, v in db_writer.stats().items() if k != "enabled"},
+    ("stat",)
+)
+GaugeCallback(
+    "disha_push", "WebSocket push connections and delivery counters",
+    lambda: {(k,): v for k, v in broker.stats().items() if k != "broker"},
+    ("stat",)
+)
+GaugeCallback(
+    "disha_llm_gateway", "LLM gateway counters, open is 1 while the circuit is not closed",
+    lambda: {(k,): v for k, v in llm_gateway.stats().items() if k != "state"},
+    ("stat",)
+)
+
+
+@router.get("", response_class=PlainTextResponse)
+async def metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
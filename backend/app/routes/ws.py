@@ -0,0 +1,60 @@
+import asyncio
+import logging
+import traceback
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+
+from config.database import db_session
+from app.core.pubsub import PUSH_QUEUE_SIZE, broker
+from app.services.history_service import HistoryService
+from app.utils.json_response import dumps, history_json
+
+router = APIRouter(prefix="/chat", tags=["Push"])
+
+
+@router.websocket("/ws")
+async def push_messages(websocket: WebSocket, user_id: int, after_id: int = 0):
+    """
+    Pushes every message stored for the user as {"event": "message", "data": {...}},
+    the same shape as a /chat/history entry, in place of polling the history.
+    A reconnecting client passes the last id it has as `after_id` and first
+    gets what it missed; if that is more than a queue's worth it gets
+    {"event": "resync"} and should reload the history instead.
+    """
+    await websocket.accept()
+
+    async def send(payload: dict):
+        await websocket.send_text(dumps({"event": "message", "data": payload}).decode())
+
+    def on_overflow():
+        # The client stopped reading, it reconnects with after_id once it catches up
+        asyncio.create_task(websocket.close(code=status.WS_1013_TRY_AGAIN_LATER))
+
+    # Subscribed before the catch-up read, so nothing stored in between is lost
+    subscription = broker.subscribe(user_id, send, on_overflow, after_id)
+    try:
+        backlog = []
+        if after_id:
+            async with db_session() as db:
+                rows = await HistoryService.get_messages_after(db, user_id, after_id, PUSH_QUEUE_SIZE + 1)
+            if len(rows) > PUSH_QUEUE_SIZE:
+                await websocket.send_text('{"event":"resync"}')
+            else:
+                backlog = history_json(rows)
+        subscription.resume(backlog)
+
+        # Idle until the client goes away, anything it sends is ignored
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        # Get the traceback as a string
+        traceback_str = traceback.format_exc()
+        logging.error(traceback_str)
+
+        # Get the line number of the exception
+        line_no = traceback.extract_tb(e.__traceback__)[-1][1]
+        logging.error(f"Exception occurred on line {line_no}")
+    finally:
+        broker.unsubscribe(subscription)
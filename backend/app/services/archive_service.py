@@ -0,0 +1,255 @@
+"""
+Moves old conversation history out of the hot `messages` table into
+per-user gzip-compressed JSON-lines segments, optionally condensing the
+archived turns into a stored summary used in the LLM context.
+
+Runs every ARCHIVE_INTERVAL seconds inside the app when set, or once from
+cron / a deploy job (preferred with several workers):
+
+    python -m app.services.archive_service --older-than-days 30
+"""
+import os
+import gzip
+import json
+import time
+import asyncio
+import logging
+import argparse
+import traceback
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.context_cache import CONTEXT_CACHE_TURNS
+from app.core.db_writer import db_writer
+from app.helper.llm_helper import generate_plain
+from app.models.archive import ArchiveSegment, ConversationSummary
+from app.models.message import Message, MessageRow
+from config.database import db_session, engine
+
+load_dotenv(verbose=True)
+
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", 30))
+# Newest turns per user that always stay hot, whatever their age. Never fewer
+# than the context cache holds, so prompts never need the archive
+ARCHIVE_KEEP_TURNS = max(int(os.getenv("ARCHIVE_KEEP_TURNS", 20)), CONTEXT_CACHE_TURNS)
+ARCHIVE_SEGMENT_SIZE = int(os.getenv("ARCHIVE_SEGMENT_SIZE", 500))
+# Seconds between in-app compaction runs, 0 leaves it to the CLI
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", 0))
+ARCHIVE_SUMMARIZE = os.getenv("ARCHIVE_SUMMARIZE", "0") == "1"
+# Archived text sent to the summariser per run, newest turns win
+ARCHIVE_SUMMARY_INPUT_CHARS = int(os.getenv("ARCHIVE_SUMMARY_INPUT_CHARS", 20000))
+
+SUMMARY_INSTRUCTION = (
+    "You maintain notes for a health coach about one user. Merge the existing notes "
+    "with the conversation below into updated notes: health facts, conditions, "
+    "medications, goals, habits, symptoms discussed and advice given. Plain "
+    "sentences, under 200 words, no greeting."
+)
+
+
+def encode_segment(messages: list[Message]) -> bytes:
+    lines = [
+        json.dumps({
+            "id": m.id,
+            "sender": m.sender,
+            "content": m.content,
+            "created_at": m.created_at.isoformat() if m.created_at else None
+        }, ensure_ascii=False)
+        for m in messages
+    ]
+    return gzip.compress("\n".join(lines).encode("utf-8"))
+
+
+def decode_segment(segment: ArchiveSegment) -> list[dict]:
+    return [json.loads(line) for line in gzip.decompress(segment.data).decode("utf-8").splitlines()]
+
+
+def archived_row(row: dict) -> MessageRow:
+    return MessageRow(
+        row["id"],
+        row["sender"],
+        row["content"],
+        datetime.fromisoformat(row["created_at"]) if row["created_at"] else None
+    )
+
+
+class ArchiveService:
+    @staticmethod
+    async def archive_user(db: AsyncSession, user_id: int, cutoff: datetime) -> list[Message]:
+        """
+        Moves the user's messages older than `cutoff`, except the newest
+        ARCHIVE_KEEP_TURNS, into segments. Does not commit. Returns the
+        archived messages.
+        """
+        keep_from = (await db.execute(
+            select(Message.id).where(Message.user_id == user_id)
+            .order_by(Message.id.desc()).offset(ARCHIVE_KEEP_TURNS - 1).limit(1)
+        )).scalar()
+        if keep_from is None:
+            return []
+
+        messages = (await db.execute(
+            select(Message).where(
+                Message.user_id == user_id,
+                Message.id < keep_from,
+                Message.created_at < cutoff
+            ).order_by(Message.id)
+        )).scalars().all()
+        if not messages:
+            return []
+
+        for i in range(0, len(messages), ARCHIVE_SEGMENT_SIZE):
+            chunk = messages[i:i + ARCHIVE_SEGMENT_SIZE]
+            db.add(ArchiveSegment(
+                user_id=user_id,
+                first_id=chunk[0].id,
+                last_id=chunk[-1].id,
+                message_count=len(chunk),
+                data=encode_segment(chunk)
+            ))
+
+        archived_ids = [m.id for m in messages]
+        deleted = await db.execute(
+            delete(Message).where(
+                Message.user_id == user_id,
+                Message.id >= archived_ids[0],
+                Message.id <= archived_ids[-1],
+                Message.created_at < cutoff
+            ).execution_options(synchronize_session=False)
+        )
+        # Another archiver got here first, its segments already hold these rows
+        if deleted.rowcount != len(archived_ids):
+            raise RuntimeError(f"Archive of user {user_id} raced with another run, rolled back")
+
+        for m in messages:
+            db.expunge(m)
+        return list(messages)
+
+    @staticmethod
+    async def get_archived(db: AsyncSession, user_id: int, before_id: int | None, limit: int) -> list[MessageRow]:
+        """
+        Up to `limit` archived messages older than `before_id`, newest first,
+        decompressing only the segments needed.
+        """
+        found: list[MessageRow] = []
+        upper = before_id
+        while len(found) < limit:
+            query = select(ArchiveSegment).where(ArchiveSegment.user_id == user_id)
+            if upper is not None:
+                query = query.where(ArchiveSegment.first_id < upper)
+            segment = (await db.execute(query.order_by(ArchiveSegment.last_id.desc()).limit(1))).scalars().first()
+            if segment is None:
+                break
+
+            older = [row for row in decode_segment(segment) if upper is None or row["id"] < upper]
+            # Only the rows this page needs are converted
+            for row in reversed(older[-(limit - len(found)):]):
+                found.append(archived_row(row))
+            upper = segment.first_id
+
+        return found
+
+    @staticmethod
+    async def get_summary(db: AsyncSession, user_id: int) -> str | None:
+        summary = await db.get(ConversationSummary, user_id)
+        return summary.summary if summary else None
+
+    @staticmethod
+    async def summarize(user_id: int, archived: list[Message]):
+        """
+        Folds newly archived turns into the user's stored summary.
+        """
+        async with db_session() as db:
+            previous = await ArchiveService.get_summary(db, user_id)
+
+        transcript, size = [], 0
+        for m in reversed(archived):
+            line = f"{m.sender}: {m.content}"
+            size += len(line)
+            if size > ARCHIVE_SUMMARY_INPUT_CHARS:
+                break
+            transcript.append(line)
+        transcript.reverse()
+
+        response = await generate_plain([{
+            "role": "user",
+            "parts": [{"text": f"Existing notes:\n{previous or '(none)'}\n\nConversation:\n" + "\n".join(transcript)}]
+        }], SUMMARY_INSTRUCTION)
+        if not response.text:
+            return
+
+        async def store(write_db: AsyncSession):
+            await write_db.merge(ConversationSummary(
+                user_id=user_id, summary=response.text.strip(), through_id=archived[-1].id
+            ))
+
+        await db_writer.write(store)
+
+    @staticmethod
+    async def compact(older_than_days: float = ARCHIVE_AFTER_DAYS, summarize: bool = ARCHIVE_SUMMARIZE) -> dict:
+        """
+        One compaction pass over every user with messages older than the cutoff.
+        """
+        cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+        async with db_session() as db:
+            user_ids = (await db.execute(
+                select(Message.user_id).where(Message.created_at < cutoff).distinct()
+            )).scalars().all()
+
+        stats = {"users": 0, "messages": 0, "failed": 0}
+        for user_id in user_ids:
+            try:
+                archived = await db_writer.write(
+                    lambda write_db, user_id=user_id: ArchiveService.archive_user(write_db, user_id, cutoff)
+                )
+                if not archived:
+                    continue
+                stats["users"] += 1
+                stats["messages"] += len(archived)
+
+                if summarize:
+                    await ArchiveService.summarize(user_id, archived)
+            except Exception as e:
+                stats["failed"] += 1
+                traceback_str = traceback.format_exc()
+                logging.error(traceback_str)
+
+                line_no = traceback.extract_tb(e.__traceback__)[-1][1]
+                logging.error(f"Exception occurred on line {line_no}")
+
+        return stats
+
+    @staticmethod
+    async def run_periodically(interval: float = ARCHIVE_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            start = time.perf_counter()
+            try:
+                stats = await ArchiveService.compact()
+            except Exception:
+                # Keep the schedule, the next pass retries
+                logging.error(traceback.format_exc())
+                continue
+            if stats["users"] or stats["failed"]:
+                logging.warning(f"Archived history in {time.perf_counter() - start:.1f}s: {stats}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old conversation history")
+    parser.add_argument("--older-than-days", type=float, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--summarize", action="store_true", default=ARCHIVE_SUMMARIZE)
+    args = parser.parse_args()
+
+    async def main():
+        try:
+            return await ArchiveService.compact(args.older_than_days, args.summarize)
+        finally:
+            # aiosqlite connection threads keep the process alive until closed
+            await engine.dispose()
+
+    start = time.perf_counter()
+    print(asyncio.run(main()))
+    print(f"Compaction done in {time.perf_counter() - start:.2f}s")
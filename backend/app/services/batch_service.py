@@ -0,0 +1,349 @@
+"""
+Chat turns for many users in one job, for offline campaigns such as a
+nightly check-in nudge. Every item is a (user_id, message) pair answered
+like /chat/message, but per chunk of BATCH_CHUNK_SIZE items the context of
+all its users is read in one query and Gemini is called BATCH_CONCURRENCY at
+a time. Each answered item is stored with its `batch_items` progress record
+in one transaction, so running a job again under the same id resumes it:
+stored items are skipped, failed ones are retried. With the SQLite write
+queue the items stored together share a commit.
+
+Each item holds its user's chat turn, like a /chat/message call, from
+checking its context until its messages are stored: a live turn of that
+user waits for the item and the item for the live turn, nobody waits for the
+rest of the chunk. Like those, this only orders turns within one process.
+
+Runs inside the API (POST /chat/batch), which keeps that worker's caches and
+push connections current, or from cron with one {"user_id": ..., "message": ...}
+object per input line:
+
+    python -m app.services.batch_service nudges.jsonl --job-id checkin-2026-10-18
+
+A separate process cannot update the API's in-memory caches, so with a
+single API worker set CONTEXT_CACHE_VERIFY=1 and HISTORY_INDEX_VERIFY=1
+(the multi-worker default) before using the CLI.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import argparse
+import traceback
+from typing import Iterator, NamedTuple
+
+from dotenv import load_dotenv
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.context_budget import CONTEXT_MAX_TURNS
+from app.core.context_cache import ContextTurn, context_cache
+from app.core.db_writer import db_writer
+from app.core.history_index import history_index
+from app.core.inflight import inflight_turns
+from app.core.memori import check_memori_internals, memori_executor
+from app.core.memory_writer import memory_writer
+from app.core.metrics import CHAT_STAGE_SECONDS
+from app.core.pubsub import broker
+from app.core.response_cache import response_cache
+from app.helper.llm_helper import gemini_pool, generate_content
+from app.models.archive import ConversationSummary
+from app.models.batch import BatchItem
+from app.models.message import Message
+from app.services.archive_service import ARCHIVE_SUMMARIZE
+from app.services.chat_service import ChatService
+from config.database import db_session, engine
+
+load_dotenv(verbose=True)
+
+# Gemini calls in flight per job, on top of the pool's LLM_MAX_CONCURRENCY cap
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 16))
+# Items per context query
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", 500))
+# Finished jobs whose report this worker keeps, older ones are answered from the DB
+BATCH_FINISHED_JOBS = int(os.getenv("BATCH_FINISHED_JOBS", 100))
+
+
+class BatchTurn(NamedTuple):
+    # Position in the job's input, identifies the item when resuming
+    item: int
+    user_id: int
+    message: str
+
+
+def read_turns(path: str) -> list[BatchTurn]:
+    with open(path, encoding="utf-8") as f:
+        return [
+            BatchTurn(item, int(entry["user_id"]), entry["message"])
+            for item, entry in enumerate(json.loads(line) for line in f if line.strip())
+        ]
+
+
+def chunked(turns: list[BatchTurn], size: int) -> Iterator[list[BatchTurn]]:
+    """
+    Consecutive runs of at most `size` turns with one turn per user, so a
+    user's later turn is answered with the earlier one in its context.
+    """
+    chunk, users = [], set()
+    for turn in turns:
+        if len(chunk) == size or turn.user_id in users:
+            yield chunk
+            chunk, users = [], set()
+        chunk.append(turn)
+        users.add(turn.user_id)
+    if chunk:
+        yield chunk
+
+
+def new_report(job_id: str, items: int) -> dict:
+    return {
+        "job_id": job_id,
+        "running": True,
+        "items": items,
+        "skipped": 0,
+        "stored": 0,
+        "failed": 0,
+        "chunks": 0,
+        "elapsed": 0.0,
+        "items_per_second": 0.0,
+        # Time spent per stage, summed over items that run concurrently
+        "seconds": {"context": 0.0, "llm": 0.0, "store": 0.0}
+    }
+
+
+# Jobs started in this worker, by id
+_jobs: dict[str, tuple[asyncio.Task, dict]] = {}
+
+
+class BatchService:
+    @staticmethod
+    async def load_contexts(db: AsyncSession, user_ids: list[int]):
+        """
+        The newest CONTEXT_MAX_TURNS turns of every user (oldest first) in one
+        query, plus their summaries of archived turns.
+        """
+        ranked = select(
+            Message.user_id, Message.id, Message.sender, Message.content,
+            func.row_number().over(partition_by=Message.user_id, order_by=Message.id.desc()).label("rank")
+        ).where(Message.user_id.in_(user_ids)).subquery()
+        rows = await db.execute(
+            select(ranked.c.user_id, ranked.c.id, ranked.c.sender, ranked.c.content)
+            .where(ranked.c.rank <= CONTEXT_MAX_TURNS)
+            .order_by(ranked.c.user_id, ranked.c.id)
+        )
+
+        contexts = {user_id: [] for user_id in user_ids}
+        for user_id, id, sender, content in rows:
+            contexts[user_id].append(ContextTurn(id, sender, content))
+
+        summaries = {}
+        if ARCHIVE_SUMMARIZE:
+            summaries = dict((await db.execute(
+                select(ConversationSummary.user_id, ConversationSummary.summary)
+                .where(ConversationSummary.user_id.in_(user_ids))
+            )).all())
+        return contexts, summaries
+
+    @staticmethod
+    async def reply(turn: BatchTurn, history: list, summary: str | None) -> str | None:
+        """
+        Gemini's reply to one turn, or None if the call failed or was blocked.
+        Unlike a live chat no apology is stored, the item stays pending for
+        the next run of the job.
+        """
+        contents, system_content, cache_key = ChatService.prompt_from_history(
+            turn.user_id, turn.message, history, summary
+        )
+        cached_reply = response_cache.get(cache_key) if cache_key else None
+        if cached_reply is not None:
+            return cached_reply
+
+        try:
+            with CHAT_STAGE_SECONDS.time("llm"):
+                response = await generate_content(turn.user_id, contents, system_content)
+        except Exception as e:
+            logging.error(f"Batch item {turn.item} for user {turn.user_id} failed: {e}")
+            return None
+
+        if not response.text:
+            logging.error(f"Batch item {turn.item} for user {turn.user_id} got no text, left pending")
+            return None
+        if cache_key:
+            response_cache.put(cache_key, response.text)
+        return response.text
+
+    @staticmethod
+    async def store(job_id: str, turn: BatchTurn, reply: str) -> list[Message]:
+        """
+        Inserts the turn's user and assistant message and its progress record
+        in one transaction. Returns the (user, assistant) messages.
+        """
+        rows = [
+            {"user_id": turn.user_id, "sender": "user", "content": turn.message},
+            {"user_id": turn.user_id, "sender": "assistant", "content": reply}
+        ]
+
+        async def insert_turn(write_db: AsyncSession) -> list[Message]:
+            stored = await ChatService.insert_messages(write_db, rows)
+            await write_db.execute(insert(BatchItem), [
+                {"job_id": job_id, "item": turn.item, "user_id": turn.user_id, "message_id": stored[1].id}
+            ])
+            return stored
+
+        return await db_writer.write(insert_turn)
+
+    @staticmethod
+    async def answer(job_id: str, turn: BatchTurn, history: list, summary: str | None,
+                     limit: asyncio.Semaphore, report: dict) -> bool:
+        """
+        Answers and stores one turn within its user's chat turn. `history` is
+        the chunk's read of the context, read again if a live turn stored
+        messages since. Returns whether the turn was stored.
+        """
+        async with limit, inflight_turns.turn(turn.user_id, f"batch:{job_id}:{turn.item}"):
+            latest = history_index.peek(turn.user_id)
+            if latest is not None and latest.id > (history[-1].id if history else 0):
+                stage = time.perf_counter()
+                async with db_session() as db:
+                    contexts, summaries = await BatchService.load_contexts(db, [turn.user_id])
+                history, summary = contexts[turn.user_id], summaries.get(turn.user_id)
+                report["seconds"]["context"] += time.perf_counter() - stage
+
+            stage = time.perf_counter()
+            reply = await BatchService.reply(turn, history, summary)
+            report["seconds"]["llm"] += time.perf_counter() - stage
+            if reply is None:
+                return False
+
+            stage = time.perf_counter()
+            try:
+                stored = await BatchService.store(job_id, turn, reply)
+            except Exception as e:
+                # Nothing of the item was committed, a rerun retries it
+                traceback_str = traceback.format_exc()
+                logging.error(traceback_str)
+
+                line_no = traceback.extract_tb(e.__traceback__)[-1][1]
+                logging.error(f"Exception occurred on line {line_no}")
+                return False
+            finally:
+                report["seconds"]["store"] += time.perf_counter() - stage
+
+            context_cache.append(turn.user_id, stored)
+            history_index.note(turn.user_id, stored)
+            broker.publish(turn.user_id, stored)
+            return True
+
+    @staticmethod
+    async def run(job_id: str, turns: list[BatchTurn], concurrency: int = BATCH_CONCURRENCY,
+                  chunk_size: int = BATCH_CHUNK_SIZE, report: dict | None = None) -> dict:
+        """
+        Answers and stores every turn not already stored under `job_id`.
+        `report` is filled in as chunks complete.
+        """
+        report = report if report is not None else new_report(job_id, len(turns))
+        start = time.perf_counter()
+        try:
+            async with db_session() as db:
+                done = set((await db.execute(
+                    select(BatchItem.item).where(BatchItem.job_id == job_id)
+                )).scalars())
+            pending = [turn for turn in turns if turn.item not in done]
+            report["skipped"] = len(turns) - len(pending)
+
+            limit = asyncio.Semaphore(concurrency)
+            for chunk in chunked(pending, chunk_size):
+                stage = time.perf_counter()
+                async with db_session() as db:
+                    contexts, summaries = await BatchService.load_contexts(db, [turn.user_id for turn in chunk])
+                report["seconds"]["context"] += time.perf_counter() - stage
+
+                stored = await asyncio.gather(*[
+                    BatchService.answer(job_id, turn, contexts[turn.user_id], summaries.get(turn.user_id), limit, report)
+                    for turn in chunk
+                ])
+                report["stored"] += sum(stored)
+                report["failed"] += len(chunk) - sum(stored)
+                report["chunks"] += 1
+                report["elapsed"] = time.perf_counter() - start
+                report["items_per_second"] = report["stored"] / report["elapsed"]
+                logging.warning(
+                    f"Batch {job_id}: {report['skipped'] + report['stored']}/{len(turns)} stored, "
+                    f"{report['failed']} failed, {report['items_per_second']:.1f} items/s"
+                )
+        finally:
+            report["running"] = False
+            report["elapsed"] = time.perf_counter() - start
+        return report
+
+    @staticmethod
+    def start(job_id: str, turns: list[BatchTurn]) -> dict:
+        """
+        Runs the job in the background of this worker and returns its live
+        report. Starting a job that is still running returns its report.
+        """
+        job = _jobs.get(job_id)
+        if job is not None and not job[0].done():
+            return job[1]
+
+        # Oldest first, a restarted job moves to the end
+        _jobs.pop(job_id, None)
+        finished = [finished_id for finished_id, (task, _) in _jobs.items() if task.done()]
+        for finished_id in finished[:max(0, len(finished) - BATCH_FINISHED_JOBS)]:
+            del _jobs[finished_id]
+
+        report = new_report(job_id, len(turns))
+        _jobs[job_id] = (asyncio.create_task(BatchService.run(job_id, turns, report=report)), report)
+        return report
+
+    @staticmethod
+    async def status(job_id: str) -> dict | None:
+        """
+        The live report of a job started in this worker, else what the DB
+        records of it. Only the latter takes a DB session.
+        """
+        job = _jobs.get(job_id)
+        if job is not None:
+            return job[1]
+
+        async with db_session() as db:
+            stored = (await db.execute(
+                select(func.count()).select_from(BatchItem).where(BatchItem.job_id == job_id)
+            )).scalar()
+        return {"job_id": job_id, "running": False, "stored": stored} if stored else None
+
+    @staticmethod
+    async def cancel():
+        """
+        Stops this worker's running jobs. Their finished chunks stay stored,
+        starting the job again resumes it.
+        """
+        tasks = [task for task, _ in _jobs.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer many chat turns in one job")
+    parser.add_argument("input", help='JSON lines of {"user_id": ..., "message": ...}')
+    parser.add_argument("--job-id", required=True, help="Running a job id again resumes it")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--chunk-size", type=int, default=BATCH_CHUNK_SIZE)
+    args = parser.parse_args()
+    check_memori_internals()
+
+    async def main():
+        memory_writer.start(gemini_pool)
+        try:
+            return await BatchService.run(args.job_id, read_turns(args.input), args.concurrency, args.chunk_size)
+        finally:
+            await memory_writer.close()
+            # aiosqlite connection threads keep the process alive until closed
+            await engine.dispose()
+
+    report = asyncio.run(main())
+    memori_executor.shutdown(wait=True)
+    print(json.dumps(report, indent=2))
+    # Non-zero so cron notices, running the same job id again retries the failures
+    raise SystemExit(1 if report["failed"] else 0)
@@ -1,49 +1,81 @@
+import asyncio
 import logging
 import traceback
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from google.genai import types
+from sqlalchemy import select, insert
 
 from app.models.user import User
 from app.models.message import Message
-from app.helper.llm_helper import gemini_llm_with_memory
-from app.utils.loader import load_system_prompt
+from app.core.context_budget import CONTEXT_MAX_TURNS, build_context
+from app.core.context_cache import context_cache
+from app.core.db_writer import db_writer
+from app.core.history_index import history_index
+from app.core.inflight import inflight_turns, turn_key
+from app.core.llm_gateway import classify
+from app.core.metrics import CHAT_STAGE_SECONDS, CONTEXT_TURNS, PROMPT_TOKENS
+from app.core.pubsub import broker
+from app.core.response_cache import (
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_MAX_CONTEXT_TURNS, response_cache, response_cache_key
+)
+from app.helper.llm_helper import generate_content, stream_content
+from app.utils.loader import load_system_prompt, prompt_version_for
 from app.services.protocol_service import ProtocolService
 from app.services.history_service import HistoryService
+from app.services.archive_service import ARCHIVE_SUMMARIZE, ArchiveService
+from config.database import db_session
 
 
 class ChatService:
+    @staticmethod
+    async def insert_messages(db: AsyncSession, rows: list[dict]) -> list[Message]:
+        """
+        Inserts the rows and reads the generated id and created_at back via
+        RETURNING instead of a refresh per row. Does not commit.
+        """
+        # RETURNING order is not guaranteed, SQLAlchemy matches the rows to
+        # their parameters: in batched statements where the dialect can
+        # (PostgreSQL), one row per statement where it cannot (SQLite)
+        result = await db.execute(
+            insert(Message).returning(Message.id, Message.created_at, sort_by_parameter_order=True),
+            rows
+        )
+
+        return [
+            Message(id=r.id, created_at=r.created_at, **row)
+            for row, r in zip(rows, result.all())
+        ]
+
     @staticmethod
     async def init_chat(db: AsyncSession, user_id: int | None):
         try:
             if user_id:
                 result = await db.execute(
-                    select(Message).where(Message.user_id == user_id).order_by(Message.id.desc())
+                    select(Message).where(Message.user_id == user_id).order_by(Message.id.desc()).limit(1)
                 )
                 existing_message = result.scalars().first()
                 if existing_message:
                     return existing_message, user_id
 
-            # Create new user
-            user = User()
-            db.add(user)
-            await db.commit()
-            await db.refresh(user)
-
             # Simple greeting, let LLM take over for onboarding questions
             onboarding_text = "Hi! I'm Disha, your AI health coach 😊"
 
-            message = Message(
-                user_id=user.id,
-                sender="assistant",
-                content=onboarding_text
-            )
-            db.add(message)
-            await db.commit()
-            await db.refresh(message)
+            # Create new user and greeting in one transaction
+            async def create_user(write_db: AsyncSession):
+                new_user_id = (await write_db.execute(insert(User).returning(User.id))).scalar_one()
+                [message] = await ChatService.insert_messages(write_db, [{
+                    "user_id": new_user_id,
+                    "sender": "assistant",
+                    "content": onboarding_text
+                }])
+                return message, new_user_id
 
-            return message, user.id
+            message, new_user_id = await db_writer.write(create_user)
+            context_cache.fill(new_user_id, [message])
+            history_index.note(new_user_id, [message])
+            broker.publish(new_user_id, [message])
+
+            return message, new_user_id
         except Exception as e:
             # Get the traceback as a string
             traceback_str = traceback.format_exc()
@@ -55,89 +87,218 @@ class ChatService:
             
 
     @staticmethod
-    async def send_message(db: AsyncSession, user_id: int, user_message: str):
+    async def build_prompt(db: AsyncSession, user_id: int, user_message: str):
+        """
+        Assembles the system instruction and the Gemini `contents` list for a turn,
+        plus the response cache key (None if the turn must not use the cache).
+        """
+        with CHAT_STAGE_SECONDS.time("history"):
+            history_msgs_db = await HistoryService.get_context_messages(db, user_id, limit=CONTEXT_MAX_TURNS)
+            # Archived turns reach the model only through their summary
+            summary = await ArchiveService.get_summary(db, user_id) if ARCHIVE_SUMMARIZE else None
+
+        return ChatService.prompt_from_history(user_id, user_message, history_msgs_db, summary)
+
+    @staticmethod
+    def prompt_from_history(user_id: int, user_message: str, history_msgs_db, summary: str | None):
+        """
+        build_prompt for history (oldest first) and summary already loaded.
+        """
+        with CHAT_STAGE_SECONDS.time("prompt"):
+            system_prompt = load_system_prompt(prompt_version_for(user_id))
+        system_content = system_prompt
+
+        with CHAT_STAGE_SECONDS.time("protocols"):
+            protocol_names = ProtocolService.match_protocols(user_message)
+            protocol_context = ProtocolService.get_relevant_protocols(user_message, protocol_names)
+        if protocol_context:
+            system_content += f"\n\n# PROTOCOL CONTEXT\nThe user seems to be describing a symptom or situation. Use the following medical protocols to guide your response if relevant:\n{protocol_context}"
+
+        if summary:
+            system_content += f"\n\n# EARLIER CONVERSATION SUMMARY\nNotes on what this user shared in earlier conversations:\n{summary}"
+
+        # Newest turns first until the token budget is used up
+        with CHAT_STAGE_SECONDS.time("context"):
+            window = build_context(history_msgs_db, system_content, user_message)
+        contents = window.contents
+        PROMPT_TOKENS.observe(window.system_tokens, "system")
+        PROMPT_TOKENS.observe(window.history_tokens, "history")
+        PROMPT_TOKENS.observe(window.message_tokens, "message")
+        PROMPT_TOKENS.observe(window.total_tokens, "total")
+        CONTEXT_TURNS.observe(window.turns, "sent")
+        CONTEXT_TURNS.observe(window.truncated, "truncated")
+
+        # Only near-empty conversations are generic enough to share a reply
+        cache_key = None
+        if RESPONSE_CACHE_ENABLED and len(history_msgs_db) <= RESPONSE_CACHE_MAX_CONTEXT_TURNS:
+            cache_key = response_cache_key(user_message, protocol_names, system_prompt)
+
+        return contents, system_content, cache_key
+
+    @staticmethod
+    def llm_error_message(e: Exception) -> str:
+        # Handle all LLM errors gracefully so the chat doesn't crash. The
+        # gateway has already retried what was worth retrying
+        error = classify(e)
+        logging.error(f"LLM Error ({type(error).__name__}): {error}")
+        return error.user_message
+
+    @staticmethod
+    async def send_message(user_id: int, user_message: str, idempotency_key: str | None = None):
+        """
+        Runs the turn after the user's earlier turns. A resubmission of a turn
+        already queued, running or just answered returns that turn's reply
+        instead of calling Gemini again.
+        """
+        key = turn_key(user_message, idempotency_key)
+        earlier = inflight_turns.lookup(user_id, key)
+        if earlier is not None:
+            # Shielded, a duplicate giving up must not cancel the original
+            return await asyncio.shield(earlier)
+
+        async with inflight_turns.turn(user_id, key) as turn:
+            assistant_msg = await ChatService._send_message(user_id, user_message)
+            turn.set_result(assistant_msg)
+        return assistant_msg
+
+    @staticmethod
+    async def _send_message(user_id: int, user_message: str):
+        """
+        Sessions are opened only around the DB work, no connection is held
+        while Gemini is generating.
+        """
         try:
-            # Save user message
-            msg = Message(
-                user_id=user_id,
-                sender="user",
-                content=user_message
-            )
-            db.add(msg)
-            await db.commit()
-
-            system_content = load_system_prompt()
-
-            protocol_context = ProtocolService.get_relevant_protocols(user_message)
-            if protocol_context:
-                system_content += f"\n\n# PROTOCOL CONTEXT\nThe user seems to be describing a symptom or situation. Use the following medical protocols to guide your response if relevant:\n{protocol_context}"
-
-            history_msgs_db = await HistoryService.get_context_messages(db, user_id, limit=10)
-            
-            contents = []
-            for m in history_msgs_db:
-                if m.id == msg.id:
-                    continue
-                
-                role = "user" if m.sender == "user" else "model"
-                contents.append({
-                    "role": role,
-                    "parts": [{"text": m.content}]
-                })
-
-            # Add current message
-            contents.append({
-                "role": "user",
-                "parts": [{"text": user_message}]
-            })
+            async with db_session() as db:
+                contents, system_content, cache_key = await ChatService.build_prompt(db, user_id, user_message)
+
+            # The user turn is stored up front, so history, push and other tabs
+            # show it while Gemini is generating and it survives a failed call
+            with CHAT_STAGE_SECONDS.time("db_write"):
+                stored = await db_writer.write_rows(ChatService.insert_messages, [
+                    {"user_id": user_id, "sender": "user", "content": user_message}
+                ])
+            context_cache.append(user_id, stored)
+            history_index.note(user_id, stored)
+            broker.publish(user_id, stored)
+            cached_reply = response_cache.get(cache_key) if cache_key else None
+
+            if cached_reply is not None:
+                assistant_content = cached_reply
+            else:
+                try:
+                    with CHAT_STAGE_SECONDS.time("llm"):
+                        response = await generate_content(user_id, contents, system_content)
+
+                    # Includes what Memori recalled into the prompt
+                    usage = getattr(response, "usage_metadata", None)
+                    if usage and usage.prompt_token_count:
+                        PROMPT_TOKENS.observe(usage.prompt_token_count, "reported")
+
+                    # Check if response was blocked or empty
+                    if not response.text:
+                        error_msg = "I'm sorry, I cannot respond to that message due to safety filters."
+                        if response.candidates and response.candidates[0].finish_reason:
+                            error_msg += f" (Reason: {response.candidates[0].finish_reason})"
+
+                        assistant_content = error_msg
+                    else:
+                        assistant_content = response.text
+                        if cache_key:
+                            response_cache.put(cache_key, assistant_content)
 
+                except Exception as e:
+                    assistant_content = ChatService.llm_error_message(e)
+
+            with CHAT_STAGE_SECONDS.time("db_write"):
+                [assistant_msg] = await db_writer.write_rows(ChatService.insert_messages, [
+                    {"user_id": user_id, "sender": "assistant", "content": assistant_content}
+                ])
+            context_cache.append(user_id, [assistant_msg])
+            history_index.note(user_id, [assistant_msg])
+            broker.publish(user_id, [assistant_msg])
+
+            return assistant_msg
+        except Exception as e:
+            # Get the traceback as a string
+            traceback_str = traceback.format_exc()
+            logging.error(traceback_str)
+
+            # Get the line number of the exception
+            line_no = traceback.extract_tb(e.__traceback__)[-1][1]
+            logging.error(f"Exception occurred on line {line_no}")
+
+    @staticmethod
+    async def stream_message(user_id: int, user_message: str, idempotency_key: str | None = None):
+        """
+        Streaming variant of send_message. Yields ("token", text) for every chunk
+        Gemini produces and a final ("done", Message) once the reply is stored.
+        A resubmitted turn gets the original's reply as a single token.
+        """
+        key = turn_key(user_message, idempotency_key)
+        earlier = inflight_turns.lookup(user_id, key)
+        if earlier is not None:
+            assistant_msg = await asyncio.shield(earlier)
+            if assistant_msg is not None:
+                yield "token", assistant_msg.content
+                yield "done", assistant_msg
+            return
+
+        async with inflight_turns.turn(user_id, key) as turn:
+            async for event, data in ChatService._stream_message(user_id, user_message):
+                if event == "done":
+                    turn.set_result(data)
+                yield event, data
+
+    @staticmethod
+    async def _stream_message(user_id: int, user_message: str):
+        try:
+            async with db_session() as db:
+                contents, system_content, cache_key = await ChatService.build_prompt(db, user_id, user_message)
+
+            # The user turn is stored up front so it survives a dropped stream
+            with CHAT_STAGE_SECONDS.time("db_write"):
+                stored = await db_writer.write_rows(ChatService.insert_messages, [
+                    {"user_id": user_id, "sender": "user", "content": user_message}
+                ])
+            cached_reply = response_cache.get(cache_key) if cache_key else None
+            context_cache.append(user_id, stored)
+            history_index.note(user_id, stored)
+            broker.publish(user_id, stored)
+
+            chunks = []
             try:
-                llm = gemini_llm_with_memory(user_id)
-                
-                response = llm.models.generate_content(
-                    model="gemini-2.5-flash",
-                    contents=contents,
-                    config=types.GenerateContentConfig(
-                        system_instruction=system_content
-                    )
-                )
-                
-                # Check if response was blocked or empty
-                if not response.text:
-                    error_msg = "I'm sorry, I cannot respond to that message due to safety filters."
-                    if response.candidates and response.candidates[0].finish_reason:
-                        error_msg += f" (Reason: {response.candidates[0].finish_reason})"
-                    
-                    assistant_content = error_msg
+                if cached_reply is not None:
+                    chunks.append(cached_reply)
+                    yield "token", cached_reply
                 else:
-                    assistant_content = response.text
+                    async for text in stream_content(user_id, contents, system_content):
+                        chunks.append(text)
+                        yield "token", text
+
+                    if chunks and cache_key:
+                        response_cache.put(cache_key, "".join(chunks))
+
+                if not chunks:
+                    chunks.append("I'm sorry, I cannot respond to that message due to safety filters.")
+                    yield "token", chunks[0]
 
             except Exception as e:
-                # Handle all LLM errors gracefully so the chat doesn't crash
-                logging.error(f"LLM Error: {str(e)}")
-                
-                # Default error message
-                assistant_content = "I apologize, but I'm having trouble processing your request right now. Please try again in a moment."
-                
-                # Check for specific Google GenAI errors if possible
-                error_str = str(e).lower()
-                if "429" in error_str or "quota" in error_str:
-                    assistant_content = "Too many requests. Please try again in a moment."
-                elif "400" in error_str or "key" in error_str:
-                    assistant_content = "Technical error. Please try again in a moment."
-                elif "safety" in error_str or "blocked" in error_str:
-                    assistant_content = "I cannot answer that as it flagged my safety guidelines. Let's try asking something else."
-
-            assistant_msg = Message(
-                user_id=user_id,
-                sender="assistant",
-                content=assistant_content
-            )
-            db.add(assistant_msg)
-            await db.commit()
-            await db.refresh(assistant_msg)
+                # Keep whatever was already delivered, otherwise fall back to the error text
+                if not chunks:
+                    chunks.append(ChatService.llm_error_message(e))
+                    yield "token", chunks[0]
+                else:
+                    logging.error(f"LLM Error mid-stream: {str(e)}")
 
-            return assistant_msg
+            with CHAT_STAGE_SECONDS.time("db_write"):
+                [assistant_msg] = await db_writer.write_rows(ChatService.insert_messages, [
+                    {"user_id": user_id, "sender": "assistant", "content": "".join(chunks)}
+                ])
+            context_cache.append(user_id, [assistant_msg])
+            history_index.note(user_id, [assistant_msg])
+            broker.publish(user_id, [assistant_msg])
+
+            yield "done", assistant_msg
         except Exception as e:
             # Get the traceback as a string
             traceback_str = traceback.format_exc()
@@ -1,25 +1,42 @@
+import time
 import logging
 import traceback
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, func
 
-from app.models.message import Message
+from app.models.message import HISTORY_COLUMNS, Message
+from app.core.context_cache import context_cache, CONTEXT_CACHE_VERIFY
+from app.core.history_index import LatestMessage, history_index
+from app.core.metrics import HISTORY_SECONDS
+from app.services.archive_service import ArchiveService
 
 
 class HistoryService:
     @staticmethod
     async def get_history(db: AsyncSession, user_id: int, before_id: int | None, limit: int):
         try:
-            query = select(Message).where(Message.user_id == user_id)
+            """
+            A page of (id, sender, content, created_at) rows, oldest first. Only
+            those columns are read, no ORM objects are built.
+            """
+            query = select(*HISTORY_COLUMNS).where(Message.user_id == user_id)
 
             if before_id:
                 query = query.where(Message.id < before_id)
 
             query = query.order_by(Message.id.desc()).limit(limit + 1)
 
-            result = await db.execute(query)
-            messages = result.scalars().all()
+            with HISTORY_SECONDS.time("page"):
+                result = await db.execute(query)
+            messages = list(result.all())
+
+            # Older turns may have been archived, the page continues into the segments
+            if len(messages) <= limit:
+                with HISTORY_SECONDS.time("archive_page"):
+                    messages += await ArchiveService.get_archived(
+                        db, user_id, messages[-1].id if messages else before_id, limit + 1 - len(messages)
+                    )
 
             has_more = len(messages) > limit
             messages = messages[:limit]
@@ -36,21 +53,61 @@ class HistoryService:
             line_no = traceback.extract_tb(e.__traceback__)[-1][1]
             logging.error(f"Exception occurred on line {line_no}")
 
+    @staticmethod
+    async def get_latest_message_id(db: AsyncSession, user_id: int) -> int | None:
+        result = await db.execute(
+            select(func.max(Message.id)).where(Message.user_id == user_id)
+        )
+        return result.scalar()
+
+    @staticmethod
+    async def get_latest_message(db: AsyncSession, user_id: int) -> LatestMessage | None:
+        row = (await db.execute(
+            select(Message.id, Message.created_at).where(Message.user_id == user_id)
+            .order_by(Message.id.desc()).limit(1)
+        )).first()
+        return LatestMessage(*row) if row else None
+
+    @staticmethod
+    async def get_messages_after(db: AsyncSession, user_id: int, after_id: int, limit: int):
+        """
+        Up to `limit` (id, sender, content, created_at) rows newer than
+        `after_id`, oldest first, for a reconnecting push client to catch up.
+        """
+        result = await db.execute(
+            select(*HISTORY_COLUMNS).where(Message.user_id == user_id, Message.id > after_id)
+            .order_by(Message.id).limit(limit)
+        )
+        return result.all()
+
     @staticmethod
     async def get_context_messages(db: AsyncSession, user_id: int, limit: int = 10):
         try:
             """
             Fetches the last N messages for LLM context, ascending order.
+            Served from the in-process context cache when it holds enough turns.
             """
+            start = time.perf_counter()
+            entry = context_cache.get(user_id) if limit <= context_cache.turns else None
+            if entry is not None:
+                if not CONTEXT_CACHE_VERIFY or entry.last_id == await HistoryService.get_latest_message_id(db, user_id):
+                    HISTORY_SECONDS.observe(time.perf_counter() - start, "context_hit")
+                    return list(entry.turns)[-limit:]
+
             query = select(Message).where(Message.user_id == user_id)\
                 .order_by(Message.id.desc())\
-                .limit(limit)
+                .limit(max(limit, context_cache.turns))
             
             result = await db.execute(query)
             messages = result.scalars().all()
             
             # Reverse to get chronological order (oldest -> newest) for the LLM
-            return sorted(messages, key=lambda m: m.id)
+            messages = sorted(messages, key=lambda m: m.id)
+            context_cache.fill(user_id, messages)
+            history_index.note(user_id, messages)
+            HISTORY_SECONDS.observe(time.perf_counter() - start, "context_miss")
+
+            return messages[-limit:]
         except Exception as e:
             # Get the traceback as a string
             traceback_str = traceback.format_exc()
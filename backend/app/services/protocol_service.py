@@ -1,62 +1,122 @@
+import os
+import re
+import json
 import traceback
 import logging
-from typing import List, Dict
+from pathlib import Path
+from typing import Dict, List
 
-class ProtocolService:
-    # Basic keyword-based protocols (simplification of RAG)
-    PROTOCOLS: Dict[str, str] = {
-        "fever": (
-            "PROTOCOL: FEVER/HIGH TEMPERATURE\n"
-            "- Ask: How long? Exact temperature? Any chills or shivering?\n"
-            "- Advise: Hydration, rest, light clothing.\n"
-            "- Warning: If temp > 103F or lasts > 3 days, advise easy doctor consult."
-        ),
-        "headache": (
-            "PROTOCOL: HEADACHE\n"
-            "- Ask: Location (front/back)? Intensity (1-10)? Sensitivity to light?\n"
-            "- Advise: Rest in dark room, hydration, less screen time.\n"
-            "- Warning: If sudden severe pain or vision changes, advise immediate help."
-        ),
-        "stomach": (
-            "PROTOCOL: STOMACH PAIN/ISSUES\n"
-            "- Ask: Sharp or dull? When did it start? Any food triggers?\n"
-            "- Advise: Light bland food, hydration (ORS if loose motion).\n"
-            "- Warning: If severe pain or blood in stool, see doctor."
-        ),
-        "cold": (
-            "PROTOCOL: COLD/COUGH\n"
-            "- Ask: Dry or wet cough? Sore throat? Runny nose?\n"
-            "- Advise: Warm water gargle, steam inhalation, honey+ginger.\n"
-            "- Warning: If breathing difficulty, advise doctor immediately."
-        ),
-        "refund": (
-            "PROTOCOL: REFUND POLICY\n"
-            "- Standard: Refunds only processed within 7 days of purchase if service not used.\n"
-            "- Contact: Email support@cure.link for processing."
+from dotenv import load_dotenv
+
+from app.core.protocol_index import load_index
+
+load_dotenv(verbose=True)
+
+PROTOCOLS_FILE = Path(__file__).resolve().parent.parent / "prompts" / "protocols.json"
+
+# "keyword", "vector" or "hybrid" (keyword matches plus vector hits above the threshold)
+PROTOCOL_RETRIEVAL = os.getenv("PROTOCOL_RETRIEVAL", "hybrid")
+PROTOCOL_TOP_K = int(os.getenv("PROTOCOL_TOP_K", 3))
+PROTOCOL_MIN_SCORE = float(os.getenv("PROTOCOL_MIN_SCORE", 0.3))
+
+
+def _trie_pattern(words: List[str]) -> str:
+    """
+    Builds a regex alternation shaped like a trie of `words`, so matching at a
+    position costs O(longest keyword) no matter how many keywords there are.
+    """
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def walk(node: dict) -> str:
+        terminal = "" in node
+        branches = [re.escape(char) + walk(child) for char, child in sorted(node.items()) if char]
+
+        if not branches:
+            return ""
+        if len(branches) == 1 and not terminal:
+            return branches[0]
+
+        body = "(?:" + "|".join(branches) + ")"
+        return body + "?" if terminal else body
+
+    return walk(trie)
+
+
+class ProtocolMatcher:
+    """
+    All protocol keywords compiled into one word-bounded, case-insensitive regex.
+    A single pass over the message finds every keyword, so "cold" no longer
+    matches inside "scolded".
+    """
+
+    def __init__(self, protocols: List[dict]):
+        self.names = [p["name"] for p in protocols]
+        self.keyword_to_names: Dict[str, List[str]] = {}
+        for p in protocols:
+            for keyword in p["keywords"]:
+                self.keyword_to_names.setdefault(keyword.lower(), []).append(p["name"])
+
+        self.pattern = re.compile(
+            r"\b" + _trie_pattern(list(self.keyword_to_names)) + r"\b",
+            re.IGNORECASE
         )
-    }
+        self._order = {name: i for i, name in enumerate(self.names)}
+
+    def match(self, message: str) -> List[str]:
+        found = set()
+        for keyword in self.pattern.findall(message):
+            found.update(self.keyword_to_names[keyword.lower()])
+
+        return sorted(found, key=self._order.__getitem__)
+
+
+def load_protocols(path: Path = PROTOCOLS_FILE) -> List[dict]:
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+class ProtocolService:
+    # Protocols loaded from prompts/protocols.json, retrieved by keyword and TF-IDF similarity
+    _protocols = load_protocols()
+    PROTOCOLS: Dict[str, str] = {p["name"]: p["text"] for p in _protocols}
+    MATCHER = ProtocolMatcher(_protocols)
+    # Read-only, None (keyword matching only) until the index is built
+    INDEX = load_index(PROTOCOLS_FILE) if PROTOCOL_RETRIEVAL != "keyword" else None
+
+    @staticmethod
+    def match_protocols(message: str) -> List[str]:
+        """
+        Returns the names of the protocols relevant to the message: keyword
+        matches first, then vector hits ranked by similarity. Without an index
+        "vector" falls back to keyword matching.
+        """
+        if PROTOCOL_RETRIEVAL != "vector" or ProtocolService.INDEX is None:
+            names = ProtocolService.MATCHER.match(message)
+        else:
+            names = []
+
+        if ProtocolService.INDEX is not None:
+            for name, _ in ProtocolService.INDEX.search(message, PROTOCOL_TOP_K, PROTOCOL_MIN_SCORE):
+                if name not in names:
+                    names.append(name)
+
+        return names
 
     @staticmethod
-    def get_relevant_protocols(message: str) -> str:
+    def get_relevant_protocols(message: str, names: List[str] | None = None) -> str:
         try:
             """
             Scans message for keywords and returns relevant protocol texts.
+            `names` skips the scan when the caller already matched the message.
             """
-            message_lower = message.lower()
-            matched_protocols = []
-
-            for keyword, protocol_text in ProtocolService.PROTOCOLS.items():
-                if keyword in message_lower:
-                    matched_protocols.append(protocol_text)
-            
-            # Also check for synonym "temperature" for fever
-            if "temperature" in message_lower and "fever" not in message_lower:
-                matched_protocols.append(ProtocolService.PROTOCOLS["fever"])
-
-            # Synonym for stomach
-            if "belly" in message_lower or "abdomen" in message_lower:
-                if "stomach" not in message_lower:
-                    matched_protocols.append(ProtocolService.PROTOCOLS["stomach"])
+            if names is None:
+                names = ProtocolService.match_protocols(message)
+
+            matched_protocols = [ProtocolService.PROTOCOLS[name] for name in names]
 
             if not matched_protocols:
                 return ""
@@ -0,0 +1,23 @@
+import base64
+
+CURSOR_PREFIX = "m1:"
+
+
+def encode_cursor(before_id: int) -> str:
+    """
+    Opaque pagination token for /chat/history; clients pass it back unchanged.
+    """
+    return base64.urlsafe_b64encode(f"{CURSOR_PREFIX}{before_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Malformed cursor")
+
+    if not raw.startswith(CURSOR_PREFIX) or not raw[len(CURSOR_PREFIX):].isdigit():
+        raise ValueError("Malformed cursor")
+
+    return int(raw[len(CURSOR_PREFIX):])
@@ -0,0 +1,50 @@
+from datetime import timezone
+from email.utils import format_datetime
+
+from fastapi import Request, Response
+
+from app.core.history_index import LatestMessage, history_index
+
+
+def history_validators(latest: LatestMessage | None, before_id: int | None, limit: int) -> dict:
+    """
+    Caching headers for one /chat/history page. The page is fully determined
+    by the user's newest message id and the paging parameters. Clients
+    revalidate every time (no-cache), mostly getting a bodiless 304.
+    """
+    headers = {"Cache-Control": "private, no-cache"}
+    if latest is None:
+        return headers
+
+    headers["ETag"] = f'"{latest.id}-{before_id or 0}-{limit}"'
+    if latest.created_at is not None:
+        created_at = latest.created_at
+        # SQLite hands back naive UTC timestamps
+        created_at = created_at.replace(tzinfo=timezone.utc) if created_at.tzinfo is None else created_at.astimezone(timezone.utc)
+        headers["Last-Modified"] = format_datetime(created_at, usegmt=True)
+    return headers
+
+
+def is_not_modified(request: Request, validators: dict) -> bool:
+    """
+    True only on an If-None-Match hit. Last-Modified is second-accurate, so a
+    message stored in the same second as the client's copy would look
+    unchanged: If-Modified-Since alone always gets the full page.
+    """
+    etag = validators.get("ETag")
+    if_none_match = request.headers.get("if-none-match")
+    if etag is None or if_none_match is None:
+        return False
+
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def not_modified(request: Request, validators: dict) -> Response | None:
+    """
+    A bodiless 304 carrying the validators if the client's copy is current.
+    """
+    if not is_not_modified(request, validators):
+        return None
+    history_index.not_modified += 1
+    return Response(status_code=304, headers=validators)
@@ -0,0 +1,37 @@
+import orjson
+from fastapi.responses import ORJSONResponse
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+
+
+class APIJSONResponse(ORJSONResponse):
+    """
+    Serialises plain dicts and lists straight to bytes with orjson. Routes
+    returning it skip FastAPI's response_model validation, which the
+    declared model still documents. Datetimes come out exactly as Pydantic
+    writes them ("Z" for UTC).
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def message_json(m) -> dict:
+    return {"id": m.id, "sender": m.sender, "content": m.content, "created_at": m.created_at}
+
+
+def history_json(rows) -> list[dict]:
+    # Unpacking a Row is several times cheaper than its attribute lookups
+    return [
+        {"id": id, "sender": sender, "content": content, "created_at": created_at}
+        for id, sender, content, created_at in rows
+    ]
+
+
+def api_json(message: str, data) -> APIJSONResponse:
+    """
+    A successful APIResponse envelope around already-plain `data`.
+    """
+    return APIJSONResponse({"status": True, "message": message, "data": data, "error": None})
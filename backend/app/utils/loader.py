@@ -1,13 +1,78 @@
 from pathlib import Path
 import os
 import sys
+import time
 import logging
 
 BASE_DIR = Path(__file__).resolve().parent
+PROMPTS_DIR = BASE_DIR.parent / "prompts"
 
+DEFAULT_PROMPT = "disha_system"
+
+# Seconds between mtime checks of a cached prompt file
+PROMPT_RELOAD_INTERVAL = float(os.getenv("PROMPT_RELOAD_INTERVAL", 5))
+
+# Comma separated prompt versions to A/B test, e.g. "default,v2" serves
+# disha_system.txt and disha_system.v2.txt to alternating users
+PROMPT_VERSIONS = [v.strip() for v in os.getenv("PROMPT_VERSIONS", "default").split(",") if v.strip()]
+
+
+class PromptCache:
+    """
+    Holds prompt files in memory. A file is re-read only when its mtime
+    changes (checked at most every `check_interval` seconds) or after reload().
+    """
+
+    def __init__(self, directory: Path, check_interval: float):
+        self.directory = directory
+        self.check_interval = check_interval
+        # name -> (mtime_ns, last_checked, text)
+        self._entries: dict[str, tuple[int, float, str]] = {}
+
+    def get(self, name: str) -> str:
+        entry = self._entries.get(name)
+        now = time.monotonic()
+        if entry and now - entry[1] < self.check_interval:
+            return entry[2]
+
+        path = self.directory / f"{name}.txt"
+        mtime = path.stat().st_mtime_ns
+        if entry and entry[0] == mtime:
+            self._entries[name] = (mtime, now, entry[2])
+            return entry[2]
+
+        text = path.read_text(encoding="utf-8")
+        self._entries[name] = (mtime, now, text)
+        if entry:
+            logging.info(f"Reloaded prompt {name}")
+        return text
+
+    def reload(self):
+        self._entries.clear()
+
+
+prompt_cache = PromptCache(PROMPTS_DIR, PROMPT_RELOAD_INTERVAL)
+
+
+def prompt_version_for(user_id: int) -> str:
+    return PROMPT_VERSIONS[user_id % len(PROMPT_VERSIONS)] if PROMPT_VERSIONS else "default"
+
+
+def load_system_prompt(version: str = "default") -> str:
+    if version == "default":
+        return prompt_cache.get(DEFAULT_PROMPT)
+
+    try:
+        return prompt_cache.get(f"{DEFAULT_PROMPT}.{version}")
+    except FileNotFoundError:
+        logging.error(f"Prompt version {version} not found, using default")
+        return prompt_cache.get(DEFAULT_PROMPT)
+
+
+def reload_prompts():
+    prompt_cache.reload()
+    logging.info("Prompt cache cleared, prompts will be re-read on next use")
 
-def load_system_prompt() -> str:
-    return (BASE_DIR.parent / "prompts" / "disha_system.txt").read_text(encoding="utf-8")
 
 def check_env_vars():
     required_vars = ["GOOGLE_API_KEY", "DATABASE_URL"]
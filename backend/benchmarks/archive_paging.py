@@ -0,0 +1,152 @@
+"""
+Checks history archival end to end: seeds users with months of messages,
+pages every user's full history, runs one compaction pass, then pages again
+and requires the exact same messages in the same order. Reports how much
+the hot table shrank, the archive's compression ratio and page latency for
+hot vs. archived pages.
+
+    python -m benchmarks.archive_paging --users 20 --messages 2000
+    python -m benchmarks.archive_paging --summarize   # also summarises via the fake Gemini
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='disha-bench-')}/bench.db")
+os.environ.setdefault("GOOGLE_API_KEY", "fake-key")
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+from benchmarks.common import percentile, start_fake_gemini  # noqa: E402
+
+MESSAGES = [
+    "I have a fever since yesterday",
+    "Slept only 5 hours, feeling tired",
+    "Thanks for sharing! How long have you been feeling this way?",
+    "Try to drink a glass of water every hour and rest.",
+]
+
+
+async def seed(args):
+    from sqlalchemy import insert
+
+    from app.models.message import Message
+    from app.models.user import User
+    from config.database import db_session
+
+    now = datetime.now(timezone.utc)
+    async with db_session() as db:
+        for _ in range(args.users):
+            user_id = (await db.execute(insert(User).returning(User.id))).scalar_one()
+            # Spread evenly over the last --days days, oldest first
+            step = timedelta(days=args.days) / args.messages
+            rows = [{
+                "user_id": user_id,
+                "sender": "user" if i % 2 == 0 else "assistant",
+                "content": f"{MESSAGES[i % len(MESSAGES)]} ({i})",
+                "created_at": now - timedelta(days=args.days) + step * i
+            } for i in range(args.messages)]
+            for i in range(0, len(rows), 500):
+                await db.execute(insert(Message).values(rows[i:i + 500]))
+        await db.commit()
+
+
+async def page_all(user_id: int, page_size: int) -> tuple[list, list[float]]:
+    from app.services.history_service import HistoryService
+    from config.database import db_session
+
+    seen, timings, before_id = [], [], None
+    while True:
+        start = time.perf_counter()
+        async with db_session() as db:
+            messages, has_more = await HistoryService.get_history(db, user_id, before_id, page_size)
+        timings.append((time.perf_counter() - start) * 1000)
+        seen = [(m.id, m.sender, m.content) for m in messages] + seen
+        if not has_more:
+            return seen, timings
+        before_id = messages[0].id
+
+
+async def run(args) -> bool:
+    from sqlalchemy import func, select
+
+    from app.core.migrate import create_app_tables
+    from app.models.archive import ArchiveSegment
+    from app.models.message import Message
+    from app.services.archive_service import ArchiveService
+    from config.database import db_session, engine
+
+    await create_app_tables()
+    await seed(args)
+
+    async def hot_rows() -> int:
+        async with db_session() as db:
+            return (await db.execute(select(func.count()).select_from(Message))).scalar()
+
+    user_ids = range(1, args.users + 1)
+    before = {u: await page_all(u, args.page_size) for u in user_ids}
+    hot_before = await hot_rows()
+
+    start = time.perf_counter()
+    stats = await ArchiveService.compact(args.older_than_days, args.summarize)
+    compaction_s = time.perf_counter() - start
+
+    after = {u: await page_all(u, args.page_size) for u in user_ids}
+    hot_after = await hot_rows()
+
+    async with db_session() as db:
+        archived_bytes = (await db.execute(select(func.sum(func.length(ArchiveSegment.data))))).scalar() or 0
+        archived_raw = (await db.execute(select(func.count()).select_from(ArchiveSegment))).scalar()
+        summaries = [await ArchiveService.get_summary(db, u) for u in user_ids]
+    raw_bytes = sum(len(c.encode()) for u in user_ids for _, _, c in before[u][0]) * (1 - hot_after / hot_before)
+
+    mismatched = [u for u in user_ids if before[u][0] != after[u][0]]
+    hot_pages = [ms for u in user_ids for ms in before[u][1]]
+    # Pages beyond the hot rows are served from segments after compaction
+    archived_pages = [ms for u in user_ids for ms in after[u][1][1:]]
+
+    print(f"compaction: {stats} in {compaction_s:.2f}s, {archived_raw} segments")
+    print(f"hot rows: {hot_before} -> {hot_after}")
+    print(f"archive: {archived_bytes / 1024:.0f} KiB for ~{raw_bytes / 1024:.0f} KiB of message text "
+          f"({raw_bytes / max(archived_bytes, 1):.1f}x)")
+    print(f"page p50 before {percentile(hot_pages, 50):.2f} ms, archived pages p50 {percentile(archived_pages, 50):.2f} ms "
+          f"p99 {percentile(archived_pages, 99):.2f} ms")
+    if args.summarize:
+        print(f"summaries stored: {sum(1 for s in summaries if s)}/{args.users}")
+    print(f"history identical after archival: {not mismatched}")
+
+    await engine.dispose()
+    return not mismatched and stats["failed"] == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="History archival round trip")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--days", type=float, default=180, help="Seeded history spans this many days")
+    parser.add_argument("--older-than-days", type=float, default=30)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--summarize", action="store_true")
+    parser.add_argument("--llm-port", type=int, default=9113)
+    args = parser.parse_args()
+
+    fake = None
+    if args.summarize:
+        os.environ["GOOGLE_API_BASE_URL"] = f"http://127.0.0.1:{args.llm_port}"
+        fake = start_fake_gemini(args.llm_port, latency=0)
+        time.sleep(2)
+    try:
+        ok = asyncio.run(run(args))
+    finally:
+        if fake:
+            fake.terminate()
+            fake.wait()
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Batch chat jobs against a fake Gemini, compared with one /chat/message call
+per user, each mode on its own set of seeded users:
+
+- per user: N turns through POST /chat/message, CONCURRENCY at a time
+- endpoint: the same through one POST /chat/batch job, polled until done
+- CLI: `python -m app.services.batch_service` killed after its first chunk
+  is stored, then run again with the same job id to finish
+
+Reports throughput and app DB statements per turn (from /metrics) for the
+API modes, and checks that every item ends up stored exactly once: the
+killed and resumed CLI job included.
+
+    python -m benchmarks.batch_jobs --items 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import BACKEND_DIR, start_fake_gemini, wait_until_up
+
+NUDGE = "Evening check-in: how did your sleep and water intake go today?"
+
+
+def seed_users(db_path: str, count: int) -> list[int]:
+    # Users with their greeting, written directly so seeding is not measured
+    with sqlite3.connect(db_path) as conn:
+        user_ids = []
+        for _ in range(count):
+            user_id = conn.execute("INSERT INTO users DEFAULT VALUES").lastrowid
+            conn.execute(
+                "INSERT INTO messages (user_id, sender, content, created_at) VALUES (?, 'assistant', 'Hi!', CURRENT_TIMESTAMP)",
+                (user_id,)
+            )
+            user_ids.append(user_id)
+    return user_ids
+
+
+def stored_turns(db_path: str, user_ids: list[int]) -> dict[int, int]:
+    # Messages per user beyond the greeting
+    with sqlite3.connect(db_path) as conn:
+        counts = dict(conn.execute(
+            f"SELECT user_id, COUNT(*) - 1 FROM messages WHERE user_id IN ({','.join(map(str, user_ids))}) GROUP BY user_id"
+        ).fetchall())
+    return {user_id: counts.get(user_id, 0) for user_id in user_ids}
+
+
+async def app_statements(client: httpx.AsyncClient) -> float:
+    metrics = (await client.get("/metrics")).text
+    return float(re.search(r'disha_db_query_seconds_count\{pool="app"\} ([0-9.]+)', metrics).group(1))
+
+
+async def per_user(client: httpx.AsyncClient, user_ids: list[int], concurrency: int) -> float:
+    limit = asyncio.Semaphore(concurrency)
+
+    async def send(user_id: int):
+        async with limit:
+            response = await client.post("/chat/message", json={"user_id": user_id, "message": NUDGE})
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[send(user_id) for user_id in user_ids])
+    return time.perf_counter() - start
+
+
+async def endpoint(client: httpx.AsyncClient, user_ids: list[int]) -> dict:
+    items = [{"user_id": user_id, "message": NUDGE} for user_id in user_ids]
+    report = (await client.post("/chat/batch", json={"job_id": "bench-api", "items": items})).json()["data"]
+    while report["running"]:
+        await asyncio.sleep(0.5)
+        report = (await client.get("/chat/batch/bench-api")).json()["data"]
+    return report
+
+
+def cli(env: dict, path: str, args, kill_after_first_chunk: bool) -> dict | None:
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "app.services.batch_service", path, "--job-id", "bench-cli",
+            "--concurrency", str(args.concurrency), "--chunk-size", str(args.chunk_size)
+        ],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    if kill_after_first_chunk:
+        for line in process.stderr:
+            if "Batch bench-cli:" in line:
+                process.send_signal(signal.SIGKILL)
+                break
+        process.wait()
+        return None
+
+    out, err = process.communicate()
+    if process.returncode != 0:
+        print(err[-2000:])
+    return json.loads(out[out.index("{"):])
+
+
+async def run(args, env: dict, db_path: str) -> bool:
+    async with httpx.AsyncClient(base_url=args.api_url, timeout=300) as client:
+        await wait_until_up(client, "/health/ready", timeout=120)
+        groups = [seed_users(db_path, args.items) for _ in range(3)]
+        results = []
+
+        before = await app_statements(client)
+        elapsed = await per_user(client, groups[0], args.concurrency)
+        statements = (await app_statements(client) - before) / args.items
+        print(f"{args.items} turns, Gemini latency {args.llm_latency}s, {args.concurrency} calls in flight")
+        print(f"per-user /chat/message: {args.items / elapsed:6.1f} turns/s, {statements:.1f} app DB statements per turn")
+        results.append(set(stored_turns(db_path, groups[0]).values()) == {2})
+
+        before = await app_statements(client)
+        report = await endpoint(client, groups[1])
+        statements = (await app_statements(client) - before) / args.items
+        exact = set(stored_turns(db_path, groups[1]).values()) == {2}
+        print(f"POST /chat/batch:       {report['items_per_second']:6.1f} turns/s, {statements:.2f} app DB statements per turn, "
+              f"stage seconds {report['seconds']}  {'OK' if exact and report['stored'] == args.items else 'FAIL'}")
+        results.append(exact and report["stored"] == args.items)
+
+    path = os.path.join(os.path.dirname(db_path), "items.jsonl")
+    with open(path, "w") as f:
+        for user_id in groups[2]:
+            f.write(json.dumps({"user_id": user_id, "message": NUDGE}) + "\n")
+    cli(env, path, args, kill_after_first_chunk=True)
+    partial = sum(1 for count in stored_turns(db_path, groups[2]).values() if count)
+    report = cli(env, path, args, kill_after_first_chunk=False)
+    counts = stored_turns(db_path, groups[2])
+    resumed_ok = (
+        set(counts.values()) == {2} and report["skipped"] == partial
+        and report["stored"] == args.items - partial and report["failed"] == 0
+    )
+    print(f"CLI killed after {partial} items, rerun skipped {report['skipped']} and stored {report['stored']}: "
+          f"{report['items_per_second']:.1f} turns/s, every user has exactly one new turn  {'OK' if resumed_ok else 'FAIL'}")
+    results.append(resumed_ok)
+    return all(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch chat jobs versus one request per user")
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--chunk-size", type=int, default=100)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--api-port", type=int, default=7116)
+    parser.add_argument("--llm-port", type=int, default=9116)
+    args = parser.parse_args()
+    args.api_url = f"http://127.0.0.1:{args.api_port}"
+    args.llm_url = f"http://127.0.0.1:{args.llm_port}"
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="disha-bench-"), "bench.db")
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite+aiosqlite:///{db_path}",
+        "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY", "fake-key"),
+        "GOOGLE_API_BASE_URL": args.llm_url,
+        "HF_HUB_OFFLINE": os.getenv("HF_HUB_OFFLINE", "1"),
+        # Every user gets the same nudge, cached replies would hide the Gemini calls
+        "RESPONSE_CACHE_ENABLED": "0",
+    }
+
+    processes = [
+        start_fake_gemini(args.llm_port, args.llm_latency, env=env),
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.api_port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env
+        ),
+    ]
+    try:
+        ok = asyncio.run(run(args, env, db_path))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
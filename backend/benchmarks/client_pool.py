@@ -0,0 +1,89 @@
+"""
+Per-message cost of the pooled Gemini clients vs. building and registering
+a new client for every message (the previous behaviour).
+
+Both variants call the local fake Gemini server with zero latency, so the
+numbers are dominated by client construction, Memori registration and
+connection setup.
+
+    python -m benchmarks.client_pool --messages 100 --concurrency 8
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='disha-bench-')}/bench.db")
+os.environ.setdefault("GOOGLE_API_KEY", "fake-key")
+
+from benchmarks.common import percentile, start_fake_gemini  # noqa: E402
+
+
+async def run(args):
+    from google.genai import types
+
+    from app.core.memori import memori
+    from app.helper import llm_helper
+
+    memori.config.storage.build()
+    contents = [{"role": "user", "parts": [{"text": "I have a headache since morning"}]}]
+
+    async def per_request_client(user_id: int):
+        client = llm_helper.new_gemini_client()
+        mem = memori.llm.register(client)
+        mem.attribution(entity_id=f"user_{user_id}", process_id=f"disha_chat_{user_id}")
+        return await client.aio.models.generate_content(
+            model=llm_helper.GEMINI_MODEL,
+            contents=contents,
+            config=types.GenerateContentConfig(system_instruction="Be brief.")
+        )
+
+    async def pooled_client(user_id: int):
+        return await llm_helper.generate_content(user_id, contents, "Be brief.")
+
+    for name, call in (("per-request client", per_request_client), ("pooled client", pooled_client)):
+        samples = []
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def one(i: int):
+            async with semaphore:
+                start = time.perf_counter()
+                await call(i % 50)
+                samples.append((time.perf_counter() - start) * 1000)
+
+        # Warm up imports and the pool before measuring
+        await asyncio.gather(*[one(i) for i in range(args.concurrency)])
+        samples.clear()
+
+        start = time.perf_counter()
+        await asyncio.gather(*[one(i) for i in range(args.messages)])
+        elapsed = time.perf_counter() - start
+
+        print(
+            f"{name:<20} {args.messages / elapsed:>8.1f} msg/s"
+            f"  p50 {percentile(samples, 50):>7.2f} ms  p99 {percentile(samples, 99):>7.2f} ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pooled vs per-request Gemini clients")
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-port", type=int, default=9100)
+    args = parser.parse_args()
+
+    os.environ["GOOGLE_API_BASE_URL"] = f"http://127.0.0.1:{args.llm_port}"
+    os.environ.setdefault("LLM_MAX_CONCURRENCY", str(args.concurrency))
+
+    fake = start_fake_gemini(args.llm_port, latency=0)
+    try:
+        time.sleep(2)
+        asyncio.run(run(args))
+    finally:
+        fake.terminate()
+        fake.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Checks per-user turn coalescing against a fake Gemini that counts its calls:
+
+- a burst of duplicate /chat/message and /chat/message/stream submissions
+  with one Idempotency-Key makes exactly one Gemini call and every caller
+  gets the same stored reply
+- the same for a burst of identical texts without a key
+- a key resent after its turn finished gets the stored reply again, while
+  the same text sent again without a key is a new turn
+- different messages sent at once by one user are answered in arrival
+  order, each reply directly after its question in the history
+
+Exits non-zero on any violation.
+
+    python -m benchmarks.coalescing --duplicates 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import httpx
+
+from benchmarks.common import BACKEND_DIR, start_fake_gemini, wait_until_up
+
+
+async def llm_calls(llm: httpx.AsyncClient) -> int:
+    stats = (await llm.get("/stats")).json()
+    return stats["generate"] + stats["stream"]
+
+
+async def send(client: httpx.AsyncClient, user_id: int, message: str, key: str | None, stream: bool) -> int | None:
+    headers = {"Idempotency-Key": key} if key else {}
+    payload = {"user_id": user_id, "message": message}
+    if not stream:
+        response = await client.post("/chat/message", json=payload, headers=headers)
+        body = response.json()
+        return body["data"]["id"] if body["status"] else None
+
+    async with client.stream("POST", "/chat/message/stream", json=payload, headers=headers) as response:
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: ") and event == "done":
+                return json.loads(line[6:])["id"]
+    return None
+
+
+async def burst(client, llm, user_id: int, count: int, key: str | None, label: str) -> bool:
+    before = await llm_calls(llm)
+    ids = await asyncio.gather(*[
+        send(client, user_id, "I have a fever since yesterday", key, stream=i % 2 == 1) for i in range(count)
+    ])
+    calls = await llm_calls(llm) - before
+    ok = calls == 1 and len(set(ids)) == 1 and None not in ids
+    print(f"{label}: {count} submissions -> {calls} Gemini call(s), {len(set(ids))} distinct reply id(s)  "
+          f"{'OK' if ok else 'FAIL'}")
+    return ok
+
+
+async def resend(client, llm, user_id: int) -> bool:
+    # One after the other, each waiting for the previous reply
+    before = await llm_calls(llm)
+    keyed = [await send(client, user_id, "ok", "resend-key", stream=False) for _ in range(2)]
+    unkeyed = [await send(client, user_id, "ok", None, stream=False) for _ in range(2)]
+    calls = await llm_calls(llm) - before
+    ok = calls == 3 and keyed[0] == keyed[1] and len({keyed[0], *unkeyed}) == 3 and None not in keyed + unkeyed
+    print(f"resend after the reply: same key -> {'same' if keyed[0] == keyed[1] else 'new'} reply, "
+          f"same text without a key -> {'new' if unkeyed[0] != unkeyed[1] else 'same'} reply, {calls} Gemini calls  "
+          f"{'OK' if ok else 'FAIL'}")
+    return ok
+
+
+async def ordering(client, llm, user_id: int, count: int) -> bool:
+    before = await llm_calls(llm)
+    tasks = []
+    for i in range(count):
+        tasks.append(asyncio.create_task(send(client, user_id, f"Question {i}", None, stream=i % 2 == 1)))
+        # Fixes the arrival order the server should preserve
+        await asyncio.sleep(0.05)
+    await asyncio.gather(*tasks)
+    calls = await llm_calls(llm) - before
+
+    history = (await client.get("/chat/history", params={"user_id": user_id, "limit": 2 * count + 1})).json()["data"]["messages"]
+    # After the greeting
+    turns = [(m["sender"], m["content"]) for m in history[1:]]
+    expected_questions = [f"Question {i}" for i in range(count)]
+    questions = [content for sender, content in turns[0::2]]
+    replies_follow = all(sender == "assistant" for sender, _ in turns[1::2])
+    ok = calls == count and questions == expected_questions and replies_follow
+    print(f"ordering: {count} different messages at once -> {calls} Gemini calls, "
+          f"history in arrival order and not interleaved: {questions == expected_questions and replies_follow}  "
+          f"{'OK' if ok else 'FAIL'}")
+    return ok
+
+
+async def run(args) -> bool:
+    async with httpx.AsyncClient(base_url=args.api_url, timeout=120) as client, \
+            httpx.AsyncClient(base_url=args.llm_url) as llm:
+        await wait_until_up(client, "/health/ready", timeout=120)
+
+        async def new_user() -> int:
+            return (await client.post("/chat/init", json={"user_id": None})).json()["data"]["user_id"]
+
+        results = [
+            await burst(client, llm, await new_user(), args.duplicates, "retry-key", "idempotency key"),
+            await burst(client, llm, await new_user(), args.duplicates, None, "same text, no key"),
+            await resend(client, llm, await new_user()),
+            await ordering(client, llm, await new_user(), args.ordered),
+        ]
+        print(f"chat_turns: {(await client.get('/health')).json()['data']['chat_turns']}")
+    return all(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Duplicate submission coalescing and per-user ordering")
+    parser.add_argument("--duplicates", type=int, default=50)
+    parser.add_argument("--ordered", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--api-port", type=int, default=7114)
+    parser.add_argument("--llm-port", type=int, default=9114)
+    args = parser.parse_args()
+    args.api_url = f"http://127.0.0.1:{args.api_port}"
+    args.llm_url = f"http://127.0.0.1:{args.llm_port}"
+
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='disha-bench-')}/bench.db",
+        "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY", "fake-key"),
+        "GOOGLE_API_BASE_URL": args.llm_url,
+        "HF_HUB_OFFLINE": os.getenv("HF_HUB_OFFLINE", "1"),
+        "RESPONSE_CACHE_ENABLED": "0",
+    }
+
+    processes = [
+        start_fake_gemini(args.llm_port, args.llm_latency, env=env),
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.api_port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env
+        ),
+    ]
+    try:
+        ok = asyncio.run(run(args))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Prompt size with the fixed last-10-turns window vs. the token-budgeted
+context builder, for conversations of short chat, long pasted reports and a
+mix of both. Reports estimated input tokens, turns sent and build time.
+
+    python -m benchmarks.context_budget
+    python -m benchmarks.context_budget --budget 3000 --calibrate   # compare the estimate with Gemini's count_tokens
+"""
+import argparse
+import os
+import random
+import time
+from types import SimpleNamespace
+
+from app.core.context_budget import build_context, count_tokens
+from app.utils.loader import load_system_prompt
+from benchmarks.common import percentile
+
+SHORT = [
+    "Slept 6 hours, feeling ok",
+    "Had dal and rice for lunch 😊",
+    "Great! How about a 10 minute walk after dinner today?",
+    "Headache since morning",
+    "Drink a glass of water and rest your eyes for a while. Did you skip breakfast?",
+]
+REPORT_LINE = (
+    "Haemoglobin 11.2 g/dL (ref 12.0-15.5), fasting glucose 104 mg/dL, HbA1c 5.9%, "
+    "TSH 4.8 mIU/L, vitamin D 18 ng/mL, LDL 142 mg/dL, triglycerides 190 mg/dL. "
+)
+LONG_REPLY = (
+    "Thanks for sharing your report. A few values are slightly outside the reference range, "
+    "which is common and usually manageable with small changes. "
+) * 12
+
+
+def conversation(profile: str, turns: int, rng: random.Random) -> list:
+    history = []
+    for i in range(turns):
+        sender = "user" if i % 2 == 0 else "assistant"
+        long_turn = profile == "long" or (profile == "mixed" and rng.random() < 0.2)
+        if long_turn:
+            content = REPORT_LINE * rng.randint(10, 60) if sender == "user" else LONG_REPLY
+        else:
+            content = rng.choice(SHORT)
+        history.append(SimpleNamespace(sender=sender, content=content))
+    return history
+
+
+def fixed_window(history: list, system_content: str, message: str) -> tuple[int, int]:
+    # Previous behaviour: the last 10 turns whatever their length
+    turns = history[-10:]
+    tokens = count_tokens(system_content) + count_tokens(message) + sum(count_tokens(m.content) for m in turns)
+    return tokens, len(turns)
+
+
+def calibrate(samples: list[str]):
+    from google.genai import Client
+
+    from app.helper.llm_helper import GEMINI_MODEL
+
+    client = Client(api_key=os.getenv("GOOGLE_API_KEY"))
+    print("\ncalibration against count_tokens:")
+    for text in samples:
+        actual = client.models.count_tokens(model=GEMINI_MODEL, contents=text).total_tokens
+        estimate = count_tokens(text)
+        print(f"  {len(text):>6} chars: estimate {estimate:>5}, Gemini {actual:>5} ({estimate / max(actual, 1):.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fixed vs token-budgeted prompt context")
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=20, help="History turns available per conversation")
+    parser.add_argument("--budget", type=int, default=None, help="Defaults to CONTEXT_TOKEN_BUDGET")
+    parser.add_argument("--calibrate", action="store_true", help="Needs a real GOOGLE_API_KEY")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    system_content = load_system_prompt()
+    budget = {"budget": args.budget} if args.budget else {}
+
+    print(f"{'profile':<8} {'fixed tokens p50/max':>22} {'turns':>6} {'budgeted tokens p50/max':>25} {'turns':>6} {'cut':>5} {'build us':>9}")
+    for profile in ("short", "long", "mixed"):
+        fixed_tokens, fixed_turns, tokens, turns, cut, build_us = [], [], [], [], 0, []
+        for _ in range(args.conversations):
+            history = conversation(profile, args.turns, rng)
+            message = REPORT_LINE * 40 if profile == "long" else rng.choice(SHORT)
+
+            t, n = fixed_window(history, system_content, message)
+            fixed_tokens.append(t)
+            fixed_turns.append(n)
+
+            start = time.perf_counter()
+            window = build_context(history, system_content, message, **budget)
+            build_us.append((time.perf_counter() - start) * 1e6)
+            tokens.append(window.total_tokens)
+            turns.append(window.turns)
+            cut += window.truncated
+
+        print(
+            f"{profile:<8} {percentile(fixed_tokens, 50):>14.0f}/{max(fixed_tokens):<7.0f} {sum(fixed_turns) / len(fixed_turns):>6.1f} "
+            f"{percentile(tokens, 50):>17.0f}/{max(tokens):<7.0f} {sum(turns) / len(turns):>6.1f} {cut:>5} "
+            f"{percentile(build_us, 50):>9.0f}"
+        )
+
+    if args.calibrate:
+        calibrate([rng.choice(SHORT), LONG_REPLY, REPORT_LINE * 20, system_content])
+
+
+if __name__ == "__main__":
+    main()
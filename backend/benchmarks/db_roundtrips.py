@@ -0,0 +1,107 @@
+"""
+Counts database round-trips (statements plus BEGIN/COMMIT/ROLLBACK) issued
+by ChatService.init_chat and ChatService.send_message.
+
+Runs against whatever DATABASE_URL points to, so it can be used on both the
+SQLite file and a local Postgres:
+
+    python -m benchmarks.db_roundtrips
+    DATABASE_URL=postgresql+asyncpg://localhost/disha_bench python -m benchmarks.db_roundtrips
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from collections import Counter
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='disha-bench-')}/bench.db")
+os.environ.setdefault("GOOGLE_API_KEY", "fake-key")
+
+from sqlalchemy import event  # noqa: E402
+
+from benchmarks.common import start_fake_gemini  # noqa: E402
+
+
+def install_counter(sync_engine) -> Counter:
+    counts = Counter()
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _statement(conn, cursor, statement, parameters, context, executemany):
+        counts["statements"] += 1
+
+    @event.listens_for(sync_engine, "begin")
+    def _begin(conn):
+        counts["begin"] += 1
+
+    @event.listens_for(sync_engine, "commit")
+    def _commit(conn):
+        counts["commit"] += 1
+
+    @event.listens_for(sync_engine, "rollback")
+    def _rollback(conn):
+        counts["rollback"] += 1
+
+    return counts
+
+
+async def run(args):
+    import app.models.user  # noqa: F401
+    import app.models.message  # noqa: F401
+    from app.core.memori import memori
+    from app.services.chat_service import ChatService
+    from config.database import AsyncSessionLocal, Base, engine
+
+    memori.config.storage.build()
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    counts = install_counter(engine.sync_engine)
+
+    async def measure(label: str, call):
+        counts.clear()
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            async with AsyncSessionLocal() as db:
+                await call(db)
+        elapsed = (time.perf_counter() - start) / args.iterations * 1000
+        per_call = {k: v / args.iterations for k, v in counts.items()}
+        trips = sum(per_call.values())
+        detail = ", ".join(f"{k}={v:g}" for k, v in sorted(per_call.items()))
+        print(f"{label:<14} {trips:>5g} round-trips/request ({detail})  {elapsed:.2f} ms")
+
+    user_ids = []
+
+    async def init(db):
+        message, user_id = await ChatService.init_chat(db, None)
+        user_ids.append(user_id)
+
+    async def send(db):
+        # Opens its own sessions around the DB work
+        await ChatService.send_message(user_ids[0], "I have a headache since morning")
+
+    print(f"dialect: {engine.dialect.name}")
+    await measure("init_chat", init)
+    await measure("send_message", send)
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DB round-trips per chat request")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--llm-port", type=int, default=9100)
+    args = parser.parse_args()
+
+    os.environ["GOOGLE_API_BASE_URL"] = f"http://127.0.0.1:{args.llm_port}"
+
+    fake = start_fake_gemini(args.llm_port, latency=0)
+    try:
+        time.sleep(2)
+        asyncio.run(run(args))
+    finally:
+        fake.terminate()
+        fake.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Local stand-in for the Gemini REST API, used by the load tests.
+
+Point the backend at it with GOOGLE_API_BASE_URL=http://127.0.0.1:<port>.
+
+    python -m benchmarks.fake_gemini --port 9100 --latency 2.0 --token-rate 50
+
+Faults are injected at random into a share of the calls: errors in Gemini's
+format (429 with a RetryInfo delay, 500, 503), slow replies and streams that
+go silent after their first chunk. They start
+from the command line and can be changed while running with
+POST /faults {"error_rate": 0.3, "error_status": 503, ...}.
+"""
+import argparse
+import asyncio
+import json
+import random
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+REPLY_TEXT = "Thanks for sharing! How long have you been feeling this way? 💧"
+
+
+def _candidate(text: str, finish_reason: str | None = None) -> dict:
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}}
+    if finish_reason:
+        candidate["finishReason"] = finish_reason
+    return candidate
+
+
+ERROR_STATUS = {429: "RESOURCE_EXHAUSTED", 500: "INTERNAL", 503: "UNAVAILABLE"}
+
+
+def _error(code: int, retry_delay: float) -> JSONResponse:
+    error = {"code": code, "message": f"Injected fault ({code})", "status": ERROR_STATUS.get(code, "UNKNOWN")}
+    if code == 429 and retry_delay:
+        error["details"] = [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{retry_delay}s"}]
+    return JSONResponse({"error": error}, status_code=code)
+
+
+def create_app(latency: float, token_rate: float, faults: dict | None = None) -> FastAPI:
+    app = FastAPI()
+    calls = {"generate": 0, "stream": 0, "errors": 0, "slow": 0, "stalled": 0}
+    faults = {"error_rate": 0.0, "error_status": 503, "retry_delay": 0.0, "slow_rate": 0.0, "slow_latency": 5.0,
+              "stall_rate": 0.0, "stall_latency": 60.0, **(faults or {})}
+
+    @app.get("/stats")
+    async def stats():
+        # Lets a test count the Gemini calls the backend actually made
+        return calls
+
+    @app.post("/faults")
+    async def set_faults(request: Request):
+        faults.update(await request.json())
+        return faults
+
+    async def injected() -> JSONResponse | None:
+        """
+        Waits out the call's latency, or returns the error it should fail with.
+        """
+        if random.random() < faults["error_rate"]:
+            calls["errors"] += 1
+            # Failures come back quickly, like an exhausted quota does
+            await asyncio.sleep(min(latency, 0.05))
+            return _error(int(faults["error_status"]), faults["retry_delay"])
+        if random.random() < faults["slow_rate"]:
+            calls["slow"] += 1
+            await asyncio.sleep(faults["slow_latency"])
+        else:
+            await asyncio.sleep(latency)
+        return None
+
+    @app.post("/{api_version}/models/{model}:generateContent")
+    async def generate_content(api_version: str, model: str, request: Request):
+        calls["generate"] += 1
+        if (error := await injected()) is not None:
+            return error
+
+        return {"candidates": [_candidate(REPLY_TEXT, "STOP")], "modelVersion": model}
+
+    @app.post("/{api_version}/models/{model}:streamGenerateContent")
+    async def stream_generate_content(api_version: str, model: str, request: Request):
+        calls["stream"] += 1
+        # `latency` is the time to first token, then words arrive at `token_rate` per second
+        words = REPLY_TEXT.split(" ")
+        if (error := await injected()) is not None:
+            return error
+        stall = random.random() < faults["stall_rate"]
+        calls["stalled"] += stall
+
+        async def chunks():
+            for i, word in enumerate(words):
+                last = i == len(words) - 1
+                text = word if last else word + " "
+                body = {"candidates": [_candidate(text, "STOP" if last else None)], "modelVersion": model}
+                yield f"data: {json.dumps(body)}\r\n\r\n"
+                if not last:
+                    await asyncio.sleep(faults["stall_latency"] if stall and i == 0 else 1 / token_rate)
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Gemini server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=2.0, help="Seconds before each reply")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="Streamed words per second")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls failing with --error-status")
+    parser.add_argument("--error-status", type=int, default=503, choices=sorted(ERROR_STATUS))
+    parser.add_argument("--retry-delay", type=float, default=0.0, help="RetryInfo delay sent with 429s")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Share of calls taking --slow-latency")
+    parser.add_argument("--slow-latency", type=float, default=5.0)
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Share of streams silent after the first chunk")
+    parser.add_argument("--stall-latency", type=float, default=60.0)
+    args = parser.parse_args()
+
+    faults = {
+        "error_rate": args.error_rate, "error_status": args.error_status, "retry_delay": args.retry_delay,
+        "slow_rate": args.slow_rate, "slow_latency": args.slow_latency,
+        "stall_rate": args.stall_rate, "stall_latency": args.stall_latency
+    }
+    uvicorn.run(create_app(args.latency, args.token_rate, faults), host=args.host, port=args.port, log_level="warning")
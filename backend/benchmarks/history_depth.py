@@ -0,0 +1,102 @@
+"""
+History page latency vs. scroll depth.
+
+Fills the messages table (10M rows by default, most of them belonging to a
+single heavy user) and times HistoryService.get_history at increasing
+depths. With keyset paging on (user_id, id) the numbers should stay flat
+no matter how far back the page is.
+
+    python -m benchmarks.history_depth --messages 10000000
+    python -m benchmarks.history_depth --messages 1000000 --database-url postgresql+asyncpg://localhost/disha_bench
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from benchmarks.common import percentile
+
+BATCH_SIZE = 50_000
+
+
+async def fill(engine, messages: int, users: int):
+    from sqlalchemy import insert
+    from app.models.message import Message
+    from app.models.user import User
+
+    async with engine.begin() as conn:
+        await conn.execute(insert(User), [{"id": i} for i in range(1, users + 1)])
+
+    written = 0
+    start = time.perf_counter()
+    while written < messages:
+        size = min(BATCH_SIZE, messages - written)
+        rows = [
+            {
+                # Every 10th message goes to another user so user 1's rows are interleaved
+                "user_id": 1 if (written + i) % 10 or users == 1 else 2 + (written + i) % (users - 1),
+                "sender": "user" if (written + i) % 2 else "assistant",
+                "content": f"message {written + i}"
+            }
+            for i in range(size)
+        ]
+        async with engine.begin() as conn:
+            await conn.execute(insert(Message), rows)
+        written += size
+        print(f"\rfilled {written:,}/{messages:,}", end="", flush=True)
+    print(f"  ({time.perf_counter() - start:.0f}s)")
+
+
+async def run(args):
+    from sqlalchemy import func, select
+    import app.models.user  # noqa: F401
+    from app.models.message import Message
+    from app.services.history_service import HistoryService
+    from config.database import AsyncSessionLocal, Base, engine
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with AsyncSessionLocal() as db:
+        existing = (await db.execute(select(func.count(Message.id)))).scalar_one()
+    if existing < args.messages:
+        await fill(engine, args.messages - existing, args.users)
+
+    async with AsyncSessionLocal() as db:
+        newest = (await db.execute(select(func.max(Message.id)).where(Message.user_id == 1))).scalar_one()
+        total = (await db.execute(select(func.count(Message.id)).where(Message.user_id == 1))).scalar_one()
+
+    print(f"user 1 has {total:,} messages")
+    print(f"{'depth (msgs)':>14}{'p50 ms':>10}{'p99 ms':>10}")
+
+    depths = [0] + [10 ** e for e in range(2, 9) if 10 ** e < total] + [max(total - args.limit, 0)]
+    for depth in depths:
+        samples = []
+        async with AsyncSessionLocal() as db:
+            # Ids are dense enough that id distance approximates scroll depth
+            before_id = newest - int(depth * 1.1) + 1
+            for _ in range(args.pages):
+                start = time.perf_counter()
+                await HistoryService.get_history(db, 1, before_id, args.limit)
+                samples.append((time.perf_counter() - start) * 1000)
+        print(f"{depth:>14,}{percentile(samples, 50):>10.2f}{percentile(samples, 99):>10.2f}")
+
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="History page latency vs. scroll depth")
+    parser.add_argument("--messages", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=50, help="Page size")
+    parser.add_argument("--pages", type=int, default=200, help="Pages timed per depth")
+    parser.add_argument("--database-url", default=None, help="Defaults to a throwaway SQLite file")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='disha-bench-')}/history.db"
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
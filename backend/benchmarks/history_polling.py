@@ -0,0 +1,115 @@
+"""
+Conditional /chat/history polls, in one process through the ASGI app.
+
+Polls a user's history with and without the ETag from the previous
+response and counts DB pool checkouts: unchanged polls must come back as
+304 without any checkout. Then stores a new turn the way send_message does
+and checks that the old ETag now gets a full 200 with a new ETag, and
+that If-Modified-Since alone never gets a 304 (Last-Modified cannot tell
+apart messages stored in the same second).
+
+    python -m benchmarks.history_polling --polls 2000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='disha-bench-')}/bench.db")
+os.environ.setdefault("GOOGLE_API_KEY", "fake-key")
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from app.core.history_index import history_index  # noqa: E402
+from app.core.migrate import create_app_tables  # noqa: E402
+from app.routes.chat import router as chat_router  # noqa: E402
+from app.services.chat_service import ChatService  # noqa: E402
+from config.database import db_session, engine  # noqa: E402
+
+checkouts = 0
+
+
+def count_checkouts(*_):
+    global checkouts
+    checkouts += 1
+
+
+async def poll(client: httpx.AsyncClient, params: dict, headers: dict, count: int) -> tuple[float, set]:
+    statuses = set()
+    start = time.perf_counter()
+    for _ in range(count):
+        statuses.add((await client.get("/chat/history", params=params, headers=headers)).status_code)
+    return count / (time.perf_counter() - start), statuses
+
+
+async def store_turn(user_id: int, text: str):
+    # What send_message does once the reply exists, without the LLM
+    async with db_session() as db:
+        stored = await ChatService.insert_messages(db, [
+            {"user_id": user_id, "sender": "user", "content": text},
+            {"user_id": user_id, "sender": "assistant", "content": "Noted, thanks!"},
+        ])
+        await db.commit()
+    history_index.note(user_id, stored)
+
+
+async def run(args) -> bool:
+    global checkouts
+    await create_app_tables()
+    event.listen(engine.sync_engine.pool, "checkout", count_checkouts)
+
+    app = FastAPI()
+    app.include_router(chat_router)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        message, user_id = await ChatService.init_chat(None, None)
+        for i in range(args.turns):
+            await store_turn(user_id, f"Slept {i % 9} hours today")
+        params = {"user_id": user_id, "limit": 50}
+
+        first = await client.get("/chat/history", params=params)
+        etag, last_modified = first.headers["etag"], first.headers["last-modified"]
+
+        checkouts = 0
+        full_rps, full_statuses = await poll(client, params, {}, args.polls)
+        full_checkouts, checkouts = checkouts, 0
+        cond_rps, cond_statuses = await poll(client, params, {"If-None-Match": etag}, args.polls)
+        cond_checkouts, checkouts = checkouts, 0
+
+        await store_turn(user_id, "Had a headache after lunch")
+        changed = await client.get("/chat/history", params=params, headers={"If-None-Match": etag})
+        changed_ims = await client.get("/chat/history", params=params, headers={"If-Modified-Since": last_modified})
+        current_ims = await client.get(
+            "/chat/history", params=params, headers={"If-Modified-Since": changed.headers["last-modified"]}
+        )
+
+    await engine.dispose()
+
+    print(f"{args.polls} polls of 50 messages, one core")
+    print(f"without validators: {full_rps:7.0f} req/s, statuses {sorted(full_statuses)}, {full_checkouts} DB checkouts")
+    print(f"with If-None-Match: {cond_rps:7.0f} req/s, statuses {sorted(cond_statuses)}, {cond_checkouts} DB checkouts "
+          f"({cond_rps / full_rps:.1f}x)")
+    print(f"after a new turn: If-None-Match -> {changed.status_code} (new ETag {changed.headers['etag']}), "
+          f"If-Modified-Since -> {changed_ims.status_code}, current If-Modified-Since -> {current_ims.status_code}")
+
+    return (
+        cond_statuses == {304} and cond_checkouts == 0 and full_statuses == {200}
+        and changed.status_code == 200 and changed.headers["etag"] != etag
+        and changed_ims.status_code == 200 and current_ims.status_code == 200
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conditional history polling")
+    parser.add_argument("--polls", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=100, help="Turns stored before polling")
+    args = parser.parse_args()
+
+    raise SystemExit(0 if asyncio.run(run(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
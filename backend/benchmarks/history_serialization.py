@@ -0,0 +1,160 @@
+"""
+/chat/history requests per core, before and after the serialization fast
+path, in one process through the ASGI app (no network, no server).
+
+"before" is the previous route: ORM Message objects, a MessageDTO per
+message inside APIResponse[ChatHistoryDTO], validated again through
+response_model. "after" is the current route: column rows serialised
+straight to bytes by orjson. Both answers must be byte-identical.
+
+    python -m benchmarks.history_serialization --limit 50 --seconds 5
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='disha-bench-')}/bench.db")
+os.environ.setdefault("GOOGLE_API_KEY", "fake-key")
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+import httpx  # noqa: E402
+from fastapi import Depends, FastAPI  # noqa: E402
+from sqlalchemy import insert, select  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession  # noqa: E402
+
+from app.core.migrate import create_app_tables  # noqa: E402
+from app.dto.base_response import APIResponse  # noqa: E402
+from app.dto.chat_dto import ChatHistoryDTO, MessageDTO  # noqa: E402
+from app.models.message import Message  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.routes.chat import router as chat_router  # noqa: E402
+from app.services.history_service import HistoryService  # noqa: E402
+from app.utils.cursor import encode_cursor  # noqa: E402
+from config.database import db_session, engine, get_db  # noqa: E402
+
+
+def create_bench_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(chat_router)
+
+    @app.get("/before/history", response_model=APIResponse[ChatHistoryDTO])
+    async def history_before(user_id: int, limit: int = 20, db: AsyncSession = Depends(get_db)):
+        result = await db.execute(
+            select(Message).where(Message.user_id == user_id).order_by(Message.id.desc()).limit(limit + 1)
+        )
+        messages = list(result.scalars().all())
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        messages.reverse()
+
+        return APIResponse(
+            status=True,
+            message="History fetched successfully",
+            data=ChatHistoryDTO(
+                messages=[
+                    MessageDTO(id=m.id, sender=m.sender, content=m.content, created_at=m.created_at)
+                    for m in messages
+                ],
+                has_more=has_more,
+                next_cursor=encode_cursor(messages[0].id) if has_more else None
+            )
+        )
+
+    return app
+
+
+async def seed(messages: int) -> int:
+    async with db_session() as db:
+        user_id = (await db.execute(insert(User).returning(User.id))).scalar_one()
+        await db.execute(insert(Message).values([{
+            "user_id": user_id,
+            "sender": "user" if i % 2 == 0 else "assistant",
+            "content": f"Slept 6 hours and walked 4000 steps today, feeling a bit tired 😊 ({i})"
+        } for i in range(messages)]))
+        await db.commit()
+    return user_id
+
+
+def serialization_only(rows: list, repeat: int = 2000) -> tuple[float, float]:
+    # Microseconds per page for the serialization step alone
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    from app.utils.json_response import api_json, history_json
+
+    model = APIResponse[ChatHistoryDTO]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        response = APIResponse(status=True, message="History fetched successfully", data=ChatHistoryDTO(
+            messages=[MessageDTO(id=m.id, sender=m.sender, content=m.content, created_at=m.created_at) for m in rows],
+            has_more=True, next_cursor=None
+        ))
+        # What FastAPI does with response_model: validate again, encode, dump
+        JSONResponse(jsonable_encoder(model.model_validate(response.model_dump())))
+    before = (time.perf_counter() - start) / repeat * 1e6
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        api_json("History fetched successfully", {
+            "messages": history_json(rows), "has_more": True, "next_cursor": None
+        })
+    after = (time.perf_counter() - start) / repeat * 1e6
+    return before, after
+
+
+async def requests_per_second(client: httpx.AsyncClient, path: str, params: dict, seconds: float) -> float:
+    count, deadline = 0, time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        response = await client.get(path, params=params)
+        assert response.status_code == 200
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+async def run(args) -> bool:
+    await create_app_tables()
+    user_id = await seed(args.messages)
+    params = {"user_id": user_id, "limit": args.limit}
+
+    transport = httpx.ASGITransport(app=create_bench_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        before = (await client.get("/before/history", params=params)).content
+        after = (await client.get("/chat/history", params=params)).content
+        identical = before == after
+
+        # Warm both paths before timing
+        await requests_per_second(client, "/before/history", params, 0.5)
+        await requests_per_second(client, "/chat/history", params, 0.5)
+        before_rps = await requests_per_second(client, "/before/history", params, args.seconds)
+        after_rps = await requests_per_second(client, "/chat/history", params, args.seconds)
+
+    async with db_session() as db:
+        rows = (await HistoryService.get_history(db, user_id, None, args.limit))[0]
+    serialize_before, serialize_after = serialization_only(rows)
+
+    await engine.dispose()
+
+    print(f"pages of {args.limit} messages, {len(after)} bytes, one core")
+    print(f"before: {before_rps:7.0f} req/s  ({1000 / before_rps:.2f} ms/request)")
+    print(f"after:  {after_rps:7.0f} req/s  ({1000 / after_rps:.2f} ms/request)  {after_rps / before_rps:.2f}x")
+    print(f"serialization alone: {serialize_before:.0f} us -> {serialize_after:.0f} us per page "
+          f"({serialize_before / serialize_after:.1f}x)")
+    print(f"responses byte-identical: {identical}")
+    return identical
+
+
+def main():
+    parser = argparse.ArgumentParser(description="History response serialization, before vs after")
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    raise SystemExit(0 if asyncio.run(run(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+The LLM gateway against the fake Gemini with injected faults, each scenario
+comparing a plain gateway with the feature under test:
+
+- transient 503s on 30% of calls: no retries vs jittered retries, with the
+  circuit breaker on, as such errors must not trip it
+- 5% of calls 20x slower: no hedging vs hedging after 0.3s
+- a quota storm (every call 429): no breaker vs circuit breaker, then
+  recovery once the faults stop and the cooldown has passed
+- a burst of 100 calls against a 20/s token bucket: the rate Gemini sees
+  and how many calls are shed instead of queued
+- streams that go silent after their first chunk: each is abandoned with
+  LLMTimeout after the idle timeout, keeping the text already received
+
+Calls go straight through the google-genai client, without Memori or the
+API, so only the gateway is measured. Exits non-zero if a check fails.
+
+    python -m benchmarks.llm_faults
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+from google.genai import Client as GoogleClient
+from google.genai import types
+
+from app.core.llm_gateway import LLMError, LLMGateway, LLMTimeout
+from benchmarks.common import percentile, start_fake_gemini, wait_until_up
+
+
+async def faults(llm: httpx.AsyncClient, **settings):
+    defaults = {"error_rate": 0.0, "error_status": 503, "retry_delay": 0.0, "slow_rate": 0.0, "stall_rate": 0.0}
+    await llm.post("/faults", json={**defaults, **settings})
+
+
+async def server_calls(llm: httpx.AsyncClient) -> int:
+    return (await llm.get("/stats")).json()["generate"]
+
+
+async def load(gateway: LLMGateway, client: GoogleClient, llm: httpx.AsyncClient, calls: int, concurrency: int,
+               hedge: bool = False) -> dict:
+    limit = asyncio.Semaphore(concurrency)
+    latencies, failures = [], []
+
+    async def one():
+        async with limit:
+            start = time.perf_counter()
+            try:
+                await gateway.call(lambda: client.aio.models.generate_content(model="gemini-2.5-flash", contents="Hi"), hedge=hedge)
+                latencies.append(time.perf_counter() - start)
+            except LLMError as e:
+                failures.append((type(e).__name__, time.perf_counter() - start))
+
+    before = await server_calls(llm)
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(calls)])
+    return {
+        "ok": len(latencies) / calls,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "fail_p50": percentile([t for _, t in failures], 50),
+        "errors": sorted({name for name, _ in failures}),
+        "server_calls": await server_calls(llm) - before,
+        "elapsed": time.perf_counter() - start,
+    }
+
+
+async def stream(gateway: LLMGateway, client: GoogleClient) -> tuple[str, str | None, float]:
+    """
+    Reads one streamed reply the way stream_content does. Returns the text
+    received, the error that ended it and how long it took.
+    """
+    async def open_stream():
+        s = await client.aio.models.generate_content_stream(model="gemini-2.5-flash", contents="Hi")
+        return s, await anext(s, None)
+
+    start = time.perf_counter()
+    text, error = "", None
+    try:
+        s, chunk = await gateway.call(open_stream)
+        while chunk is not None:
+            text += chunk.text or ""
+            chunk = await gateway.next_chunk(s)
+    except LLMError as e:
+        error = type(e).__name__
+    return text, error, time.perf_counter() - start
+
+
+def row(label: str, r: dict) -> str:
+    return (f"  {label:<22} ok {r['ok']:6.1%}  p50 {r['p50'] * 1000:6.0f}ms  p99 {r['p99'] * 1000:6.0f}ms  "
+            f"failed in p50 {r['fail_p50'] * 1000:5.0f}ms  Gemini calls {r['server_calls']:4d}  {r['errors']}")
+
+
+async def run(args) -> bool:
+    client = GoogleClient(api_key="fake-key", http_options=types.HttpOptions(base_url=args.llm_url))
+    results = []
+    async with httpx.AsyncClient(base_url=args.llm_url) as llm:
+        await wait_until_up(llm, "/stats")
+        quick = {"backoff_base": 0.05, "backoff_max": 1.0}
+
+        await faults(llm, error_rate=0.3, error_status=503)
+        plain = await load(LLMGateway(retries=0, **quick), client, llm, args.calls, args.concurrency)
+        retried = await load(LLMGateway(retries=2, **quick), client, llm, args.calls, args.concurrency)
+        print(f"30% transient 503s, {args.calls} calls, {args.concurrency} at a time")
+        print(row("no retries", plain))
+        print(row("2 jittered retries", retried))
+        results.append(retried["ok"] >= 0.95 and retried["ok"] > plain["ok"] and retried["errors"] != ["LLMCircuitOpen"])
+
+        await faults(llm, slow_rate=0.05, slow_latency=20 * args.latency)
+        unhedged = await load(LLMGateway(), client, llm, args.calls, args.concurrency, hedge=True)
+        hedged = await load(LLMGateway(hedge_after=3 * args.latency), client, llm, args.calls, args.concurrency, hedge=True)
+        print(f"5% of calls at {20 * args.latency:.1f}s instead of {args.latency:.1f}s")
+        print(row("no hedging", unhedged))
+        print(row(f"hedge after {3 * args.latency:.1f}s", hedged))
+        results.append(hedged["p99"] < unhedged["p99"] / 2 and hedged["server_calls"] < 1.2 * args.calls)
+
+        await faults(llm, error_rate=1.0, error_status=429, retry_delay=0.2)
+        open_loop = await load(LLMGateway(breaker_failure_rate=2, **quick), client, llm, args.calls, args.concurrency)
+        breaker = LLMGateway(breaker_cooldown=1.0, **quick)
+        storm = await load(breaker, client, llm, args.calls, args.concurrency)
+        print("quota storm, every call 429")
+        print(row("no breaker", open_loop))
+        print(row("breaker", storm))
+        results.append(storm["server_calls"] < open_loop["server_calls"] / 4 and storm["fail_p50"] < 0.01)
+
+        await faults(llm)
+        await asyncio.sleep(1.1)
+        # One probe at a time while half open, the first success closes the circuit
+        recovered = await load(breaker, client, llm, args.concurrency, 1)
+        print(f"  faults cleared, after the cooldown: ok {recovered['ok']:.0%}, circuit {breaker.breaker.state}")
+        results.append(recovered["ok"] == 1 and breaker.breaker.state == "closed")
+
+        limited = LLMGateway(quota_rpm=20 * 60, burst=5, max_wait=1.0)
+        burst = await load(limited, client, llm, 100, 100)
+        rate = burst["server_calls"] / burst["elapsed"]
+        print("100 calls at once, token bucket 20/s (burst 5, wait up to 1s)")
+        print(f"  {burst['server_calls']} reached Gemini at {rate:.1f}/s, {limited.shed} shed at once "
+              f"(failed in p50 {burst['fail_p50'] * 1000:.0f}ms)")
+        results.append(burst["server_calls"] <= 5 + 20 * burst["elapsed"] + 1 and limited.shed > 0)
+
+        await faults(llm, stall_rate=1.0, stall_latency=30.0)
+        idle = LLMGateway(stream_idle_timeout=0.5)
+        stalled = await asyncio.gather(*[stream(idle, client) for _ in range(args.concurrency)])
+        await faults(llm)
+        text, error, elapsed = max(stalled, key=lambda r: r[2])
+        print(f"{args.concurrency} streams silent after their first chunk, idle timeout 0.5s")
+        print(f"  abandoned after at most {elapsed:.2f}s with {error}, kept {text!r}, gateway counted {idle.stalled} stalls")
+        results.append(
+            all(e == LLMTimeout.__name__ and t for t, e, _ in stalled) and elapsed < 5
+            and idle.stalled == args.concurrency
+        )
+    return all(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM gateway under injected faults")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--llm-port", type=int, default=9117)
+    args = parser.parse_args()
+    args.llm_url = f"http://127.0.0.1:{args.llm_port}"
+
+    fake = start_fake_gemini(args.llm_port, args.latency)
+    try:
+        ok = asyncio.run(run(args))
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
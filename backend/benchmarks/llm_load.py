@@ -0,0 +1,109 @@
+"""
+Checks that slow Gemini calls do not stall the rest of the API.
+
+Starts the fake Gemini server and the backend, fires a burst of slow
+/chat/message calls and keeps probing /health and /chat/history while they
+are in flight. The probe percentiles should stay flat regardless of how
+many LLM calls are running.
+
+    python -m benchmarks.llm_load --chats 200 --llm-latency 3
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import BACKEND_DIR, percentile, start_fake_gemini, wait_until_up
+
+
+async def probe(client: httpx.AsyncClient, path: str, params: dict | None, stop: asyncio.Event, samples: list[float]):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get(path, params=params)
+        samples.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.05)
+
+
+async def run(args):
+    async with httpx.AsyncClient(base_url=args.api_url, timeout=None, limits=httpx.Limits(max_connections=None)) as client:
+        await wait_until_up(client, "/health")
+
+        res = await client.post("/chat/init", json={"user_id": None})
+        user_id = res.json()["data"]["user_id"]
+
+        baseline = {"/health": [], "/chat/history": []}
+        stop = asyncio.Event()
+        probes = [
+            asyncio.create_task(probe(client, "/health", None, stop, baseline["/health"])),
+            asyncio.create_task(probe(client, "/chat/history", {"user_id": user_id}, stop, baseline["/chat/history"])),
+        ]
+        await asyncio.sleep(args.probe_seconds)
+        stop.set()
+        await asyncio.gather(*probes)
+
+        loaded = {"/health": [], "/chat/history": []}
+        stop = asyncio.Event()
+        probes = [
+            asyncio.create_task(probe(client, "/health", None, stop, loaded["/health"])),
+            asyncio.create_task(probe(client, "/chat/history", {"user_id": user_id}, stop, loaded["/chat/history"])),
+        ]
+
+        start = time.perf_counter()
+        chats = await asyncio.gather(*[
+            client.post("/chat/message", json={"user_id": user_id, "message": f"I have a fever #{i}"})
+            for i in range(args.chats)
+        ])
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await asyncio.gather(*probes)
+
+    failed = sum(1 for r in chats if r.status_code != 200)
+    print(f"{args.chats} chats with {args.llm_latency}s LLM latency finished in {elapsed:.2f}s ({failed} failed)")
+    print(f"{'endpoint':<16}{'phase':<10}{'n':>6}{'p50 ms':>10}{'p99 ms':>10}")
+    for path in baseline:
+        for phase, samples in (("idle", baseline[path]), ("loaded", loaded[path])):
+            print(f"{path:<16}{phase:<10}{len(samples):>6}{percentile(samples, 50):>10.1f}{percentile(samples, 99):>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event-loop responsiveness under slow LLM calls")
+    parser.add_argument("--chats", type=int, default=200, help="Concurrent /chat/message calls")
+    parser.add_argument("--llm-latency", type=float, default=3.0, help="Fake Gemini reply delay in seconds")
+    parser.add_argument("--probe-seconds", type=float, default=3.0, help="Length of the idle baseline")
+    parser.add_argument("--database-url", default=None, help="Defaults to a throwaway SQLite file")
+    parser.add_argument("--api-port", type=int, default=7100)
+    parser.add_argument("--llm-port", type=int, default=9100)
+    args = parser.parse_args()
+    args.api_url = f"http://127.0.0.1:{args.api_port}"
+
+    database_url = args.database_url or f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='disha-bench-')}/bench.db"
+    env = {
+        **os.environ,
+        "DATABASE_URL": database_url,
+        "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY", "fake-key"),
+        "GOOGLE_API_BASE_URL": f"http://127.0.0.1:{args.llm_port}",
+        "LLM_MAX_CONCURRENCY": os.getenv("LLM_MAX_CONCURRENCY", str(args.chats)),
+    }
+
+    processes = [
+        start_fake_gemini(args.llm_port, args.llm_latency, env=env),
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.api_port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env
+        ),
+    ]
+    try:
+        asyncio.run(run(args))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
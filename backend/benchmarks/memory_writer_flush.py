@@ -0,0 +1,215 @@
+"""
+Checks that the Memori write-behind queue loses no turns at shutdown and
+keeps working through failures.
+
+Flush: runs --users concurrent conversations of --turns messages each
+against the fake Gemini server, closes the writer as soon as the last reply
+is back (with writes still pending) and then looks every user message up in
+Memori's conversation tables. Also reports reply latency with the writes
+deferred vs. done inline.
+
+Failures, with faults injected into the client pool the writer uses:
+
+- the first slots cannot be built and one worker crashes on start: every
+  other user's turns are still stored and the dead worker is replaced
+- one user's writes always fail: they are dropped after the retries and
+  that user's next turns do not hang
+- no worker can build a slot at all: a turn waits for the user's pending
+  write only up to the timeout, and close() gives up after its own
+
+Exits non-zero if any check fails.
+
+    python -m benchmarks.memory_writer_flush --users 20 --turns 5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='disha-bench-')}/bench.db")
+os.environ.setdefault("GOOGLE_API_KEY", "fake-key")
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+from benchmarks.common import percentile, start_fake_gemini  # noqa: E402
+
+
+class FlakyPool:
+    """
+    The client pool as the writer sees it, with injected faults: the first
+    `slot_failures` slots fail to build and `bad_user`'s session cannot be
+    restored.
+    """
+
+    def __init__(self, pool, slot_failures: int, bad_user: int | None = None):
+        self.pool = pool
+        self.slot_failures = slot_failures
+        self.bad_user = bad_user
+
+    def new_slot(self):
+        if self.slot_failures:
+            self.slot_failures -= 1
+            raise ConnectionError("injected: Memori storage unavailable")
+        return self.pool.new_slot()
+
+    def restore_user(self, mem, user_id: int):
+        if user_id == self.bad_user:
+            raise RuntimeError("injected: session state unusable")
+        self.pool.restore_user(mem, user_id)
+
+    def save_user(self, mem, user_id: int):
+        self.pool.save_user(mem, user_id)
+
+
+def stored_messages() -> set[str]:
+    from sqlalchemy import text
+
+    from app.core.memori import engine
+
+    with engine.connect() as conn:
+        return {
+            row[0] for row in conn.execute(text(
+                "SELECT DISTINCT content FROM memori_conversation_message WHERE role = 'user'"
+            ))
+        }
+
+
+def check(label: str, ok: bool) -> bool:
+    print(f"  {label:<72} {'OK' if ok else 'FAIL'}")
+    return ok
+
+
+async def conversations(args, tag: str, first_user: int, users: int | None = None) -> list[float]:
+    from app.helper.llm_helper import generate_content
+
+    samples = []
+
+    async def conversation(user_id: int):
+        for turn in range(args.turns):
+            contents = [{"role": "user", "parts": [{"text": f"{tag} user {user_id} turn {turn}"}]}]
+            start = time.perf_counter()
+            await generate_content(user_id, contents, "Be brief.")
+            samples.append((time.perf_counter() - start) * 1000)
+            # Real users take a moment before their next message
+            if turn < args.turns - 1:
+                await asyncio.sleep(args.think)
+
+    # Separate users per phase, so neither starts with the other's Memori history
+    await asyncio.gather(*[conversation(u) for u in range(first_user, first_user + (users or args.users))])
+    return samples
+
+
+def expected_messages(args, tag: str, first_user: int, users: int) -> set[str]:
+    return {f"{tag} user {first_user + u} turn {t}" for u in range(users) for t in range(args.turns)}
+
+
+async def flush(args) -> bool:
+    from app.core.memory_writer import memory_writer
+    from app.helper.llm_helper import gemini_pool
+
+    inline = await conversations(args, "inline", 1)
+
+    memory_writer.start(gemini_pool)
+    deferred = await conversations(args, "deferred", 1 + args.users)
+    pending_at_close = memory_writer.stats()["pending"]
+    await memory_writer.close()
+    stats = memory_writer.stats()
+
+    expected = expected_messages(args, "inline", 1, args.users) | expected_messages(args, "deferred", 1 + args.users, args.users)
+    missing = expected - stored_messages()
+
+    print("flush at shutdown")
+    for name, samples in (("inline writes", inline), ("write-behind", deferred)):
+        print(f"  {name:<15} p50 {percentile(samples, 50):>7.2f} ms  p99 {percentile(samples, 99):>7.2f} ms")
+    print(f"  pending at close: {pending_at_close}, writer stats: {stats}")
+    results = [
+        check(f"every turn stored ({len(expected) - len(missing)}/{len(expected)})", not missing),
+        check("nothing dropped, nothing pending after close", stats["dropped"] == 0 and stats["pending"] == 0),
+    ]
+    return all(results)
+
+
+async def failures(args) -> bool:
+    from app.core.memory_writer import MemoryJob, MemoryWriter, memory_writer
+    from app.helper.llm_helper import gemini_pool
+
+    first_user = 1 + 2 * args.users
+    bad_user = first_user + args.users
+    print("failures")
+
+    # Two slots fail to build (retried with backoff), one worker dies on start
+    slot = memory_writer._slot
+    crashed = []
+
+    async def crash_once(pool):
+        if not crashed:
+            crashed.append(True)
+            raise RuntimeError("injected: writer crashed")
+        return await slot(pool)
+
+    memory_writer._slot = crash_once
+    before = memory_writer.stats()
+    memory_writer.start(FlakyPool(gemini_pool, slot_failures=2, bad_user=bad_user))
+    start = time.perf_counter()
+    await conversations(args, "faulty", first_user, args.users + 1)
+    elapsed = time.perf_counter() - start
+    await memory_writer.close()
+    memory_writer._slot = slot
+    stats = {k: v - before.get(k, 0) for k, v in memory_writer.stats().items()}
+
+    expected = expected_messages(args, "faulty", first_user, args.users)
+    missing = expected - stored_messages()
+    print(f"  writer stats: {stats}, {args.users + 1} conversations in {elapsed:.1f}s")
+    results = [
+        check("crashed worker replaced", stats["restarted"] == 1),
+        check(f"other users' turns stored despite slot failures ({len(expected) - len(missing)}/{len(expected)})", not missing),
+        check(f"user {bad_user}'s {args.turns} failing writes dropped, not hung", stats["dropped"] == args.turns),
+        check("nothing pending after close", memory_writer.stats()["pending"] == 0),
+    ]
+
+    # No slot at all: the job is never written, waiting for it is bounded
+    stuck = MemoryWriter(max_queue=10, workers=1, retries=0)
+    stuck.start(FlakyPool(gemini_pool, slot_failures=10 ** 9))
+    await stuck.submit(MemoryJob(bad_user, False, {}, time.time(), None, 0))
+    start = time.perf_counter()
+    await stuck.wait_for_user(bad_user, timeout=0.5)
+    waited = time.perf_counter() - start
+    start = time.perf_counter()
+    await stuck.close(timeout=0.5)
+    closed = time.perf_counter() - start
+    results.append(check(f"wait for a stuck write bounded ({waited:.2f}s)", waited < 1 and stuck.wait_timeouts == 1))
+    results.append(check(f"close with no live worker bounded ({closed:.2f}s)", closed < 1 and not stuck.running))
+    return all(results)
+
+
+async def run(args) -> bool:
+    from app.core.memori import memori, run_memori
+
+    await run_memori(memori.config.storage.build)
+    return all([await flush(args), await failures(args)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memori write-behind flush check")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--think", type=float, default=0.5, help="Seconds between a user's turns")
+    parser.add_argument("--llm-port", type=int, default=9102)
+    args = parser.parse_args()
+
+    os.environ["GOOGLE_API_BASE_URL"] = f"http://127.0.0.1:{args.llm_port}"
+
+    fake = start_fake_gemini(args.llm_port, latency=0)
+    try:
+        time.sleep(2)
+        ok = asyncio.run(run(args))
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Serves --chats concurrent /chat/message calls against a slow fake Gemini
+with a deliberately small DB pool (default 2 connections, no overflow).
+
+Sessions are only held around DB work, so every chat should succeed with
+the pool far smaller than the number of chats in flight. Reports latency,
+peak pool usage and checkout wait from /metrics, and exits non-zero if any
+chat failed.
+
+    python -m benchmarks.pool_saturation --chats 500 --pool-size 2 --llm-latency 2
+"""
+import argparse
+import asyncio
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import BACKEND_DIR, percentile, start_fake_gemini, wait_until_up
+
+CHECKED_OUT = re.compile(r'disha_db_pool_connections\{pool="app",state="checked_out"\} (\d+)')
+CHECKOUT_BUCKET = re.compile(r'disha_db_pool_checkout_seconds_bucket\{pool="app",le="([^"]+)"\} (\d+)')
+
+
+def checkout_wait_percentile(metrics: str, q: float) -> str:
+    # Upper bound of the histogram bucket holding the q-th percentile
+    buckets = [(bound, int(n)) for bound, n in CHECKOUT_BUCKET.findall(metrics)]
+    if not buckets or not buckets[-1][1]:
+        return "n/a"
+    target = buckets[-1][1] * q / 100
+    bound = next(bound for bound, n in buckets if n >= target)
+    return f"<= {float(bound) * 1000:g} ms" if bound != "+Inf" else "> 30 s"
+
+
+async def run(args) -> bool:
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=args.api_url, timeout=args.timeout, limits=limits) as client:
+        await wait_until_up(client, "/health/ready", timeout=120)
+
+        user_ids = []
+        for _ in range(args.chats):
+            response = await client.post("/chat/init", json={"user_id": None})
+            user_ids.append(response.json()["data"]["user_id"])
+
+        peak = 0
+        done = asyncio.Event()
+
+        async def sample():
+            nonlocal peak
+            while not done.is_set():
+                match = CHECKED_OUT.search((await client.get("/metrics")).text)
+                peak = max(peak, int(match.group(1)) if match else 0)
+                await asyncio.sleep(0.2)
+
+        async def chat(user_id: int):
+            start = time.perf_counter()
+            try:
+                response = await client.post("/chat/message", json={"user_id": user_id, "message": "I have a fever since yesterday"})
+                ok = response.status_code == 200 and response.json()["status"]
+            except httpx.HTTPError:
+                ok = False
+            return ok, (time.perf_counter() - start) * 1000
+
+        sampler = asyncio.create_task(sample())
+        start = time.perf_counter()
+        results = await asyncio.gather(*[chat(u) for u in user_ids])
+        elapsed = time.perf_counter() - start
+        done.set()
+        await sampler
+
+        metrics = (await client.get("/metrics")).text
+
+    ok = sum(1 for success, _ in results if success)
+    latencies = [ms for _, ms in results]
+    print(f"{args.chats} concurrent chats, DB pool {args.pool_size}+{args.max_overflow}, "
+          f"LLM latency {args.llm_latency}s, {args.llm_slots} LLM slots")
+    print(f"succeeded {ok}/{args.chats} in {elapsed:.1f}s")
+    print(f"latency p50 {percentile(latencies, 50):.0f} ms  p99 {percentile(latencies, 99):.0f} ms")
+    print(f"peak app connections checked out: {peak}")
+    print(f"checkout wait p50 {checkout_wait_percentile(metrics, 50)}, p99 {checkout_wait_percentile(metrics, 99)}")
+    return ok == args.chats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Many slow chats through a small DB pool")
+    parser.add_argument("--chats", type=int, default=500)
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--max-overflow", type=int, default=0)
+    parser.add_argument("--llm-latency", type=float, default=2.0)
+    parser.add_argument("--llm-slots", type=int, default=100, help="LLM_MAX_CONCURRENCY for the app")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--api-port", type=int, default=7112)
+    parser.add_argument("--llm-port", type=int, default=9112)
+    args = parser.parse_args()
+    args.api_url = f"http://127.0.0.1:{args.api_port}"
+
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='disha-bench-')}/bench.db",
+        "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY", "fake-key"),
+        "GOOGLE_API_BASE_URL": f"http://127.0.0.1:{args.llm_port}",
+        "HF_HUB_OFFLINE": os.getenv("HF_HUB_OFFLINE", "1"),
+        "DB_POOL_SIZE": str(args.pool_size),
+        "DB_MAX_OVERFLOW": str(args.max_overflow),
+        "LLM_MAX_CONCURRENCY": str(args.llm_slots),
+        "RESPONSE_CACHE_ENABLED": "0",
+    }
+
+    processes = [
+        start_fake_gemini(args.llm_port, args.llm_latency, env=env),
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.api_port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env
+        ),
+    ]
+    try:
+        ok = asyncio.run(run(args))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Protocol matching cost as the protocol library grows from 5 to 5,000 entries.
+
+Compares the compiled ProtocolMatcher with the previous approach (a substring
+check per keyword, in a Python loop) on the same synthetic protocol sets.
+
+    python -m benchmarks.protocol_matcher
+"""
+import argparse
+import random
+import string
+import time
+
+from app.services.protocol_service import ProtocolMatcher, load_protocols
+
+MESSAGES = [
+    "Hi Disha, I have had a fever since yesterday and my whole body aches.",
+    "headache since morning, also feeling a bit dizzy after lunch today",
+    "My belly hurts after eating outside, should I be worried about it?",
+    "I just wanted to say thanks, I walked 8000 steps today and slept well!",
+    "Can I get a refund for my plan? I have not used it at all this week.",
+]
+
+
+def synthetic_protocols(count: int, rng: random.Random) -> list[dict]:
+    protocols = load_protocols()
+    while len(protocols) < count:
+        keywords = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 11))) for _ in range(3)]
+        protocols.append({"name": f"protocol_{len(protocols)}", "keywords": keywords, "text": "..."})
+    return protocols[:count]
+
+
+def substring_match(protocols: list[dict], message: str) -> list[str]:
+    message_lower = message.lower()
+    return [p["name"] for p in protocols if any(k in message_lower for k in p["keywords"])]
+
+
+def time_per_message(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message in MESSAGES:
+            fn(message)
+    return (time.perf_counter() - start) / (repeat * len(MESSAGES)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Protocol matcher scaling")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    print(f"{'protocols':>10}{'substring us':>15}{'compiled us':>14}{'build ms':>10}")
+    for count in (5, 50, 500, 5000):
+        protocols = synthetic_protocols(count, rng)
+
+        start = time.perf_counter()
+        matcher = ProtocolMatcher(protocols)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        legacy = time_per_message(lambda m: substring_match(protocols, m), args.repeat)
+        compiled = time_per_message(matcher.match, args.repeat)
+        print(f"{count:>10}{legacy:>15.2f}{compiled:>14.2f}{build_ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+TF-IDF protocol retrieval latency as the corpus grows to tens of thousands.
+
+Builds a synthetic corpus (the real protocols plus generated ones drawing
+words from a Zipf-distributed vocabulary), writes the index to a temporary
+directory, memory-maps it back and times ProtocolIndex.search.
+
+    python -m benchmarks.protocol_retrieval
+"""
+import argparse
+import random
+import string
+import tempfile
+import time
+from pathlib import Path
+
+from app.core.protocol_index import ProtocolIndex, build_index
+from app.services.protocol_service import load_protocols
+from benchmarks.common import percentile
+from benchmarks.protocol_matcher import MESSAGES
+
+
+def synthetic_protocols(count: int, rng: random.Random, vocab_size: int = 50_000) -> list[dict]:
+    vocab = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10))) for _ in range(vocab_size)]
+    # Zipf-like weights so a few words are common across protocols, like real text
+    weights = [1 / (rank + 1) for rank in range(vocab_size)]
+
+    protocols = load_protocols()
+    while len(protocols) < count:
+        protocols.append({
+            "name": f"protocol_{len(protocols)}",
+            "keywords": rng.sample(vocab[:5000], 3),
+            "text": " ".join(rng.choices(vocab, weights=weights, k=60))
+        })
+    return protocols[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Protocol retrieval latency")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    print(f"{'protocols':>10}{'build s':>9}{'load ms':>9}{'p50 us':>9}{'p99 us':>9}")
+    for count in (5, 1000, 10_000, 50_000):
+        protocols = synthetic_protocols(count, rng)
+        # Mix real messages with ones that hit common synthetic words
+        queries = MESSAGES + [" ".join(rng.choice(protocols)["text"].split()[:8]) for _ in range(20)]
+
+        with tempfile.TemporaryDirectory(prefix="disha-index-") as tmp:
+            start = time.perf_counter()
+            build_index(protocols, Path(tmp))
+            build_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            index = ProtocolIndex(Path(tmp))
+            load_ms = (time.perf_counter() - start) * 1000
+
+            samples = []
+            for i in range(args.queries):
+                query = queries[i % len(queries)]
+                start = time.perf_counter()
+                index.search(query, args.top_k)
+                samples.append((time.perf_counter() - start) * 1e6)
+
+        print(f"{count:>10}{build_s:>9.2f}{load_ms:>9.1f}{percentile(samples, 50):>9.1f}{percentile(samples, 99):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
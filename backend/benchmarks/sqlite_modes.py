@@ -0,0 +1,168 @@
+"""
+Compares SQLite configurations: the previous default (rollback journal,
+every request commits on its own), WAL with the tuned pragmas, and WAL plus
+the single-writer group-commit queue.
+
+The default run drives the DB layer directly: --writers tasks store chat
+turns through db_writer while --readers tasks page history, which isolates
+commit throughput and lock errors. --suite also runs the end-to-end load
+suite per mode. Each mode gets a fresh database file and process.
+
+    python -m benchmarks.sqlite_modes --writers 64 --readers 16
+    python -m benchmarks.sqlite_modes --suite --levels 8,32,64 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import BACKEND_DIR, percentile
+
+MODES = {
+    "journal": {"SQLITE_TUNING": "0", "SQLITE_WRITE_QUEUE": "0"},
+    "wal": {"SQLITE_TUNING": "1", "SQLITE_WRITE_QUEUE": "0"},
+    "wal+queue": {"SQLITE_TUNING": "1", "SQLITE_WRITE_QUEUE": "1"},
+}
+
+
+async def db_load(args) -> dict:
+    # Runs inside a child process whose environment selects the mode
+    import app.models  # noqa: F401
+    from app.core.db_writer import SQLITE_WRITE_QUEUE, db_writer
+    from app.services.chat_service import ChatService
+    from app.services.history_service import HistoryService
+    from config.database import Base, db_session, engine
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    if SQLITE_WRITE_QUEUE:
+        db_writer.start()
+
+    write_ms, read_ms = [], []
+    errors = 0
+    deadline = time.monotonic() + args.duration
+
+    async def writer(user_id: int):
+        nonlocal errors
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                await db_writer.write_rows(ChatService.insert_messages, [
+                    {"user_id": user_id, "sender": "user", "content": "I have a fever"},
+                    {"user_id": user_id, "sender": "assistant", "content": "How long have you had it?"},
+                ])
+                write_ms.append((time.perf_counter() - start) * 1000)
+            except Exception:
+                errors += 1
+
+    async def reader(user_id: int):
+        nonlocal errors
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                async with db_session() as db:
+                    await HistoryService.get_history(db, user_id, None, 20)
+                read_ms.append((time.perf_counter() - start) * 1000)
+            except Exception:
+                errors += 1
+            await asyncio.sleep(args.read_think)
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *[writer(u) for u in range(1, args.writers + 1)],
+        *[reader(u) for u in range(1, args.readers + 1)],
+    )
+    elapsed = time.perf_counter() - start
+    await db_writer.close()
+    # aiosqlite connection threads keep the process alive until closed
+    await engine.dispose()
+
+    return {
+        "writes_per_s": round(len(write_ms) / elapsed, 1),
+        "write_p50_ms": round(percentile(write_ms, 50), 2),
+        "write_p99_ms": round(percentile(write_ms, 99), 2),
+        "reads_per_s": round(len(read_ms) / elapsed, 1),
+        "read_p99_ms": round(percentile(read_ms, 99), 2),
+        "errors": errors,
+        "avg_batch": db_writer.stats()["avg_batch"],
+    }
+
+
+def run_db_mode(name: str, overrides: dict, args) -> dict:
+    env = {
+        **os.environ, **overrides,
+        "DATABASE_URL": f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='disha-bench-')}/bench.db",
+        "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY", "fake-key"),
+        "HF_HUB_OFFLINE": os.getenv("HF_HUB_OFFLINE", "1"),
+    }
+    command = [
+        sys.executable, "-m", "benchmarks.sqlite_modes", "--child",
+        "--writers", str(args.writers), "--readers", str(args.readers), "--duration", str(args.duration),
+        "--read-think", str(args.read_think),
+    ]
+    output = subprocess.run(command, cwd=BACKEND_DIR, env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_suite_mode(name: str, overrides: dict, args) -> list[dict]:
+    out = os.path.join(tempfile.mkdtemp(prefix="disha-bench-"), f"{name}.json")
+    command = [
+        sys.executable, "-m", "benchmarks.suite",
+        "--levels", args.levels, "--duration", str(args.duration),
+        "--llm-latency", str(args.llm_latency), "--save", out,
+    ]
+    print(f"== {name}", flush=True)
+    subprocess.run(command, cwd=BACKEND_DIR, env={**os.environ, **overrides}, check=True)
+    with open(out, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite journal vs WAL vs WAL + write queue")
+    parser.add_argument("--writers", type=int, default=64)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--read-think", type=float, default=0.01, help="Seconds between a reader's history pages")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--suite", action="store_true", help="Also run the end-to-end load suite per mode")
+    parser.add_argument("--levels", default="8,32,64")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(db_load(args))))
+        return
+
+    modes = args.modes.split(",")
+    print(f"DB layer: {args.writers} writers, {args.readers} readers, {args.duration}s per mode")
+    print(f"{'mode':<12}{'writes/s':>10}{'w p50':>9}{'w p99':>10}{'reads/s':>10}{'r p99':>9}{'errors':>8}{'batch':>7}")
+    for name in modes:
+        r = run_db_mode(name, MODES[name], args)
+        print(
+            f"{name:<12}{r['writes_per_s']:>10.1f}{r['write_p50_ms']:>7.1f}ms{r['write_p99_ms']:>8.1f}ms"
+            f"{r['reads_per_s']:>10.1f}{r['read_p99_ms']:>7.1f}ms{r['errors']:>8}{r['avg_batch']:>7}",
+            flush=True
+        )
+
+    if not args.suite:
+        return
+
+    results = {name: run_suite_mode(name, MODES[name], args) for name in modes}
+    print(f"\n{'mode':<12}{'conc':>6}{'req/s':>9}{'errors':>8}{'init p95':>11}{'message p95':>13}{'history p95':>13}")
+    for name, levels in results.items():
+        for level in levels:
+            endpoints = level["endpoints"]
+            p95 = [endpoints.get(e, {}).get("p95_ms", float("nan")) for e in ("/chat/init", "/chat/message", "/chat/history")]
+            print(
+                f"{name:<12}{level['concurrency']:>6}{level['throughput_rps']:>9.1f}{level['errors']:>8}"
+                f"{p95[0]:>9.0f}ms{p95[1]:>11.0f}ms{p95[2]:>11.0f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
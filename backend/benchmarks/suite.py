@@ -0,0 +1,252 @@
+"""
+End-to-end load suite and performance regression gate.
+
+Starts the fake Gemini server and `main:app` (throwaway SQLite by default,
+or --database-url for a local Postgres), then runs virtual users through
+/chat/init -> N x /chat/message (or /chat/message/stream) -> /chat/history
+journeys at each concurrency level. Reports throughput, p50/p95/p99 per
+endpoint, errors and the peak number of DB connections in use, sampled
+from /metrics.
+
+    python -m benchmarks.suite --levels 1,8,32,128 --duration 20
+    python -m benchmarks.suite --save baseline.json
+    python -m benchmarks.suite --baseline baseline.json --tolerance 0.15
+
+With --baseline the exit code is 1 if any level regressed: p95 or
+throughput worse than the tolerance allows, or more errors.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+from benchmarks.common import BACKEND_DIR, percentile, start_fake_gemini, wait_until_up
+
+MESSAGES = [
+    "I have a fever since yesterday",
+    "headache since morning, what should I do?",
+    "My stomach hurts after lunch",
+    "I walked 8000 steps today!",
+    "Slept only 5 hours, feeling tired",
+    "Should I drink more water when I have a cold?",
+]
+
+POOL_GAUGE = re.compile(r'disha_db_pool_connections\{pool="(\w+)",state="checked_out"\} (\d+)')
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    async def call(self, name: str, request):
+        start = time.perf_counter()
+        try:
+            response = await request
+            ok = response.status_code == 200 and response.json().get("status", True) is not False
+        except (httpx.HTTPError, ValueError):
+            ok = False
+            response = None
+        self.samples[name].append((time.perf_counter() - start) * 1000)
+        if not ok:
+            self.errors[name] += 1
+        return response if ok else None
+
+
+async def stream_message(client: httpx.AsyncClient, user_id: int, message: str) -> httpx.Response:
+    # Consumes the whole event stream, a failed stream ends with an `error` event
+    async with client.stream("POST", "/chat/message/stream", json={"user_id": user_id, "message": message}) as response:
+        body = "".join([chunk async for chunk in response.aiter_text()])
+    if "event: error" in body or "event: done" not in body:
+        return httpx.Response(500, json={"status": False})
+    return httpx.Response(response.status_code, json={"status": True})
+
+
+async def journey(client: httpx.AsyncClient, recorder: Recorder, args, rng: random.Random):
+    response = await recorder.call("/chat/init", client.post("/chat/init", json={"user_id": None}))
+    if response is None:
+        return
+    user_id = response.json()["data"]["user_id"]
+
+    for _ in range(args.messages):
+        message = rng.choice(MESSAGES)
+        if rng.random() < args.stream_ratio:
+            await recorder.call("/chat/message/stream", stream_message(client, user_id, message))
+        else:
+            await recorder.call("/chat/message", client.post("/chat/message", json={"user_id": user_id, "message": message}))
+
+    await recorder.call("/chat/history", client.get("/chat/history", params={"user_id": user_id, "limit": 20}))
+
+
+async def sample_pools(client: httpx.AsyncClient, stop: asyncio.Event, peaks: dict[str, int]):
+    while not stop.is_set():
+        try:
+            text = (await client.get("/metrics")).text
+            for pool, checked_out in POOL_GAUGE.findall(text):
+                peaks[pool] = max(peaks.get(pool, 0), int(checked_out))
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.5)
+
+
+async def run_level(client: httpx.AsyncClient, args, concurrency: int) -> dict:
+    recorder = Recorder()
+    peaks: dict[str, int] = {}
+    stop = asyncio.Event()
+    deadline = time.monotonic() + args.duration
+
+    async def virtual_user(seed: int):
+        rng = random.Random(seed)
+        journeys = 0
+        while time.monotonic() < deadline:
+            await journey(client, recorder, args, rng)
+            journeys += 1
+        return journeys
+
+    sampler = asyncio.create_task(sample_pools(client, stop, peaks))
+    start = time.perf_counter()
+    journeys = sum(await asyncio.gather(*[virtual_user(concurrency * 1000 + i) for i in range(concurrency)]))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await sampler
+
+    requests = sum(len(s) for s in recorder.samples.values())
+    return {
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 2),
+        "journeys": journeys,
+        "throughput_rps": round(requests / elapsed, 2),
+        "errors": sum(recorder.errors.values()),
+        "db_connections_peak": peaks,
+        "endpoints": {
+            name: {
+                "n": len(samples),
+                "errors": recorder.errors[name],
+                "p50_ms": round(percentile(samples, 50), 2),
+                "p95_ms": round(percentile(samples, 95), 2),
+                "p99_ms": round(percentile(samples, 99), 2),
+            }
+            for name, samples in sorted(recorder.samples.items())
+        },
+    }
+
+
+def print_level(result: dict):
+    pools = " ".join(f"{pool}={n}" for pool, n in sorted(result["db_connections_peak"].items()))
+    print(
+        f"\nconcurrency {result['concurrency']}: {result['throughput_rps']} req/s, "
+        f"{result['journeys']} journeys, {result['errors']} errors, peak DB connections {pools or 'n/a'}"
+    )
+    print(f"  {'endpoint':<24}{'n':>7}{'err':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in result["endpoints"].items():
+        print(f"  {name:<24}{stats['n']:>7}{stats['errors']:>6}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+
+
+def regressions(results: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+    found = []
+    previous = {r["concurrency"]: r for r in baseline}
+    for result in results:
+        base = previous.get(result["concurrency"])
+        if base is None:
+            continue
+
+        level = f"concurrency {result['concurrency']}"
+        if result["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            found.append(f"{level}: throughput {result['throughput_rps']} < baseline {base['throughput_rps']}")
+        if result["errors"] > base["errors"]:
+            found.append(f"{level}: {result['errors']} errors, baseline had {base['errors']}")
+
+        for name, stats in result["endpoints"].items():
+            base_stats = base["endpoints"].get(name)
+            if base_stats and stats["p95_ms"] > base_stats["p95_ms"] * (1 + tolerance):
+                found.append(f"{level}: {name} p95 {stats['p95_ms']} ms > baseline {base_stats['p95_ms']} ms")
+    return found
+
+
+async def run(args) -> list[dict]:
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=args.api_url, timeout=args.timeout, limits=limits) as client:
+        await wait_until_up(client, "/health", timeout=60)
+
+        # Warm the pools and caches so the first level is not measuring startup
+        await journey(client, Recorder(), args, random.Random(0))
+
+        results = []
+        for concurrency in args.levels:
+            result = await run_level(client, args, concurrency)
+            print_level(result)
+            results.append(result)
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load suite and regression gate")
+    parser.add_argument("--levels", default="1,8,32,128", help="Comma separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per level")
+    parser.add_argument("--messages", type=int, default=3, help="Messages per journey")
+    parser.add_argument("--stream-ratio", type=float, default=0.0, help="Share of messages sent via /chat/message/stream")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Fake Gemini time to first token")
+    parser.add_argument("--token-rate", type=float, default=50, help="Fake Gemini streamed words per second")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request client timeout")
+    parser.add_argument("--database-url", default=None, help="Defaults to a throwaway SQLite file")
+    parser.add_argument("--save", help="Write the results as JSON, e.g. to use as a baseline")
+    parser.add_argument("--baseline", help="Results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative slowdown vs the baseline")
+    parser.add_argument("--api-port", type=int, default=7110)
+    parser.add_argument("--llm-port", type=int, default=9110)
+    args = parser.parse_args()
+    args.levels = [int(level) for level in args.levels.split(",")]
+    args.api_url = f"http://127.0.0.1:{args.api_port}"
+
+    database_url = args.database_url or f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='disha-bench-')}/bench.db"
+    env = {
+        **os.environ,
+        "DATABASE_URL": database_url,
+        "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY", "fake-key"),
+        "GOOGLE_API_BASE_URL": f"http://127.0.0.1:{args.llm_port}",
+        # No model downloads during a benchmark
+        "HF_HUB_OFFLINE": os.getenv("HF_HUB_OFFLINE", "1"),
+    }
+
+    print(f"database {database_url}, fake LLM latency {args.llm_latency}s, {args.token_rate} words/s")
+    processes = [
+        start_fake_gemini(args.llm_port, args.llm_latency, args.token_rate, env=env),
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.api_port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env
+        ),
+    ]
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nresults written to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        if found:
+            print("\nREGRESSIONS")
+            for line in found:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nno regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
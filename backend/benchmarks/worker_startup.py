@@ -0,0 +1,74 @@
+"""
+Measures multi-worker startup through serve.py: the migration step, then
+time until the first and until every worker answers /health/ready, with
+each worker's own import / warm-up breakdown.
+
+    python -m benchmarks.worker_startup --workers 4
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import BACKEND_DIR
+
+
+async def wait_for_workers(url: str, workers: int, timeout: float, launched: float) -> dict:
+    ready: dict[int, dict] = {}
+    first_ready = None
+    async with httpx.AsyncClient(base_url=url, timeout=2) as client:
+        while len(ready) < workers and time.perf_counter() - launched < timeout:
+            try:
+                # New connections are spread across the workers sharing the socket
+                response = await client.get("/health/ready", headers={"Connection": "close"})
+                if response.status_code == 200:
+                    data = response.json()["data"]
+                    ready.setdefault(data["pid"], data["startup_seconds"])
+                    first_ready = first_ready or time.perf_counter() - launched
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.05)
+    return {"first_ready": first_ready, "all_ready": time.perf_counter() - launched, "workers": ready}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-worker startup time")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--api-port", type=int, default=7111)
+    args = parser.parse_args()
+
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='disha-bench-')}/bench.db",
+        "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY", "fake-key"),
+        "HF_HUB_OFFLINE": os.getenv("HF_HUB_OFFLINE", "1"),
+    }
+
+    launched = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(args.workers), "--port", str(args.api_port)],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        result = asyncio.run(wait_for_workers(f"http://127.0.0.1:{args.api_port}", args.workers, args.timeout, launched))
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"{args.workers} workers on {os.cpu_count()} CPUs")
+    print(f"first worker ready after {result['first_ready'] or float('nan'):.2f}s, "
+          f"{len(result['workers'])}/{args.workers} ready after {result['all_ready']:.2f}s")
+    for pid, phases in sorted(result["workers"].items()):
+        print(f"  worker {pid}: " + ", ".join(f"{k} {v:.2f}s" for k, v in phases.items()))
+
+    sys.exit(0 if len(result["workers"]) == args.workers else 1)
+
+
+if __name__ == "__main__":
+    main()
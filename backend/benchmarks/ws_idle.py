@@ -0,0 +1,167 @@
+"""
+Idle /chat/ws connections against a real uvicorn worker:
+
+- opens thousands of WebSocket connections spread over a few users and
+  reads the worker's resident memory (VmRSS) before and after, giving the
+  memory held per idle connection
+- sends a turn for one user and checks that exactly that user's sockets
+  get the user and assistant messages, and nobody else's
+- reconnects with after_id and checks the missed messages are replayed
+
+Exits non-zero on any violation. Linux only (reads /proc).
+
+    python -m benchmarks.ws_idle --connections 5000
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from websockets.asyncio.client import connect
+
+from benchmarks.common import BACKEND_DIR, percentile, start_fake_gemini, wait_until_up
+
+
+def rss_kib(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    raise RuntimeError("VmRSS not found")
+
+
+async def push_stats(client: httpx.AsyncClient) -> dict:
+    return (await client.get("/health")).json()["data"]["push"]
+
+
+async def open_sockets(ws_url: str, user_ids: list[int], count: int, batch: int) -> list:
+    sockets = []
+    for start in range(0, count, batch):
+        sockets += await asyncio.gather(*[
+            connect(f"{ws_url}?user_id={user_ids[i % len(user_ids)]}", ping_interval=None, max_queue=None)
+            for i in range(start, min(start + batch, count))
+        ])
+    return sockets
+
+
+async def received(socket, timeout: float, count: int | None = None) -> list[dict]:
+    # Stops after `count` events, or once nothing arrives for `timeout` seconds
+    events = []
+    try:
+        while count is None or len(events) < count:
+            events.append(json.loads(await asyncio.wait_for(socket.recv(), timeout)))
+    except asyncio.TimeoutError:
+        pass
+    return events
+
+
+async def run(args, server_pid: int) -> bool:
+    ws_url = args.api_url.replace("http://", "ws://") + "/chat/ws"
+    async with httpx.AsyncClient(base_url=args.api_url, timeout=120) as client:
+        await wait_until_up(client, "/health/ready", timeout=120)
+
+        greetings = [(await client.post("/chat/init", json={"user_id": None})).json()["data"] for _ in range(args.users)]
+        user_ids = [g["user_id"] for g in greetings]
+
+        # Warm the handler path so lazily built state is not billed to the idle sockets
+        for socket in await open_sockets(ws_url, user_ids, args.batch, args.batch):
+            await socket.close()
+        await asyncio.sleep(1)
+        before = rss_kib(server_pid)
+
+        start = time.perf_counter()
+        sockets = await open_sockets(ws_url, user_ids, args.connections, args.batch)
+        opened_in = time.perf_counter() - start
+        await asyncio.sleep(args.settle)
+        after = rss_kib(server_pid)
+        stats = await push_stats(client)
+
+        per_connection = (after - before) * 1024 / args.connections
+        print(f"{args.connections} idle connections over {args.users} users ({args.ws}), opened in {opened_in:.1f}s")
+        print(f"worker VmRSS {before / 1024:.1f} MiB -> {after / 1024:.1f} MiB, "
+              f"{per_connection / 1024:.1f} KiB per connection; broker sees {stats['connections']}")
+        results = [stats["connections"] == args.connections]
+
+        # One turn for the first user, every socket of that user gets both messages
+        target = user_ids[0]
+        start = time.perf_counter()
+        reply = (await client.post("/chat/message", json={"user_id": target, "message": "I slept badly"})).json()["data"]
+        mine = [s for i, s in enumerate(sockets) if user_ids[i % len(user_ids)] == target]
+        others = [s for i, s in enumerate(sockets) if user_ids[i % len(user_ids)] != target][:200]
+        got = await asyncio.gather(*[received(s, 2.0, 2) for s in mine])
+        arrival = time.perf_counter() - start
+        got = [events + await received(s, 0.2) for s, events in zip(mine, got)]
+        leaked = sum(len(events) for events in await asyncio.gather(*[received(s, 0.2) for s in others]))
+        ids = {tuple(e["data"]["id"] for e in events) for events in got}
+        pushed_ok = ids == {(reply["id"] - 1, reply["id"])} and leaked == 0
+        print(f"push: {len(mine)} sockets of user {target} got ids {sorted(ids)}, "
+              f"{leaked} events on {len(others)} other users' sockets, "
+              f"all delivered {arrival * 1000:.0f}ms after sending the request  {'OK' if pushed_ok else 'FAIL'}")
+        results.append(pushed_ok)
+
+        # A reconnect after the greeting catches up on the turn it missed
+        async with connect(f"{ws_url}?user_id={target}&after_id={greetings[0]['message']['id']}") as socket:
+            replayed = [e["data"]["id"] for e in await received(socket, 1.0)]
+        replay_ok = replayed == [reply["id"] - 1, reply["id"]]
+        print(f"reconnect with after_id: replayed {replayed}  {'OK' if replay_ok else 'FAIL'}")
+        results.append(replay_ok)
+
+        latencies = []
+        for socket in sockets:
+            start = time.perf_counter()
+            await socket.close()
+            latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(1)
+        stats = await push_stats(client)
+        print(f"closed all, p50 close {percentile(latencies, 50) * 1000:.1f}ms; broker now sees "
+              f"{stats['connections']} connections, {stats['delivered']} delivered, {stats['dropped']} dropped")
+        results.append(stats["connections"] == 0)
+    return all(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Idle WebSocket connections: memory and push delivery")
+    parser.add_argument("--connections", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--batch", type=int, default=250, help="Connections opened concurrently")
+    parser.add_argument("--settle", type=float, default=2.0, help="Seconds idle before measuring")
+    parser.add_argument("--ws", default="websockets-sansio", help="uvicorn WebSocket implementation")
+    parser.add_argument("--api-port", type=int, default=7115)
+    parser.add_argument("--llm-port", type=int, default=9115)
+    args = parser.parse_args()
+    args.api_url = f"http://127.0.0.1:{args.api_port}"
+    args.llm_url = f"http://127.0.0.1:{args.llm_port}"
+
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='disha-bench-')}/bench.db",
+        "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY", "fake-key"),
+        "GOOGLE_API_BASE_URL": args.llm_url,
+        "HF_HUB_OFFLINE": os.getenv("HF_HUB_OFFLINE", "1"),
+    }
+
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.api_port),
+            "--log-level", "warning", "--backlog", "4096", "--ws", args.ws
+        ],
+        cwd=BACKEND_DIR, env=env
+    )
+    processes = [start_fake_gemini(args.llm_port, 0.05, env=env), server]
+    try:
+        ok = asyncio.run(run(args, server.pid))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
 import os
 import json
+import asyncio
 from pathlib import Path
 
 from dotenv import load_dotenv
 from fastapi import HTTPException
+from sqlalchemy import event, text
 from sqlalchemy.ext.asyncio import (
     AsyncSession,
     create_async_engine,
@@ -17,11 +19,18 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL is not set in environment variables")
 
-# Connection pool settings
-POOL_SIZE = 20
-MAX_OVERFLOW = 2
-POOL_TIMEOUT = 15
-POOL_RECYCLE = 3600
+# Connection pool settings, per worker process. With DB_MAX_CONNECTIONS (what
+# the server allows this service in total) the pool defaults to an even share
+# per worker, so scaling WEB_CONCURRENCY does not exhaust the database
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS") or 0)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY") or 1)
+POOL_SIZE = int(
+    os.getenv("DB_POOL_SIZE")
+    or (max(DB_MAX_CONNECTIONS // WEB_CONCURRENCY, 1) if DB_MAX_CONNECTIONS else 20)
+)
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 2))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 15))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 3600))
 
 # Create async engine
 engine_kwargs = {
@@ -32,7 +41,9 @@ engine_kwargs = {
 
 if "sqlite" in DATABASE_URL:
     engine_kwargs["connect_args"] = {"check_same_thread": False}
-else:
+
+# In-memory SQLite uses a single static connection, everything else is pooled
+if ":memory:" not in DATABASE_URL:
     engine_kwargs["pool_size"] = POOL_SIZE
     engine_kwargs["max_overflow"] = MAX_OVERFLOW
 
@@ -41,6 +52,41 @@ engine = create_async_engine(
     **engine_kwargs
 )
 
+# SQLite tuning: WAL lets reads run while a write is in progress, the rest
+# trades a little durability on power loss (not on crash) for fewer fsyncs
+SQLITE_TUNING = os.getenv("SQLITE_TUNING", "1") == "1"
+SQLITE_CACHE_MB = int(os.getenv("SQLITE_CACHE_MB", 64))
+SQLITE_MMAP_MB = int(os.getenv("SQLITE_MMAP_MB", 256))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 10000))
+
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA cache_size=-{SQLITE_CACHE_MB * 1024}",
+    f"PRAGMA mmap_size={SQLITE_MMAP_MB * 1024 * 1024}",
+    f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+def tune_sqlite(sync_engine):
+    """
+    Applies SQLITE_PRAGMAS to every new connection of a SQLite engine, a
+    no-op for other databases or with SQLITE_TUNING=0.
+    """
+    if not SQLITE_TUNING or sync_engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+tune_sqlite(engine.sync_engine)
+
 # Base model
 Base = declarative_base()
 
@@ -64,6 +110,25 @@ async def get_db():
         finally:
             await db.close()
 
+def db_session() -> AsyncSession:
+    """
+    Session for one unit of DB work, `async with db_session() as db:`. Its
+    connection goes back to the pool on exit, so code that awaits something
+    slow (the LLM) in between does not hold one.
+    """
+    return AsyncSessionLocal()
+
+async def warm_pool(connections: int):
+    """
+    Opens up to `connections` pooled connections ahead of the first requests.
+    """
+    async def ping():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    # Overflow connections are closed when returned, only the core pool stays warm
+    await asyncio.gather(*[ping() for _ in range(min(connections, POOL_SIZE))])
+
 def response(status: bool, message: str, data):
     return {
         "status": status,
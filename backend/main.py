@@ -1,23 +1,46 @@
+import time
+
+# Worker startup time is measured from here, before the heavy imports
+BOOT_STARTED = time.perf_counter()
+
 import warnings
+import asyncio
+import logging
+import signal
+import traceback
 import uvicorn
 import os
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
 import app.models
-from app.core.memori import memori
-from config.database import Base, engine
+from app.core.memori import check_memori_internals, memori_executor, memori_request_time, run_memori, warm_embeddings
+from app.core.memori import engine as memori_engine, engine_kwargs as memori_engine_kwargs
+from app.core.metrics import REQUEST_SECONDS, instrument_engine
+from app.core.db_writer import SQLITE_WRITE_QUEUE, db_writer
+from app.core.memory_writer import memory_writer
+from app.core.migrate import create_app_tables, create_memori_tables
+from app.core.pubsub import broker
+from app.core.startup import AUTO_MIGRATE, WARMUP_DB_CONNECTIONS, WARMUP_LLM_SLOTS, readiness
+from app.helper.llm_helper import gemini_pool
+from app.services.archive_service import ARCHIVE_INTERVAL, ArchiveService
+from app.services.batch_service import BatchService
+from config.database import MAX_OVERFLOW, engine, warm_pool
+from app.routes.batch import router as batch_router
 from app.routes.chat import router as chat_router
 from app.routes.health import router as health_router
 from app.routes.history import router as history_router
+from app.routes.metrics import router as metrics_router
+from app.routes.ws import router as ws_router
 
 warnings.filterwarnings("ignore")
 
 load_dotenv(verbose=True)
-from app.utils.loader import check_env_vars
+from app.utils.loader import check_env_vars, reload_prompts
 check_env_vars()
+check_memori_internals()
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -25,15 +48,95 @@ app = FastAPI(
     description="Backend API for Disha, a WhatsApp-like AI health coach",
     version="1.0.0",
 )
+readiness.record("import", time.perf_counter() - BOOT_STARTED)
+
+@app.on_event("startup")
+async def apply_migrations():
+    # Production workers skip this, serve.py migrates once before starting them
+    if not AUTO_MIGRATE:
+        return
+    start = time.perf_counter()
+    await run_memori(create_memori_tables)
+    await create_app_tables()
+    readiness.record("migrate", time.perf_counter() - start)
+
+@app.on_event("startup")
+async def start_memory_writer():
+    memory_writer.start(gemini_pool)
+
+@app.on_event("startup")
+async def start_db_writer():
+    if SQLITE_WRITE_QUEUE:
+        db_writer.start()
+
+@app.on_event("startup")
+async def start_push_broker():
+    await broker.start()
+
+@app.on_event("startup")
+async def start_archiver():
+    # With several workers prefer the CLI from cron, each worker would run its own pass
+    if ARCHIVE_INTERVAL > 0:
+        app.state.archiver = asyncio.create_task(ArchiveService.run_periodically(ARCHIVE_INTERVAL))
+
+@app.on_event("shutdown")
+async def stop_memori_executor():
+    # Draining, the readiness probe takes this worker out of rotation
+    readiness.ready = False
+    if getattr(app.state, "archiver", None):
+        app.state.archiver.cancel()
+    await broker.close()
+    # Stopped jobs resume when posted again
+    await BatchService.cancel()
+    await db_writer.close()
+    # Queued turns are written before the executor they run on goes away
+    await memory_writer.close()
+    memori_executor.shutdown(wait=True)
+
+instrument_engine(engine.sync_engine, "app", MAX_OVERFLOW)
+instrument_engine(memori_engine, "memori", memori_engine_kwargs["max_overflow"])
+
+@app.middleware("http")
+async def request_timing(request: Request, call_next):
+    # Memori time is accumulated by run_memori, reported as a Server-Timing entry
+    start = time.perf_counter()
+    request_time = [0.0]
+    memori_request_time.set(request_time)
+    response = await call_next(request)
+    response.headers["Server-Timing"] = f"memori;dur={request_time[0] * 1000:.1f}"
+
+    # Route templates keep the label set bounded, unmatched paths are grouped
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - start,
+        request.method, route.path if route else "unmatched", str(response.status_code)
+    )
+    return response
 
 @app.on_event("startup")
-async def init_memori_tables():
-    memori.config.storage.build()
+async def register_prompt_reload():
+    # `kill -HUP <pid>` drops the cached prompts without a restart
+    if hasattr(signal, "SIGHUP"):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_prompts)
 
 @app.on_event("startup")
-async def create_tables():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+async def warm_up():
+    # Registered last: /health/ready reports ready once the pools are open and
+    # Memori's embedding model is loaded, so the first chats pay for neither
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(
+            warm_pool(WARMUP_DB_CONNECTIONS),
+            gemini_pool.warm(WARMUP_LLM_SLOTS),
+            run_memori(warm_embeddings),
+        )
+    except Exception:
+        # Serve anyway, requests open what they need, but stay out of rotation
+        logging.error(traceback.format_exc())
+        logging.error("Warm-up failed, /health/ready keeps answering 503")
+        return
+    readiness.record("warm", time.perf_counter() - start)
+    readiness.mark_ready(BOOT_STARTED)
 
 # Add CORS middleware
 app.add_middleware(
@@ -47,9 +150,12 @@ app.add_middleware(
 # Router registration
 app.include_router(health_router)
 app.include_router(chat_router)
+app.include_router(batch_router)
 app.include_router(history_router)
+app.include_router(metrics_router)
+app.include_router(ws_router)
 
-# Run the app
+# Development server with reload, production runs `python serve.py`
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 7000))
     uvicorn.run(
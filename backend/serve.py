@@ -0,0 +1,51 @@
+"""
+Production entry point: applies migrations once, then starts WEB_CONCURRENCY
+uvicorn worker processes sharing the port. Workers skip the schema step and
+report ready on /health/ready once their pools are warm.
+
+    python serve.py                # migrate, then serve
+    python serve.py --no-migrate   # when `python -m app.core.migrate` runs as its own deploy step
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv(verbose=True)
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+PORT = int(os.getenv("PORT", 7000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API with multiple workers")
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--no-migrate", action="store_true", help="Skip the one-time schema step")
+    args = parser.parse_args()
+
+    if not args.no_migrate:
+        # In its own process, so the supervisor does not keep Memori and torch loaded
+        subprocess.run([sys.executable, "-m", "app.core.migrate"], check=True)
+
+    # Inherited by the worker processes
+    os.environ["AUTO_MIGRATE"] = "0"
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level="info",
+        # Workers finish in-flight chats and flush Memori writes before exiting
+        timeout_graceful_shutdown=30,
+    )
+
+
+if __name__ == "__main__":
+    main()
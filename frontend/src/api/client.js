@@ -11,3 +11,93 @@ const client = axios.create({
 });
 
 export default client;
+
+// Streams a reply from /chat/message/stream (Server-Sent Events).
+// `onToken` is called with each text chunk as it arrives; resolves with the stored message.
+// `idempotencyKey` identifies the composed message: every attempt at sending it passes the
+// same key, so the server answers it once however many of them get through.
+export async function streamMessage(payload, onToken, idempotencyKey) {
+    const baseURL = (import.meta.env.VITE_API_URL || '').replace(/\/$/, '');
+    const res = await fetch(`${baseURL}/chat/message/stream`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Idempotency-Key': idempotencyKey },
+        body: JSON.stringify(payload)
+    });
+
+    if (!res.ok || !res.body) {
+        throw new Error(`Stream failed with status ${res.status}`);
+    }
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let message = null;
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // SSE events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            for (const line of rawEvent.split('\n')) {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+
+            const parsed = JSON.parse(data);
+            if (event === 'token') {
+                onToken(parsed.text);
+            } else if (event === 'done') {
+                message = parsed;
+            } else if (event === 'error') {
+                throw new Error(parsed.detail);
+            }
+        }
+    }
+
+    return message;
+}
+
+// Subscribes to the messages stored for `userId` over /chat/ws, in place of polling the history.
+// `onMessage` gets each pushed message; `onResync` is called when the history should be reloaded.
+// Reconnects after a drop, asking for what was missed since `getAfterId()`. Returns a close function.
+export function connectMessages(userId, getAfterId, onMessage, onResync) {
+    const base = new URL(import.meta.env.VITE_API_URL || '/', window.location.href);
+    base.protocol = base.protocol === 'https:' ? 'wss:' : 'ws:';
+    base.pathname = base.pathname.replace(/\/$/, '') + '/chat/ws';
+
+    let socket = null;
+    let retry = null;
+    let closed = false;
+
+    const open = () => {
+        const url = new URL(base);
+        url.searchParams.set('user_id', userId);
+        const afterId = getAfterId();
+        if (afterId) url.searchParams.set('after_id', afterId);
+
+        socket = new WebSocket(url);
+        socket.onmessage = (e) => {
+            const parsed = JSON.parse(e.data);
+            if (parsed.event === 'message') onMessage(parsed.data);
+            else if (parsed.event === 'resync') onResync();
+        };
+        socket.onclose = () => {
+            if (!closed) retry = setTimeout(open, 2000);
+        };
+    };
+    open();
+
+    return () => {
+        closed = true;
+        clearTimeout(retry);
+        socket?.close();
+    };
+}
@@ -1,18 +1,46 @@
 import React, { useState, useEffect, useRef } from 'react';
-import client from '../api/client';
+import client, { connectMessages, streamMessage } from '../api/client';
 import { Send, ArrowUp, MoreVertical, Phone, Video, Smile, Plus, Mic } from 'lucide-react';
 import MessageBubble from './MessageBubble';
 import TypingIndicator from './TypingIndicator';
 
+// Automatic resends of a message whose stream failed, with the same Idempotency-Key
+const SEND_RETRIES = 2;
+
+// Optimistic bubbles carry Date.now() or string ids, only stored ids count
+const isStoredId = (id) => Number.isInteger(id) && id < 1e12;
+
+// Adds pushed messages not shown yet, in id order. A pushed user row with the text of an
+// optimistic user bubble is that bubble's stored copy and takes its place.
+function mergePushed(prev, pushed) {
+    let next = prev;
+    for (const msg of [...pushed].sort((a, b) => a.id - b.id)) {
+        if (next.some(m => m.id === msg.id)) continue;
+        const bubble = msg.sender?.toLowerCase() === 'user' && next.find(m => (
+            !isStoredId(m.id) && m.sender === 'User' && m.content === msg.content
+        ));
+        next = bubble ? next.map(m => (m === bubble ? msg : m)) : [...next, msg];
+    }
+    return next;
+}
+
 export default function ChatWindow() {
     const [messages, setMessages] = useState([]);
     const [input, setInput] = useState('');
     const [isTyping, setIsTyping] = useState(false);
     const [userId, setUserId] = useState(localStorage.getItem('disha_user_id'));
     const [isLoadingHistory, setIsLoadingHistory] = useState(false);
+    const [nextCursor, setNextCursor] = useState(null);
 
     const scrollRef = useRef(null);
     const messagesEndRef = useRef(null);
+    // Newest stored id shown, and whether this tab is mid-send (its own turn arrives via the stream)
+    const lastIdRef = useRef(null);
+    const sendingRef = useRef(false);
+    // Messages pushed mid-send, merged once the send settles so the bubbles reconcile
+    const heldRef = useRef([]);
+    // { content, key } of the message being sent, kept if it fails so sending it again reuses the key
+    const pendingSendRef = useRef(null);
 
     // Initialize Chat
     useEffect(() => {
@@ -40,6 +68,29 @@ export default function ChatWindow() {
         initChat();
     }, []);
 
+    useEffect(() => {
+        lastIdRef.current = messages.reduce(
+            (max, m) => (isStoredId(m.id) && m.id > max ? m.id : max), 0
+        ) || null;
+    }, [messages]);
+
+    // Messages stored from another tab or device are pushed instead of polled
+    useEffect(() => {
+        if (!userId) return;
+        return connectMessages(
+            userId,
+            () => lastIdRef.current,
+            (pushed) => {
+                if (sendingRef.current) {
+                    heldRef.current.push(pushed);
+                    return;
+                }
+                setMessages(prev => mergePushed(prev, [pushed]));
+            },
+            () => loadHistory()
+        );
+    }, [userId]);
+
     // Auto-scroll to bottom on new message if near bottom or first load
     useEffect(() => {
         scrollToBottom();
@@ -49,18 +100,19 @@ export default function ChatWindow() {
         messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
     };
 
-    const loadHistory = async (beforeId = null) => {
+    const loadHistory = async (cursor = null) => {
         if (!userId) return;
         setIsLoadingHistory(true);
         try {
             const params = { user_id: userId, limit: 20 };
-            if (beforeId) params.before_id = beforeId;
+            if (cursor) params.cursor = cursor;
 
             const res = await client.get('/chat/history', { params });
             const newMessages = res.data.data.messages;
+            setNextCursor(res.data.data.next_cursor);
 
             if (newMessages.length > 0) {
-                if (beforeId) {
+                if (cursor) {
                     // Prepend
                     setMessages(prev => [...newMessages, ...prev]);
                 } else {
@@ -76,23 +128,27 @@ export default function ChatWindow() {
     };
 
     const handleScroll = (e) => {
-        if (e.target.scrollTop === 0 && messages.length > 0 && !isLoadingHistory) {
-            const oldestId = messages[0].id;
-            // Prevent fetching if oldestId is temporary (timestamp based)
-            if (typeof oldestId === 'number') {
-                loadHistory(oldestId);
-            }
+        if (e.target.scrollTop === 0 && nextCursor && !isLoadingHistory) {
+            loadHistory(nextCursor);
         }
     };
 
     const sendMessage = async (e) => {
         if (e && e.preventDefault) e.preventDefault();
-        if (!input.trim() || !userId) return;
+        // Enter can fire again before the button renders disabled
+        if (!input.trim() || !userId || sendingRef.current) return;
+        sendingRef.current = true;
+
+        // One key per composed message: sending the text of a failed send again reuses it
+        const content = input;
+        const pending = pendingSendRef.current;
+        const idempotencyKey = pending?.content === content ? pending.key : crypto.randomUUID();
+        pendingSendRef.current = { content, key: idempotencyKey };
 
         const userMsg = {
             id: Date.now(), // Temp ID
             sender: 'User',
-            content: input,
+            content,
             created_at: new Date().toISOString()
         };
 
@@ -100,24 +156,64 @@ export default function ChatWindow() {
         setInput('');
         setIsTyping(true);
 
+        // Placeholder bubble that fills in as tokens stream in
+        const streamId = `stream-${Date.now()}`;
+        let started = false;
+        // A resend gets the reply from the start, its first token replaces the partial text
+        let restarted = false;
+
+        const onToken = (token) => {
+            if (!started) {
+                started = true;
+                setIsTyping(false);
+                setMessages(prev => [...prev, {
+                    id: streamId,
+                    sender: 'Disha',
+                    content: token,
+                    created_at: new Date().toISOString()
+                }]);
+                return;
+            }
+            const replace = restarted;
+            restarted = false;
+            setMessages(prev => prev.map(m => (
+                m.id === streamId ? { ...m, content: replace ? token : m.content + token } : m
+            )));
+        };
+
         try {
-            const res = await client.post('/chat/message', {
-                user_id: userId,
-                message: userMsg.content
-            });
-
-            const aiMsg = {
-                id: res.data.data.id,
-                sender: 'Disha',
-                content: res.data.data.content,
-                created_at: res.data.data.created_at || new Date().toISOString()
-            };
-
-            setMessages(prev => [...prev, aiMsg]);
+            let finalMsg = null;
+            for (let attempt = 0; ; attempt++) {
+                try {
+                    finalMsg = await streamMessage({ user_id: userId, message: content }, onToken, idempotencyKey);
+                    break;
+                } catch (err) {
+                    if (attempt >= SEND_RETRIES) throw err;
+                    console.warn("Send failed, retrying", err);
+                    restarted = started;
+                    await new Promise(resolve => setTimeout(resolve, 1000 * (attempt + 1)));
+                }
+            }
+            pendingSendRef.current = null;
+
+            if (finalMsg) {
+                // Swap the placeholder for the stored message so it gets a real id
+                setMessages(prev => prev.map(m => (
+                    m.id === streamId ? { ...finalMsg, sender: 'Disha' } : m
+                )));
+            }
         } catch (err) {
             console.error("Send failed", err);
-            // Ideally show error state
+            // Back into the input box, sending it again reuses the key
+            setMessages(prev => prev.filter(m => m.id !== userMsg.id && m.id !== streamId));
+            setInput(content);
         } finally {
+            // Rows from other tabs or devices, and this send's own rows a dropped stream never
+            // delivered; the ones already swapped in are skipped by id
+            const held = heldRef.current;
+            heldRef.current = [];
+            if (held.length) setMessages(prev => mergePushed(prev, held));
+            sendingRef.current = false;
             setIsTyping(false);
         }
     };
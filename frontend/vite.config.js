@@ -6,6 +6,10 @@ export default defineConfig({
   plugins: [react()],
   server: {
     proxy: {
+      '/chat/ws': {
+        target: 'ws://192.168.1.4:7000',
+        ws: true,
+      },
       '/chat': {
         target: 'http://192.168.1.4:7000',
         changeOrigin: true,